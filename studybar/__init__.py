@@ -5,6 +5,9 @@ __all__ = [
     "db",
     "document_embedding",
     "flashcard_maker",
+    "llm",
+    "metrics",
     "student_profile",
+    "tokens",
     "tutor_gpt",
 ]
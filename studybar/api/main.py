@@ -1,9 +1,14 @@
 # This is the main entry point
 
-from fastapi import FastAPI
+import time
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from studybar.api.routes import flashcards, tutor
 from studybar.api.routes import users, errors
+from studybar.api.routes import metrics as metrics_routes
+from studybar import db, llm, metrics
+from studybar.profile_cache import PROFILE_CACHE
+from studybar.flashcard_maker.jobs import JOB_QUEUE
 
 app = FastAPI(title="StudyBar API", version="1.0")
 
@@ -18,11 +23,56 @@ app.add_middleware(
     max_age=3600,  # Cache preflight requests for 1 hour
 )
 
+# Request latency per route template (not the raw path, to keep label cardinality bounded)
+@app.middleware("http")
+async def time_requests(request: Request, call_next):
+    if not metrics.ENABLED:
+        return await call_next(request)
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        metrics.HTTP_SECONDS.observe(
+            time.perf_counter() - start,
+            method=request.method,
+            route=_route_template(request),
+            status=status,
+        )
+
+def _route_template(request: Request):
+    """/api/flashcards/{pdf_hash} rather than the concrete path."""
+    if request.scope.get("route") is None:
+        return "unmatched"
+    params = {str(v): k for k, v in request.path_params.items()}
+    segments = request.url.path.split("/")
+    return "/".join("{%s}" % params[seg] if seg in params else seg for seg in segments)
+
+# Run pending db migrations once, before serving requests
+@app.on_event("startup")
+def migrate_db():
+    db.init_db()
+
+# Pick up flashcard jobs left unfinished by a previous run
+@app.on_event("startup")
+def resume_flashcard_jobs():
+    JOB_QUEUE.resume()
+
+# Write out buffered profile updates and close pooled connections before the worker exits
+@app.on_event("shutdown")
+def flush_profiles():
+    PROFILE_CACHE.close()
+    JOB_QUEUE.shutdown()
+    llm.close()
+
 # Mount routers
 app.include_router(flashcards.router, prefix="/api/flashcards", tags=["Flashcards"])
 app.include_router(tutor.router, prefix="/api/tutor", tags=["TutorGPT"])
 app.include_router(users.router, prefix="/api/users", tags=["Users"])
 app.include_router(errors.router, prefix="/api/errors", tags=["Errors"])
+app.include_router(metrics_routes.router, prefix="/metrics", tags=["Metrics"])
 
 @app.get("/")
 def root():
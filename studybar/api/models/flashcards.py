@@ -0,0 +1,6 @@
+from pydantic import BaseModel, Field
+
+
+class ReviewGrade(BaseModel):
+    """SM-2 recall grade: 0 (blackout) to 5 (perfect); below 3 the card is relearned."""
+    grade: int = Field(..., ge=0, le=5)
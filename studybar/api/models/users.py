@@ -0,0 +1,7 @@
+from typing import Dict
+from pydantic import BaseModel
+
+
+class ProgressBatch(BaseModel):
+    """All chapter progress updates from one study session: {chapter_key: progress}."""
+    updates: Dict[str, float]
@@ -1,29 +1,93 @@
-from fastapi import APIRouter, UploadFile, File
-from studybar.flashcard_maker.flashcard_maker import extract_text_chunks, make_flashcards, save_cache, load_cache, file_hash
-import os, tempfile, json
+import time
+from fastapi import APIRouter, UploadFile, File, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from studybar.api.models.flashcards import ReviewGrade
+from studybar.flashcard_maker.flashcard_maker import load_cache
+from studybar.flashcard_maker.pdf_store import store_upload
+from studybar.flashcard_maker.jobs import FINISHED_STATUSES, JOB_QUEUE
+from studybar.flashcard_maker.deck_store import DECK_STORE
+from studybar.flashcard_maker.review_queue import DAY, REVIEW_QUEUE, with_cards
 
 router = APIRouter()
 
 @router.post("/generate")
 async def generate_flashcards(file: UploadFile = File(...)):
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-        tmp.write(await file.read())
-        tmp_path = tmp.name
+    # stream to the content-addressed store, hashing as we go
+    pdf_hash, pdf_path = await store_upload(file)
 
-    cached = load_cache(tmp_path)
+    cached = await run_in_threadpool(load_cache, pdf_path, pdf_hash=pdf_hash)
     if cached:
-        return {"status": "cached", "data": cached}
+        return {"status": "cached", "pdf_hash": pdf_hash, "data": cached}
 
-    chunks = extract_text_chunks(tmp_path)
-    data = make_flashcards(chunks, pdf_path=tmp_path)
-    save_cache(tmp_path, data)
+    # parsing and the llm calls run in the background; poll /jobs/{job_id}
+    job = await run_in_threadpool(JOB_QUEUE.submit, pdf_hash)
+    return {"status": job["status"], "pdf_hash": pdf_hash, "job_id": job["id"]}
 
-    return {"status": "ok", "flashcards": data}
+# declared before /{pdf_hash} so "jobs" is never taken for a hash
+@router.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    job = JOB_QUEUE.get(job_id)
+    if job is None:
+        return {"status": "not_found", "finished": True}
+    return {
+        "status": job["status"],
+        "finished": job["status"] in FINISHED_STATUSES,
+        "job_id": job["id"],
+        "pdf_hash": job["pdf_hash"],
+        "progress": {"done": job["done"], "total": job["total"]},
+        # partial while running or if some batches failed, complete once done
+        "flashcards": job["result"],
+        "error": job["error"],
+    }
+
+# ---------- spaced-repetition reviews ----------
+@router.post("/reviews/{student_id}/decks/{pdf_hash}")
+def enroll_deck(student_id: str, pdf_hash: str):
+    """Start reviewing a generated deck; its new cards are due immediately."""
+    deck = DECK_STORE.get(pdf_hash)
+    if deck is None:
+        return {"status": "not_found"}
+    return {"status": "ok", "added": REVIEW_QUEUE.enroll(student_id, pdf_hash, deck), "cards": len(deck)}
+
+@router.get("/reviews/{student_id}/next")
+def next_review(student_id: str, deck: str = Query(None, description="pdf hash (default: all decks)")):
+    card = REVIEW_QUEUE.next_card(student_id, deck)
+    if card is None:
+        return {"status": "empty"}
+    if not card["is_due"]:
+        return {"status": "none_due", "next_due": card["due"]}
+    cards = with_cards([card])
+    return {"status": "ok", "card": cards[0] if cards else card}
+
+@router.get("/reviews/{student_id}/due")
+def due_reviews(
+    student_id: str,
+    hours: float = Query(24, gt=0, le=24 * 30, description="include cards due within this many hours"),
+    limit: int = Query(200, ge=1, le=5000),
+    deck: str = Query(None, description="pdf hash (default: all decks)"),
+):
+    """A day's review batch in one indexed query, earliest due first."""
+    rows = REVIEW_QUEUE.due_batch(student_id, time.time() + hours * DAY / 24, limit, deck)
+    return {"status": "ok", "cards": with_cards(rows)}
+
+@router.post("/reviews/{student_id}/decks/{pdf_hash}/cards/{card_id}")
+def record_review(student_id: str, pdf_hash: str, card_id: str, review: ReviewGrade):
+    state = REVIEW_QUEUE.record_review(student_id, pdf_hash, card_id, review.grade)
+    if state is None:
+        return {"status": "not_found"}
+    return {"status": "ok", "card": state}
 
 @router.get("/{pdf_hash}")
-def get_cached_flashcards(pdf_hash: str):
-    cache_file = f"/workspaces/studybar/studybar/flashcard_maker/cache/pdfs/{pdf_hash}.json"
-    if not os.path.exists(cache_file):
+def get_cached_flashcards(pdf_hash: str, request: Request):
+    """A generated deck. Hot decks come from memory; supports If-None-Match."""
+    body, tag = DECK_STORE.get_serialized(pdf_hash)
+    if body is None:
         return {"status": "not_found"}
-    with open(cache_file, "r", encoding="utf-8") as f:
-        return {"status": "ok", "flashcards": json.load(f)}
+    if request.headers.get("if-none-match") == tag:
+        return Response(status_code=304, headers={"ETag": tag})
+    # body is already serialized; splice it in rather than re-encoding the deck
+    return Response(
+        content=b'{"status":"ok","flashcards":' + body + b"}",
+        media_type="application/json",
+        headers={"ETag": tag, "Cache-Control": "no-cache"},
+    )
@@ -0,0 +1,11 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from studybar import metrics
+
+router = APIRouter()
+
+@router.get("", response_class=PlainTextResponse)
+def scrape():
+    """Prometheus text exposition of studybar's counters, gauges and histograms."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
@@ -1,5 +1,10 @@
-from fastapi import APIRouter, Form
+from typing import Optional
+from fastapi import APIRouter, Form, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
 from studybar.tutor_gpt.tutor_gpt import TutorGPT
+from studybar.tutor_gpt.speculation import speculation_stats
+from studybar.tutor_gpt.semantic_cache import ANSWER_CACHE
+from studybar.tutor_gpt import history
 import os, json
 
 router = APIRouter()
@@ -21,10 +26,60 @@ def chat_with_tutor(
     reply = tutor.handle_prompt(message)
     return {"reply": reply}
 
+@router.post("/chat/stream")
+def stream_chat_with_tutor(
+    student_id: str = Form(...),
+    conversation_id: str = Form(...),
+    message: str = Form(...)
+):
+    """Same as /chat, but sends status updates and reply tokens as server-sent events."""
+    tutor = get_tutor(student_id, conversation_id)
+
+    def event_stream():
+        try:
+            for event in tutor.handle_prompt_stream(message):
+                yield f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+        except Exception as e:
+            import traceback; traceback.print_exc()
+            error = {"type": "error", "message": str(e)}
+            yield f"event: error\ndata: {json.dumps(error)}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        # stop proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.get("/speculation/stats")
+def get_speculation_stats():
+    """How often speculative retrieval / chat completions were used vs wasted."""
+    return {"status": "ok", "stats": speculation_stats()}
+
+@router.get("/cache/stats")
+def get_answer_cache_stats():
+    """Semantic rag answer cache hit rate and sampled drift."""
+    return {"status": "ok", "stats": ANSWER_CACHE.stats()}
+
 @router.get("/{student_id}/{conversation_id}/history")
-def get_conversation(student_id: str, conversation_id: str):
+def get_conversation(
+    student_id: str,
+    conversation_id: str,
+    request: Request,
+    before: Optional[int] = Query(None, ge=0, description="cursor from a previous page's next_cursor"),
+    limit: int = Query(50, ge=1, le=500),
+):
+    """Newest `limit` messages before the cursor. Supports If-None-Match."""
     convo_path = f"/workspaces/studybar/studybar/data/students/{student_id}/{conversation_id}_conversation.jsonl"
     if not os.path.exists(convo_path):
         return {"status": "empty"}
-    with open(convo_path, "r", encoding="utf-8") as f:
-        return {"status": "ok", "messages": [json.loads(line) for line in f]}
+
+    tag = history.etag(convo_path, before, limit)
+    if request.headers.get("if-none-match") == tag:
+        return Response(status_code=304, headers={"ETag": tag})
+
+    messages, next_cursor = history.read_page(convo_path, before=before, limit=limit)
+    return JSONResponse(
+        {"status": "ok", "messages": messages, "next_cursor": next_cursor},
+        headers={"ETag": tag, "Cache-Control": "no-cache"},
+    )
@@ -1,9 +1,44 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Query
 from studybar import db
+from studybar.api.models.users import ProgressBatch
 
 router = APIRouter()
 
 
+def _parse_ids(ids):
+    return [s.strip() for s in ids.split(",") if s.strip()] if ids else None
+
+# static paths first, so they aren't captured by /{student_id}
+@router.get("/chapters")
+def list_chapters():
+    return {"status": "ok", "chapters": db.list_chapters()}
+
+@router.get("/progress/cohort")
+def get_cohort_progress(ids: str = Query(..., description="comma-separated student ids")):
+    """Chapter progress for many students in one query, for class dashboards."""
+    return {"status": "ok", "progress": db.get_progress_for_users(_parse_ids(ids) or [])}
+
+@router.get("/cohort/below")
+def get_students_below(topic: str, threshold: float = 0.4):
+    """Students below a proficiency threshold on a topic, weakest first."""
+    return {"status": "ok", "students": db.students_below(topic, threshold)}
+
+@router.get("/cohort/histogram")
+def get_proficiency_histogram(
+    topic: str,
+    bins: int = Query(10, ge=1, le=100),
+    ids: str = Query(None, description="comma-separated student ids (default: everyone)"),
+):
+    return {"status": "ok", "topic": topic, "bins": db.proficiency_histogram(topic, bins, _parse_ids(ids))}
+
+@router.get("/cohort/weakest-topics")
+def get_weakest_topics(
+    ids: str = Query(None, description="comma-separated student ids (default: everyone)"),
+    limit: int = Query(5, ge=1, le=100),
+):
+    return {"status": "ok", "topics": db.weakest_topics(_parse_ids(ids), limit)}
+
+
 @router.get("/{student_id}")
 def get_user(student_id: str):
     user = db.get_user(student_id)
@@ -13,16 +48,11 @@ def get_user(student_id: str):
 
 @router.get("/{student_id}/progress")
 def get_progress(student_id: str):
-    chapters = db.list_chapters()
-    progress = db.get_progress_for_user(student_id)
-    # Merge chapter titles with progress rows
-    prog_map = {p["key"]: p["progress"] for p in progress}
-    result = []
-    for c in chapters:
-        result.append({"key": c["key"], "title": c["title"], "progress": prog_map.get(c["key"], 0)})
-    return {"status": "ok", "chapters": result}
-
+    # one indexed query: every chapter with this student's progress (0 if none)
+    return {"status": "ok", "chapters": db.get_progress_for_user(student_id)}
 
-@router.get("/chapters")
-def list_chapters():
-    return {"status": "ok", "chapters": db.list_chapters()}
+@router.post("/{student_id}/progress")
+def set_progress(student_id: str, batch: ProgressBatch):
+    """Write a whole session's chapter updates in one transaction."""
+    db.set_progress_many(student_id, batch.updates)
+    return {"status": "ok", "updated": len(batch.updates)}
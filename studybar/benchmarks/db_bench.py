@@ -0,0 +1,103 @@
+# db.py ops/sec: connect-per-call (the previous implementation) vs pooled connections
+#
+#   python -m studybar.benchmarks.db_bench [--n 2000]
+
+import os, json, sqlite3, tempfile, time, argparse
+
+from studybar import db
+
+
+# ---------- previous implementation, for the "before" numbers ----------
+class LegacyDB:
+    """Every call: makedirs, connect, CREATE TABLE x3 + commit, connect again, query, close."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def _conn(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        conn = sqlite3.connect(self.path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _init(self):
+        conn = self._conn()
+        cur = conn.cursor()
+        cur.execute("CREATE TABLE IF NOT EXISTS users (id TEXT PRIMARY KEY, data JSON)")
+        cur.execute("CREATE TABLE IF NOT EXISTS chapters (key TEXT PRIMARY KEY, title TEXT)")
+        cur.execute(
+            "CREATE TABLE IF NOT EXISTS progress (user_id TEXT, chapter_key TEXT, progress REAL, "
+            "PRIMARY KEY (user_id, chapter_key))"
+        )
+        conn.commit()
+        conn.close()
+
+    def get_user(self, student_id):
+        self._init()
+        conn = self._conn()
+        row = conn.execute("SELECT data FROM users WHERE id = ?", (student_id,)).fetchone()
+        conn.close()
+        return json.loads(row["data"]) if row else None
+
+    def upsert_user(self, student_id, data):
+        self._init()
+        conn = self._conn()
+        conn.execute("INSERT OR REPLACE INTO users (id, data) VALUES (?, ?)", (student_id, json.dumps(data)))
+        conn.commit()
+        conn.close()
+
+    def set_progress(self, student_id, chapter_key, progress):
+        self._init()
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO progress (user_id, chapter_key, progress) VALUES (?, ?, ?)",
+            (student_id, chapter_key, float(progress)),
+        )
+        conn.commit()
+        conn.close()
+
+
+def _ops_per_sec(fn, n):
+    start = time.perf_counter()
+    for i in range(n):
+        fn(i)
+    return n / (time.perf_counter() - start)
+
+
+def _suite(impl, n, n_users=100):
+    profile = {"proficiencies": {"atomic_structure": 0.4, "energetics": 0.7}, "last_activity": None}
+    for i in range(n_users):
+        impl.upsert_user(f"s{i}", profile)
+    return {
+        "get_user": _ops_per_sec(lambda i: impl.get_user(f"s{i % n_users}"), n),
+        "upsert_user": _ops_per_sec(lambda i: impl.upsert_user(f"s{i % n_users}", profile), n),
+        "set_progress": _ops_per_sec(lambda i: impl.set_progress(f"s{i % n_users}", "energetics", i % 100), n),
+    }
+
+
+def run(n=2000):
+    """Return {"before": {op: ops/sec}, "after": {...}, "speedup": {...}} on fresh temp databases."""
+    tmp = tempfile.mkdtemp(prefix="studybar-dbbench-")
+    before = _suite(LegacyDB(os.path.join(tmp, "legacy.sqlite")), n)
+
+    old_path = db.DB_PATH
+    db.DB_PATH = os.path.join(tmp, "pooled.sqlite")
+    try:
+        after = _suite(db, n)
+    finally:
+        db.close_conn()
+        db.DB_PATH = old_path
+
+    return {
+        "n": n,
+        "before": before,
+        "after": after,
+        "speedup": {op: after[op] / before[op] for op in before},
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=2000)
+    args = parser.parse_args()
+    print(json.dumps(run(args.n), indent=2))
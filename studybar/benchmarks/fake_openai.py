@@ -0,0 +1,219 @@
+# offline stand-in for the OpenAI API, for benchmarks
+#
+# FakeOpenAI mimics the parts of the SDK client this repo uses
+# (chat.completions.create, with and without stream=True, and
+# embeddings.create) with configurable latency, jitter and error injection.
+# Replies are shaped by the prompt so each caller gets something it can parse
+# (intent labels, marking JSON, problem/definition arrays). `installed()` swaps
+# it in as the shared client from studybar.llm; `serve()` exposes the same fake over
+# HTTP so a separately started api can be pointed at it with OPENAI_BASE_URL.
+#
+#   python -m studybar.benchmarks.fake_openai --port 8089 --latency 0.3 --error-rate 0.02
+
+import argparse, contextlib, json, random, re, threading, time, zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import numpy as np
+
+from studybar import llm
+
+DEFAULT_EMBEDDING_DIM = 256
+
+
+class FakeAPIError(Exception):
+    def __init__(self, status_code, message):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class _Namespace:
+    def __init__(self, **fns):
+        for name, fn in fns.items():
+            setattr(self, name, fn)
+
+
+class FakeOpenAI:
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, token_delay=0.0,
+                 embedding_dim=DEFAULT_EMBEDDING_DIM, reply_words=60, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.token_delay = token_delay
+        self.embedding_dim = embedding_dim
+        self.reply_words = reply_words
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = {"chat": 0, "stream": 0, "embeddings": 0, "errors": 0}
+        self.chat = SimpleNamespace(completions=_Namespace(create=self._chat_create))
+        self.embeddings = _Namespace(create=self._embeddings_create)
+
+    # ---------- behaviour ----------
+    def _wait_and_maybe_fail(self, kind):
+        with self._lock:
+            self.calls[kind] += 1
+            delay = max(0.0, self.latency + self._rng.uniform(-self.jitter, self.jitter))
+            fail = self._rng.random() < self.error_rate
+            if fail:
+                self.calls["errors"] += 1
+            status = self._rng.choice([429, 500, 503])
+        if delay:
+            time.sleep(delay)
+        if fail:
+            raise FakeAPIError(status, f"injected error ({status})")
+
+    def _reply(self, messages):
+        prompt = "\n".join(str(m.get("content", "")) for m in messages)
+        if "Classify this student message" in prompt:
+            return "general_chat"
+        if "Rate correctness" in prompt:
+            score = round(self._rng.random(), 2)
+            return json.dumps({
+                "score": score,
+                "feedback": "Partly correct; revisit the key definition.",
+                "guiding_questions": ["What does the term describe?"] if score < 0.7 else None,
+            })
+        m = re.search(r"create (\d+) problems", prompt)
+        if m:
+            return json.dumps([
+                {"id": f"q{i}", "question": f"Synthetic question {i}?", "answer": "42", "concepts": ["synthetic"]}
+                for i in range(int(m.group(1)))
+            ])
+        if "extract only *definitions*" in prompt:
+            return json.dumps([
+                {"term": f"term {cid}", "definition": "A synthetic definition.", "page": int(page), "source_id": cid}
+                for cid, page in re.findall(r"\[([^\]|]+) \| page (\d+)\]", prompt)
+            ])
+        words = "the student should consider how the concept relates to energy and structure".split()
+        return " ".join(words[i % len(words)] for i in range(self.reply_words))
+
+    def embed(self, text):
+        # deterministic per text, unit length
+        rng = np.random.default_rng(zlib.crc32(str(text).encode("utf-8")))
+        v = rng.standard_normal(self.embedding_dim).astype(np.float32)
+        return v / np.linalg.norm(v)
+
+    # ---------- sdk surface ----------
+    def _chat_create(self, model=None, messages=(), stream=False, **kwargs):
+        self._wait_and_maybe_fail("stream" if stream else "chat")
+        content = self._reply(messages)
+        if stream:
+            return self._stream(content, model)
+        return SimpleNamespace(
+            id="fake-" + str(zlib.crc32(content.encode("utf-8"))),
+            model=model,
+            choices=[SimpleNamespace(index=0, finish_reason="stop",
+                                     message=SimpleNamespace(role="assistant", content=content))],
+            usage=SimpleNamespace(prompt_tokens=sum(len(str(m.get("content", "")).split()) for m in messages),
+                                  completion_tokens=len(content.split())),
+        )
+
+    def _stream(self, content, model=None):
+        stream_id = "fake-" + str(zlib.crc32(content.encode("utf-8")))
+        for piece in re.findall(r"\S+\s*", content):
+            if self.token_delay:
+                time.sleep(self.token_delay)
+            yield SimpleNamespace(id=stream_id, model=model,
+                                  choices=[SimpleNamespace(index=0, delta=SimpleNamespace(content=piece))])
+
+    def _embeddings_create(self, model=None, input=(), **kwargs):
+        self._wait_and_maybe_fail("embeddings")
+        texts = [input] if isinstance(input, str) else list(input)
+        return SimpleNamespace(
+            model=model,
+            data=[SimpleNamespace(index=i, embedding=self.embed(t).tolist()) for i, t in enumerate(texts)],
+        )
+
+
+@contextlib.contextmanager
+def installed(fake):
+    """Make `fake` the shared client every module gets from llm.get_client(); restores it on exit."""
+    previous = llm.set_client(fake)
+    try:
+        yield fake
+    finally:
+        llm.set_client(previous)
+
+
+# ---------- http server ----------
+def _handler(fake):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _json(self, status, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            req = json.loads(self.rfile.read(length) or b"{}")
+            try:
+                if self.path.endswith("/chat/completions"):
+                    if req.get("stream"):
+                        return self._chat_stream(req)
+                    resp = fake.chat.completions.create(model=req.get("model"), messages=req.get("messages", []))
+                    return self._json(200, {
+                        "id": resp.id, "object": "chat.completion", "created": int(time.time()), "model": resp.model,
+                        "choices": [{"index": 0, "finish_reason": "stop",
+                                     "message": {"role": "assistant", "content": resp.choices[0].message.content}}],
+                        "usage": {"prompt_tokens": resp.usage.prompt_tokens,
+                                  "completion_tokens": resp.usage.completion_tokens,
+                                  "total_tokens": resp.usage.prompt_tokens + resp.usage.completion_tokens},
+                    })
+                if self.path.endswith("/embeddings"):
+                    resp = fake.embeddings.create(model=req.get("model"), input=req.get("input", []))
+                    return self._json(200, {
+                        "object": "list", "model": resp.model,
+                        "data": [{"object": "embedding", "index": d.index, "embedding": d.embedding} for d in resp.data],
+                        "usage": {"prompt_tokens": 0, "total_tokens": 0},
+                    })
+                return self._json(404, {"error": {"message": f"unknown path {self.path}"}})
+            except FakeAPIError as e:
+                return self._json(e.status_code, {"error": {"message": str(e), "type": "server_error"}})
+
+        def _chat_stream(self, req):
+            stream = fake.chat.completions.create(model=req.get("model"), messages=req.get("messages", []), stream=True)
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            for chunk in stream:
+                payload = {"id": "fake", "object": "chat.completion.chunk", "created": int(time.time()),
+                           "model": req.get("model"),
+                           "choices": [{"index": 0, "delta": {"content": chunk.choices[0].delta.content},
+                                        "finish_reason": None}]}
+                self.wfile.write(f"data: {json.dumps(payload)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+            self.wfile.write(b"data: [DONE]\n\n")
+
+    return Handler
+
+
+def serve(fake, host="127.0.0.1", port=8089):
+    """Start the fake API on a background thread; returns the server (call .shutdown())."""
+    server = ThreadingHTTPServer((host, port), _handler(fake))
+    threading.Thread(target=server.serve_forever, name="fake-openai", daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per request")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--token-delay", type=float, default=0.0, help="seconds between streamed tokens")
+    args = parser.parse_args()
+    fake = FakeOpenAI(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, token_delay=args.token_delay)
+    server = serve(fake, args.host, args.port)
+    print(f"[bench] fake OpenAI API on http://{args.host}:{args.port}/v1 (set OPENAI_BASE_URL to use it)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
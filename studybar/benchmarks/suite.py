@@ -0,0 +1,385 @@
+# offline benchmark suite
+#
+# Runs with no network: every LLM/embedding call goes to benchmarks.fake_openai
+# and every input comes from benchmarks.synthetic. Results are JSON keyed by
+# benchmark and size, so two runs (e.g. main vs a branch) can be compared:
+#
+#   python -m studybar.benchmarks.suite --out bench.json [--quick] [--latency 0.05]
+#   python -m studybar.benchmarks.suite --compare baseline.json bench.json [--tolerance 0.15]
+#
+# Benchmarks whose dependencies are missing (e.g. the tesseract binary for
+# OCR) are recorded as skipped rather than failing the run. import_time
+# measures cold imports in fresh interpreters (-X importtime) against
+# IMPORT_BUDGETS_MS; a run that breaks a budget, or whose imports pull in one
+# of HEAVY_MODULES, exits with status 1.
+
+import argparse, contextlib, functools, json, os, platform, random, statistics, subprocess, sys, tempfile, time
+from datetime import datetime
+
+from studybar.benchmarks import synthetic
+from studybar.benchmarks.fake_openai import FakeOpenAI, installed
+
+QUICK_SIZES = ["small"]
+ALL_SIZES = ["small", "medium", "large"]
+
+# cold import budgets; most of studybar.api.main's is fastapi itself. Each is
+# the p95 of 20 cold imports on a dev laptop (433/35/27 ms; p50 376/32/26)
+# plus a noise margin of 25% or 20 ms, whichever is larger (run-to-run p50s
+# of the small modules move by ~10 ms). Undoing the lazy imports (~1.2 s for
+# api.main, 100+ ms for numpy/openai in the others) still fails by a wide
+# margin. Slower runners scale them with STUDYBAR_IMPORT_BUDGET_SCALE rather
+# than editing them; --compare against a baseline run catches smaller ones.
+IMPORT_BUDGETS_MS = {
+    "studybar.api.main": 550,
+    "studybar.tutor_gpt.tutor_gpt": 55,
+    "studybar.flashcard_maker.flashcard_maker": 50,
+}
+IMPORT_BUDGET_SCALE = float(os.getenv("STUDYBAR_IMPORT_BUDGET_SCALE", "1.0"))
+# loaded on first use only; none of these may appear in an import above
+HEAVY_MODULES = ("openai", "fitz", "cv2", "numpy", "PIL", "pytesseract")
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def measure(fn, repeat=5, warmup=1):
+    """
+    Wall-clock stats for fn() in milliseconds. Calls that raise (e.g. injected
+    llm errors) are timed too and counted in "errors".
+    """
+    errors = 0
+    for _ in range(warmup):
+        try:
+            fn()
+        except Exception:
+            pass
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        try:
+            fn()
+        except Exception:
+            errors += 1
+        samples.append((time.perf_counter() - start) * 1000)
+    if errors == repeat:
+        raise RuntimeError(f"all {repeat} calls failed")
+    samples.sort()
+    return {
+        "repeat": repeat,
+        "errors": errors,
+        "mean_ms": statistics.fmean(samples),
+        "p50_ms": samples[len(samples) // 2],
+        "p95_ms": samples[min(len(samples) - 1, int(round(0.95 * (len(samples) - 1))))],
+        "min_ms": samples[0],
+    }
+
+
+# ---------- benchmarks: each returns {size: stats} ----------
+def bench_extract_text_chunks(tmp, sizes, **_):
+    from studybar.document_embedding import extract_text_chunks
+    out = {}
+    for size in sizes:
+        path = synthetic.make_pdf(os.path.join(tmp, f"notes_{size}.pdf"), synthetic.PDF_SIZES[size])
+        stats = measure(lambda: extract_text_chunks(path), repeat=3 if size == "large" else 5)
+        stats["pages"] = synthetic.PDF_SIZES[size]
+        stats["chunks"] = len(extract_text_chunks(path))
+        out[size] = stats
+    return out
+
+
+def bench_dedupe_chunks(tmp, sizes, **_):
+    from studybar.document_embedding import extract_text_chunks
+    from studybar.dedup import dedupe_chunks
+    out = {}
+    for size in sizes:
+        path = synthetic.make_pdf(os.path.join(tmp, f"dedup_{size}.pdf"), synthetic.PDF_SIZES[size])
+        chunks = extract_text_chunks(path)
+        stats = measure(lambda: dedupe_chunks(chunks), repeat=3)
+        stats["tokens_saved"] = dedupe_chunks(chunks)[1]["tokens_saved"]
+        out[size] = stats
+    return out
+
+
+def bench_bucketed_index(tmp, sizes, fake, **_):
+    from studybar.document_embedding import BucketedIndex
+    out = {}
+    for size in sizes:
+        topics, per_topic = synthetic.BUCKET_SIZES[size]
+        data_path = os.path.join(tmp, f"embeddings_{size}")
+        names = synthetic.make_embedding_buckets(data_path, topics, per_topic, dim=fake.embedding_dim)
+        load = measure(lambda: BucketedIndex(data_path), repeat=3, warmup=0)
+        index = BucketedIndex(data_path)
+        query = fake.embed("what is ionisation energy")
+        index.search(names[0], query)  # builds the normalised matrix once
+        out[size] = {
+            "topics": topics,
+            "chunks_per_topic": per_topic,
+            "load": load,
+            "search": measure(lambda: index.search(names[0], query, k=5), repeat=50),
+            "get_contexts": measure(lambda: index.get_contexts(names[0], student_level=0.9), repeat=50),
+        }
+    return out
+
+
+def bench_ocr(tmp, sizes, **_):
+    import shutil
+    if shutil.which("tesseract") is None:
+        return {"skipped": "tesseract binary not installed"}
+    from studybar.tutor_gpt.ocr_utils import OCRExtractor
+    ocr = OCRExtractor()
+    out = {}
+    for size in sizes:
+        path = synthetic.make_answer_image(os.path.join(tmp, f"answer_{size}.png"), synthetic.IMAGE_SIZES[size])
+        out[size] = measure(lambda: ocr.extract(path), repeat=3, warmup=0)
+    pdf = synthetic.make_pdf(os.path.join(tmp, "answer_pages.pdf"), 3, blocks_per_page=4)
+    out["pdf_3_pages"] = measure(lambda: ocr.extract(pdf), repeat=2, warmup=0)
+    return out
+
+
+def bench_answer_marker(tmp, sizes, fake, **_):
+    from studybar.tutor_gpt.marker import AnswerMarker
+    marker = AnswerMarker(log_dir=os.path.join(tmp, "error_logs"), db_path=os.path.join(tmp, "error_logs.db"))
+    answer = synthetic.sentence(random.Random(1), 80)
+    context = " ".join(synthetic.sentence(random.Random(i), 40) for i in range(8))
+    stats = measure(lambda: marker.mark(answer, "Define first ionisation energy.", context, topic="bench"), repeat=20)
+    stats["llm_latency_ms"] = fake.latency * 1000
+    return {"default": stats}
+
+
+def bench_db(tmp, sizes, quick=False, **_):
+    from studybar.benchmarks import db_bench
+    report = db_bench.run(500 if quick else 2000)
+    # per-op latency so it compares like everything else; ops/sec kept alongside
+    return {
+        op: {
+            "mean_ms": 1000.0 / report["after"][op],
+            "ops_per_sec": report["after"][op],
+            "legacy_ops_per_sec": report["before"][op],
+            "n": report["n"],
+        }
+        for op in report["after"]
+    }
+
+
+def bench_proficiency_replay(tmp, sizes, **_):
+    from studybar.tutor_gpt.proficiency_replay import fit_bkt, replay
+    out = {}
+    for size in sizes:
+        students, topics, per_topic = synthetic.HISTORY_SIZES[size]
+        rows = synthetic.make_answer_history(students, topics, per_topic)
+        out[size] = {
+            "answers": len(rows),
+            "replay": measure(lambda: replay(rows), repeat=3),
+            "fit_bkt": measure(lambda: fit_bkt(rows), repeat=1, warmup=0),
+        }
+    return out
+
+
+def bench_routes(tmp, sizes, fake, **_):
+    from fastapi.testclient import TestClient
+    from studybar import db
+    from studybar.api.main import app
+    from studybar.api.routes import tutor as tutor_routes
+    from studybar.flashcard_maker.deck_store import DECK_STORE
+    from studybar.tutor_gpt import tutor_gpt
+    from studybar.tutor_gpt.intent_classifier import log_example
+
+    # isolate everything the routes write from the real data directory
+    data_dir = os.path.join(tmp, "data")
+    embeddings = os.path.join(data_dir, "embeddings")
+    names = synthetic.make_embedding_buckets(embeddings, 2, 200, dim=fake.embedding_dim)
+    DECK_STORE.store_dir = os.path.join(tmp, "decks")
+    DECK_STORE.put("benchdeck", [{"term": f"t{i}", "definition": "d" * 80, "page": i} for i in range(200)])
+    tutor_gpt.log_example = functools.partial(log_example, log_path=os.path.join(tmp, "intent_log.jsonl"))
+    tutor_routes.TUTOR_INSTANCES["bench_" + names[0]] = tutor_gpt.TutorGPT(
+        "bench", names[0], data_dir=data_dir, embeddings_dir=embeddings
+    )
+
+    out = {}
+    with TestClient(app) as http:
+        db.set_progress("bench", "atomic_structure", 40)
+        deck_etag = http.get("/api/flashcards/benchdeck").headers["etag"]
+        cases = {
+            "GET /": lambda: http.get("/"),
+            "GET /api/users/chapters": lambda: http.get("/api/users/chapters"),
+            "GET /api/users/{id}": lambda: http.get("/api/users/bench"),
+            "GET /api/users/{id}/progress": lambda: http.get("/api/users/bench/progress"),
+            "POST /api/users/{id}/progress": lambda: http.post(
+                "/api/users/bench/progress", json={"updates": {"atomic_structure": 50, "energetics": 20}}),
+            "GET /api/flashcards/{hash}": lambda: http.get("/api/flashcards/benchdeck"),
+            "GET /api/flashcards/{hash} (304)": lambda: http.get(
+                "/api/flashcards/benchdeck", headers={"If-None-Match": deck_etag}),
+            "POST /api/tutor/chat": lambda: http.post(
+                "/api/tutor/chat", data={"student_id": "bench", "conversation_id": names[0], "message": "hello there"}),
+            "POST /api/tutor/chat/stream": lambda: http.post(
+                "/api/tutor/chat/stream", data={"student_id": "bench", "conversation_id": names[0], "message": "hello there"}),
+        }
+        for name, call in cases.items():
+            status = call().status_code
+            stats = measure(call, repeat=20 if "tutor" in name else 100, warmup=2)
+            stats["status"] = status
+            out[name] = stats
+    return out
+
+
+def _cold_import(module):
+    """(cumulative import ms, heavy modules loaded) for `module` in a fresh interpreter."""
+    code = (f"import sys, {module}; "
+            f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))")
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT)
+    env.pop("OPENAI_API_KEY", None)  # importing must not need a key
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True,
+                          text=True, env=env, cwd=tempfile.gettempdir())
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+    for line in proc.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        parts = line.split("|")
+        if len(parts) == 3 and parts[2].strip() == module:
+            return int(parts[1]) / 1000, [m for m in proc.stdout.strip().split(",") if m]
+    raise RuntimeError(f"no importtime line for {module}")
+
+
+def bench_import_time(tmp, sizes, quick=False, **_):
+    out = {}
+    for module, budget in IMPORT_BUDGETS_MS.items():
+        budget *= IMPORT_BUDGET_SCALE
+        samples, heavy = [], []
+        for _ in range(3 if quick else 7):
+            ms, heavy = _cold_import(module)
+            samples.append(ms)
+        samples.sort()
+        out[module] = {
+            "repeat": len(samples),
+            "mean_ms": statistics.fmean(samples),
+            "p50_ms": samples[len(samples) // 2],
+            "min_ms": samples[0],
+            "budget_ms": budget,
+            "heavy_modules": heavy,
+            # the fastest run: load on the machine only ever adds time, while
+            # an eager import raises every run, the fastest included
+            "over_budget": samples[0] > budget or bool(heavy),
+        }
+    return out
+
+
+BENCHMARKS = {
+    "import_time": bench_import_time,
+    "extract_text_chunks": bench_extract_text_chunks,
+    "dedupe_chunks": bench_dedupe_chunks,
+    "bucketed_index": bench_bucketed_index,
+    "ocr": bench_ocr,
+    "answer_marker": bench_answer_marker,
+    "db": bench_db,
+    "proficiency_replay": bench_proficiency_replay,
+    "routes": bench_routes,
+}
+
+
+def _git_rev():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(__file__)).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run(only=None, quick=False, latency=0.0, error_rate=0.0):
+    """Run the suite; returns {"meta": {...}, "results": {benchmark: {size: stats} | {"skipped"|"error": str}}}."""
+    from studybar import db
+    from studybar.profile_cache import PROFILE_CACHE
+
+    tmp = tempfile.mkdtemp(prefix="studybar-bench-")
+    db.DB_PATH = os.path.join(tmp, "users.sqlite")
+    sizes = QUICK_SIZES if quick else ALL_SIZES
+    fake = FakeOpenAI(latency=latency, error_rate=error_rate)
+    results = {}
+    with installed(fake):
+        for name, fn in BENCHMARKS.items():
+            if only and name not in only:
+                continue
+            print(f"[bench] {name}...", file=sys.stderr)
+            try:
+                results[name] = fn(tmp, sizes, fake=fake, quick=quick)
+            except ImportError as e:
+                results[name] = {"skipped": f"{type(e).__name__}: {e}"}
+            except Exception as e:
+                results[name] = {"error": f"{type(e).__name__}: {e}"}
+        PROFILE_CACHE.flush()
+
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "git_rev": _git_rev(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "quick": quick,
+            "fake_latency_s": latency,
+            "fake_error_rate": error_rate,
+            "fake_calls": fake.calls,
+        },
+        "results": results,
+    }
+
+
+def _flatten(results, prefix=""):
+    """{"a/b/c": mean_ms} for every stats dict in a results tree."""
+    flat = {}
+    for key, value in results.items():
+        if not isinstance(value, dict):
+            continue
+        path = f"{prefix}/{key}" if prefix else key
+        if "mean_ms" in value:
+            flat[path] = value["mean_ms"]
+        else:
+            flat.update(_flatten(value, path))
+    return flat
+
+
+def compare(baseline, current, tolerance=0.15):
+    """Rows of (name, before_ms, after_ms, ratio, regressed) for benchmarks in both runs."""
+    before = _flatten(baseline["results"])
+    after = _flatten(current["results"])
+    rows = []
+    for name in sorted(before.keys() & after.keys()):
+        ratio = after[name] / before[name] if before[name] else float("inf")
+        rows.append((name, before[name], after[name], ratio, ratio > 1 + tolerance))
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--out", help="write results JSON here (default: stdout)")
+    parser.add_argument("--only", nargs="*", choices=sorted(BENCHMARKS), help="run just these benchmarks")
+    parser.add_argument("--quick", action="store_true", help="small sizes only")
+    parser.add_argument("--latency", type=float, default=0.0, help="fake llm latency in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of fake llm calls that fail")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"), help="compare two results files")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="slowdown ratio treated as a regression")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            baseline = json.load(f)
+        with open(args.compare[1]) as f:
+            current = json.load(f)
+        rows = compare(baseline, current, args.tolerance)
+        for name, b, a, ratio, regressed in rows:
+            print(f"{'REGRESSED' if regressed else 'ok':>9}  {ratio:6.2f}x  {b:10.3f} -> {a:10.3f} ms  {name}")
+        sys.exit(1 if any(r[4] for r in rows) else 0)
+
+    # keep stdout clean for the JSON; the code under test prints freely
+    with contextlib.redirect_stdout(sys.stderr):
+        report = run(only=args.only, quick=args.quick, latency=args.latency, error_rate=args.error_rate)
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+        print(f"[bench] wrote {args.out}", file=sys.stderr)
+    else:
+        print(text)
+
+    over = [(module, stats) for module, stats in report["results"].get("import_time", {}).items()
+            if isinstance(stats, dict) and stats.get("over_budget")]
+    for module, stats in over:
+        print(f"[bench] import budget exceeded: {module} {stats['min_ms']:.1f} ms "
+              f"(budget {stats['budget_ms']} ms), heavy modules: {stats['heavy_modules']}", file=sys.stderr)
+    sys.exit(1 if over else 0)
@@ -0,0 +1,121 @@
+# synthetic inputs for benchmarks: pdfs, answer images, embedding buckets
+#
+# Everything is generated from a seed, so two runs of the suite see the same
+# data and their numbers are comparable.
+
+import json, os, random
+
+import numpy as np
+
+WORDS = (
+    "atom electron proton neutron nucleus shell orbital energy ionisation isotope mass charge "
+    "bond covalent ionic lattice enthalpy reaction equilibrium rate catalyst mole concentration "
+    "structure period group trend radius attraction repulsion spin configuration spectrum"
+).split()
+
+# sizes shared by the suite: name -> parameters
+PDF_SIZES = {"small": 5, "medium": 40, "large": 200}                        # pages
+BUCKET_SIZES = {"small": (2, 200), "medium": (4, 500), "large": (8, 2000)}       # topics, chunks/topic
+IMAGE_SIZES = {"small": (800, 600), "medium": (1654, 1169), "large": (2480, 3508)}  # A4 @ 150/300 dpi
+HISTORY_SIZES = {"small": (200, 4, 20), "medium": (1000, 8, 40), "large": (5000, 8, 50)}  # students, topics, answers each
+
+
+def sentence(rng, n_words):
+    words = [rng.choice(WORDS) for _ in range(n_words)]
+    return (" ".join(words)).capitalize() + "."
+
+
+def definition(rng):
+    term = " ".join(rng.choice(WORDS) for _ in range(2))
+    return f"{term.capitalize()} is defined as {sentence(rng, rng.randint(8, 20)).lower()}"
+
+
+def make_pdf(path, pages, blocks_per_page=8, seed=0):
+    """A text pdf with a running header/footer and a mix of definitions and prose."""
+    import fitz
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for p in range(pages):
+        page = doc.new_page()
+        page.insert_text((50, 40), f"Chemistry revision notes - Atomic structure - page {p + 1}", fontsize=9)
+        y = 80
+        for _ in range(blocks_per_page):
+            text = definition(rng) if rng.random() < 0.3 else sentence(rng, rng.randint(15, 40))
+            rect = fitz.Rect(50, y, 545, y + 80)
+            page.insert_textbox(rect, text, fontsize=10)
+            y += 85
+            if y > 760:
+                break
+        page.insert_text((50, 815), "Copyright StudyBar synthetic content", fontsize=8)
+    doc.save(path)
+    doc.close()
+    return path
+
+
+def make_answer_image(path, size=(1654, 1169), lines=12, seed=0):
+    """A 'handwritten answer' stand-in: printed lines of text plus a small diagram."""
+    import cv2
+    rng = random.Random(seed)
+    w, h = size
+    img = np.full((h, w, 3), 255, dtype=np.uint8)
+    scale = w / 1654
+    y = int(80 * scale)
+    for _ in range(lines):
+        cv2.putText(img, sentence(rng, 8)[:60], (int(60 * scale), y), cv2.FONT_HERSHEY_SIMPLEX,
+                    1.0 * scale, (0, 0, 0), max(1, int(2 * scale)))
+        y += int(70 * scale)
+        if y > h - 200 * scale:
+            break
+    # a box-and-arrow diagram in the corner
+    cv2.rectangle(img, (int(w * 0.65), int(h * 0.7)), (int(w * 0.9), int(h * 0.9)), (0, 0, 0), 2)
+    cv2.arrowedLine(img, (int(w * 0.5), int(h * 0.8)), (int(w * 0.65), int(h * 0.8)), (0, 0, 0), 2)
+    cv2.imwrite(path, img)
+    return path
+
+
+def make_embeddings(n, dim=256, seed=0):
+    rng = np.random.default_rng(seed)
+    m = rng.standard_normal((n, dim)).astype(np.float32)
+    return m / np.linalg.norm(m, axis=1, keepdims=True)
+
+
+def make_embedding_buckets(data_path, topics, chunks_per_topic, dim=256, seed=0):
+    """Write topic buckets in save_embeddings' format; returns the topic names."""
+    os.makedirs(data_path, exist_ok=True)
+    rng = random.Random(seed)
+    names = []
+    for t in range(topics):
+        topic = f"topic_{t}"
+        embeddings = make_embeddings(chunks_per_topic, dim, seed + t)
+        chunks = [
+            {"id": f"p{i // 8 + 1}_b{i % 8}", "page": i // 8 + 1, "text": sentence(rng, 25),
+             "embedding": embeddings[i].tolist()}
+            for i in range(chunks_per_topic)
+        ]
+        with open(os.path.join(data_path, f"{topic}.json"), "w", encoding="utf-8") as f:
+            json.dump(chunks, f)
+        names.append(topic)
+    return names
+
+
+def make_answer_history(students, topics, answers_per_topic, seed=0):
+    """
+    Rows shaped like db.answer_history(): (student_id, topic, score, q_type,
+    level_before), oldest first, with every student's topics interleaved.
+    Scores drift upwards as a sequence goes on, at a per-sequence pace.
+    """
+    rng = np.random.default_rng(seed)
+    n_seq = students * topics
+    step = np.tile(np.arange(answers_per_topic), n_seq)
+    seq = np.repeat(np.arange(n_seq), answers_per_topic)
+    pace = rng.uniform(0.0, 0.05, n_seq)[seq]
+    score = np.clip(rng.normal(0.3 + pace * step, 0.2), 0.0, 1.0).round(2)
+    structured = rng.random(len(seq)) < 0.7
+    # answers happen in order within a sequence, at different times across them
+    order = np.argsort(step + rng.uniform(0, 3, n_seq)[seq], kind="stable")
+    names = [f"student_{i}" for i in range(students)]
+    topic_names = [f"topic_{t}" for t in range(topics)]
+    return [
+        (names[q // topics], topic_names[q % topics], sc, "structured" if st else "short", 0.0)
+        for q, sc, st in zip(seq[order].tolist(), score[order].tolist(), structured[order].tolist())
+    ]
@@ -0,0 +1,107 @@
+# token-budgeted context packing for prompts
+#
+# Retrieved chunks overlap (neighbouring blocks, recap boxes, a definition
+# repeated on several pages) and used to be pasted in whole or cut at a fixed
+# character count. pack() takes chunks in relevance order (their retrieval
+# "score" when they have one), drops sentences the prompt already contains,
+# and fills a token budget a sentence at a time, so text is only ever cut at a
+# sentence boundary. A chunk whose first sentence alone won't fit is cut at a
+# word boundary instead of being lost. Each call reports the prompt tokens
+# saved against pasting every chunk in full.
+
+import re
+
+from studybar import metrics
+from studybar.tokens import DEFAULT_MODEL, count_tokens
+
+MIN_FRAGMENT_TOKENS = 24    # don't start a word-cut fragment in less room than this
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def split_sentences(text):
+    """Sentences of a chunk, with pdf line breaks and runs of spaces collapsed."""
+    return [s for s in _SENTENCE_END.split(" ".join(text.split())) if s]
+
+
+def _key(sentence):
+    return " ".join(re.findall(r"\w+", sentence.lower()))
+
+
+def _cut_at_word(sentence, budget, model):
+    """The longest run of leading whole words that fits in budget tokens."""
+    words = sentence.split(" ")
+    lo, hi = 0, len(words)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if count_tokens(" ".join(words[:mid]), model) <= budget:
+            lo = mid
+        else:
+            hi = mid - 1
+    return " ".join(words[:lo])
+
+
+def pack(chunks, budget, header=None, separator="\n\n", model=DEFAULT_MODEL, site="context"):
+    """
+    Join chunk texts into at most `budget` tokens of context.
+
+    header(chunk) -> str optionally prefixes each chunk that makes it in
+    (e.g. its id and page). Returns (text, report) where report has chunk
+    and sentence counts and tokens_in/tokens_out/tokens_saved.
+    """
+    ranked = sorted(chunks, key=lambda c: -c.get("score", 0.0))  # stable: unscored keep their order
+    seen = set()
+    seen_text = ""
+    parts = []
+    used = 0
+    sep_tokens = count_tokens(separator, model)
+    sentences_in = duplicates = 0
+    truncated = False
+
+    for c in ranked:
+        head = header(c) if header else ""
+        sep = sep_tokens if parts else 0
+        room = budget - used - sep - count_tokens(head, model)
+        kept = []
+        sentences = split_sentences(c["text"])
+        sentences_in += len(sentences)
+        for sentence in sentences:
+            key = _key(sentence)
+            if not key or key in seen or (len(key) > 20 and key in seen_text):
+                duplicates += 1
+                continue
+            cost = count_tokens(" " + sentence, model)
+            if cost > room:
+                fragment = _cut_at_word(sentence, room, model) if not kept and room >= MIN_FRAGMENT_TOKENS else ""
+                if fragment:
+                    kept.append(fragment)
+                truncated = True
+                break
+            kept.append(sentence)
+            room -= cost
+            seen.add(key)
+            seen_text += key + " | "
+        if kept:
+            part = head + " ".join(kept)
+            parts.append(part)
+            used += sep + count_tokens(part, model)
+
+    text = separator.join(parts)
+    tokens_in = count_tokens(separator.join((header(c) if header else "") + c["text"] for c in chunks), model)
+    tokens_out = count_tokens(text, model)
+    report = {
+        "chunks_in": len(chunks),
+        "chunks_out": len(parts),
+        "sentences_in": sentences_in,
+        "duplicate_sentences": duplicates,
+        "truncated": truncated,
+        "tokens_in": tokens_in,
+        "tokens_out": tokens_out,
+        "tokens_saved": max(0, tokens_in - tokens_out),
+    }
+    metrics.CONTEXT_TOKENS.observe(tokens_in, site=site, kind="in")
+    metrics.CONTEXT_TOKENS.observe(tokens_out, site=site, kind="out")
+    metrics.CONTEXT_TOKENS_SAVED.inc(report["tokens_saved"], site=site)
+    metrics.log_event("context", site=site, **report)
+    print(f"[CONTEXT] {site}: {len(chunks)} -> {len(parts)} chunks, "
+          f"{tokens_in} -> {tokens_out} tokens ({report['tokens_saved']} saved)")
+    return text, report
@@ -1,160 +1,583 @@
 import os
 import sqlite3
 import json
+import threading
+import time
+from datetime import datetime
 from typing import List, Dict, Any
 
+from studybar import metrics
+
 BASE_DIR = os.path.dirname(__file__)
 DATA_DIR = os.path.join(BASE_DIR, "data")
 DB_PATH = os.path.join(BASE_DIR, "data", "studybar_users.sqlite")
 
+# connection tuning, applied once per connection
+PRAGMAS = [
+    "PRAGMA journal_mode=WAL",        # readers don't block the writer
+    "PRAGMA synchronous=NORMAL",      # safe with WAL, avoids an fsync per commit
+    "PRAGMA mmap_size=268435456",     # 256MB memory-mapped reads
+    "PRAGMA cache_size=-32000",       # 32MB page cache
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",       # wait for other workers' write locks
+]
+# sqlite3 keeps compiled statements per connection keyed by SQL text, so the
+# statements below are module constants and get prepared once per connection
+STATEMENT_CACHE_SIZE = 256
+
+# one connection per thread (sqlite connections aren't shareable across
+# threads by default) and one migration check per process per database file
+_local = threading.local()
+_schema_lock = threading.Lock()
+_schema_ready = set()
+
 
 def ensure_db_dir():
     os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
 
 
-def get_conn():
-    ensure_db_dir()
-    conn = sqlite3.connect(DB_PATH)
+def _connect(path):
+    conn = sqlite3.connect(path, cached_statements=STATEMENT_CACHE_SIZE)
     conn.row_factory = sqlite3.Row
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def get_conn():
+    """Return this thread's long-lived connection, creating it (and the schema) on first use."""
+    conn = getattr(_local, "conn", None)
+    # reconnect if DB_PATH was changed or we're in a forked worker
+    if conn is None or _local.path != DB_PATH or _local.pid != os.getpid():
+        ensure_db_dir()
+        conn = _connect(DB_PATH)
+        _local.conn, _local.path, _local.pid = conn, DB_PATH, os.getpid()
+    if DB_PATH not in _schema_ready:
+        _init_schema(conn)
     return conn
 
 
+def close_conn():
+    """Close this thread's connection (next get_conn reopens it)."""
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        conn.close()
+        _local.conn = None
+
+
 def init_db():
-    conn = get_conn()
-    cur = conn.cursor()
-    # users table
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS users (
-            id TEXT PRIMARY KEY,
-            data JSON
-        )
-        """
-    )
-
-    # chapters table
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS chapters (
-            key TEXT PRIMARY KEY,
-            title TEXT
-        )
-        """
-    )
-
-    # progress table
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS progress (
-            user_id TEXT,
-            chapter_key TEXT,
-            progress REAL,
-            PRIMARY KEY (user_id, chapter_key),
-            FOREIGN KEY(chapter_key) REFERENCES chapters(key)
-        )
-        """
-    )
+    """Create the schema. Cheap after the first call in a process."""
+    get_conn()
 
-    conn.commit()
-    conn.close()
 
+def _init_schema(conn):
+    # versioned migrations, each applied once per database (see migrations.py)
+    from studybar import migrations
+    with _schema_lock:
+        if DB_PATH in _schema_ready:
+            return
+        migrations.apply(conn)
+        _schema_ready.add(DB_PATH)
 
-def migrate_profiles_json(json_path: str):
-    # If JSON file exists, migrate its proficiencies into users table (as data)
-    if not os.path.exists(json_path):
-        return
-    init_db()
-    with open(json_path, "r", encoding="utf-8") as f:
-        profiles = json.load(f)
-
-    conn = get_conn()
-    cur = conn.cursor()
-    for student_id, pdata in profiles.items():
-        cur.execute(
-            "INSERT OR REPLACE INTO users (id, data) VALUES (?, ?)",
-            (student_id, json.dumps(pdata)),
-        )
-        # Optionally migrate proficiencies to progress rows: map topic -> chapter_key
-        profs = pdata.get("proficiencies", {})
-        for topic, level in profs.items():
-            # treat topic as chapter_key
-            cur.execute(
-                "INSERT OR REPLACE INTO progress (user_id, chapter_key, progress) VALUES (?, ?, ?)",
-                (student_id, topic, float(level) * 100.0),
-            )
 
-    conn.commit()
-    conn.close()
+# ---------- statements ----------
+# users_compat re-assembles the legacy {"proficiencies": {...}, ...} blob
+SQL_GET_USER = "SELECT data FROM users_compat WHERE id = ?"
+SQL_UPSERT_USER = "INSERT OR REPLACE INTO users (id, data) VALUES (?, ?)"
+SQL_ENSURE_USER = "INSERT OR IGNORE INTO users (id, data) VALUES (?, '{}')"
+SQL_TOUCH_USER = "UPDATE users SET data = json_set(COALESCE(data, '{}'), '$.last_activity', ?) WHERE id = ?"
+SQL_UPSERT_PROFICIENCY = (
+    "INSERT INTO proficiencies (user_id, topic, level, updated_at, version) VALUES (?, ?, ?, ?, 1) "
+    "ON CONFLICT(user_id, topic) DO UPDATE SET level = excluded.level, updated_at = excluded.updated_at, "
+    "version = proficiencies.version + 1"
+)
+SQL_DELETE_OTHER_PROFICIENCIES = (
+    "DELETE FROM proficiencies WHERE user_id = ? AND topic NOT IN (SELECT value FROM json_each(?))"
+)
+SQL_GET_PROFICIENCIES = "SELECT topic, level FROM proficiencies WHERE user_id = ?"
+SQL_GET_PROFICIENCY_ROWS = "SELECT topic, level, version, updated_at FROM proficiencies WHERE user_id = ?"
+SQL_GET_PROFICIENCY_ROW = "SELECT level, version, updated_at FROM proficiencies WHERE user_id = ? AND topic = ?"
+SQL_INSERT_PROFICIENCY_V = (
+    "INSERT OR IGNORE INTO proficiencies (user_id, topic, level, updated_at, version) VALUES (?, ?, ?, ?, 1)"
+)
+SQL_UPDATE_PROFICIENCY_IF_VERSION = (
+    "UPDATE proficiencies SET level = ?, updated_at = ?, version = version + 1 "
+    "WHERE user_id = ? AND topic = ? AND version = ?"
+)
+SQL_STUDENTS_BELOW = (
+    "SELECT user_id, level FROM proficiencies WHERE topic = ? AND level < ? ORDER BY level"
+)
+# cohort filters: NULL json list means "all students"
+SQL_PROFICIENCY_HISTOGRAM = (
+    "SELECT MIN(CAST(level * ?1 AS INTEGER), ?1 - 1) AS bin, COUNT(*) AS n "
+    "FROM proficiencies WHERE topic = ?2 "
+    "AND (?3 IS NULL OR user_id IN (SELECT value FROM json_each(?3))) "
+    "GROUP BY bin ORDER BY bin"
+)
+SQL_WEAKEST_TOPICS = (
+    "SELECT topic, AVG(level) AS mean_level, MIN(level) AS min_level, COUNT(*) AS students "
+    "FROM proficiencies WHERE (?1 IS NULL OR user_id IN (SELECT value FROM json_each(?1))) "
+    "GROUP BY topic ORDER BY mean_level ASC LIMIT ?2"
+)
+SQL_SET_PROGRESS = "INSERT OR REPLACE INTO progress (user_id, chapter_key, progress) VALUES (?, ?, ?)"
+SQL_LIST_CHAPTERS = "SELECT key, title FROM chapters"
+SQL_PROGRESS_FOR_USER = (
+    "SELECT c.key, c.title, IFNULL(p.progress, 0) as progress "
+    "FROM chapters c LEFT JOIN progress p ON c.key = p.chapter_key AND p.user_id = ?"
+)
+# one pass over chapters x requested students; ids are passed as a json array
+# so the statement text (and its prepared form) is the same for any cohort size
+SQL_PROGRESS_FOR_USERS = (
+    "WITH ids(user_id) AS (SELECT DISTINCT value FROM json_each(?)) "
+    "SELECT ids.user_id, c.key, c.title, IFNULL(p.progress, 0) as progress "
+    "FROM ids CROSS JOIN chapters c "
+    "LEFT JOIN progress p ON p.user_id = ids.user_id AND p.chapter_key = c.key "
+    "ORDER BY ids.user_id, c.key"
+)
+SQL_SEEN_PROBLEMS = "SELECT problem_id FROM seen_problems WHERE user_id = ? AND topic = ?"
+SQL_MARK_SEEN = (
+    "INSERT OR IGNORE INTO seen_problems (user_id, topic, problem_id, seen_at) "
+    "VALUES (?, ?, ?, datetime('now'))"
+)
+# flashcard jobs: a failed job doesn't block a retry, anything else is reused
+SQL_FIND_FLASHCARD_JOB = (
+    "SELECT * FROM flashcard_jobs WHERE pdf_hash = ? AND status IN ('queued', 'running', 'done') "
+    "ORDER BY created_at DESC LIMIT 1"
+)
+SQL_INSERT_FLASHCARD_JOB = (
+    "INSERT OR IGNORE INTO flashcard_jobs (id, pdf_hash, status, owner, created_at, updated_at) "
+    "VALUES (?, ?, 'queued', ?, datetime('now'), datetime('now'))"
+)
+SQL_GET_FLASHCARD_JOB = "SELECT * FROM flashcard_jobs WHERE id = ?"
+SQL_CLAIM_FLASHCARD_JOB = (
+    "UPDATE flashcard_jobs SET status = 'running', owner = ?, updated_at = datetime('now') "
+    "WHERE id = ? AND status = 'queued'"
+)
+SQL_ADOPT_FLASHCARD_JOB = (
+    "UPDATE flashcard_jobs SET status = 'queued', owner = ?, updated_at = datetime('now') "
+    "WHERE id = ? AND owner IS ? AND status IN ('queued', 'running')"
+)
+SQL_FLASHCARD_JOB_PROGRESS = (
+    "UPDATE flashcard_jobs SET done = ?, total = ?, result = ?, updated_at = datetime('now') WHERE id = ?"
+)
+SQL_FINISH_FLASHCARD_JOB = (
+    "UPDATE flashcard_jobs SET status = ?, result = COALESCE(?, result), error = ?, "
+    "updated_at = datetime('now') WHERE id = ?"
+)
+SQL_UNFINISHED_FLASHCARD_JOBS = (
+    "SELECT id, pdf_hash, owner FROM flashcard_jobs WHERE status IN ('queued', 'running') ORDER BY created_at"
+)
+# single-flight locks: expires_at is the lease end while running, and when the
+# result stops being served once done
+SQL_PRUNE_FLIGHTS = "DELETE FROM flight_locks WHERE expires_at < ?"
+SQL_ACQUIRE_FLIGHT = (
+    "INSERT OR IGNORE INTO flight_locks (key, owner, status, expires_at, updated_at) "
+    "VALUES (?, ?, 'running', ?, datetime('now'))"
+)
+SQL_GET_FLIGHT = "SELECT key, owner, status, result, expires_at FROM flight_locks WHERE key = ?"
+SQL_TAKE_OVER_FLIGHT = (
+    "UPDATE flight_locks SET owner = ?, expires_at = ?, updated_at = datetime('now') "
+    "WHERE key = ? AND owner = ? AND status = 'running'"
+)
+SQL_FINISH_FLIGHT = (
+    "UPDATE flight_locks SET status = 'done', result = ?, expires_at = ?, updated_at = datetime('now') "
+    "WHERE key = ? AND owner = ?"
+)
+SQL_RELEASE_FLIGHT = "DELETE FROM flight_locks WHERE key = ? AND owner = ?"
+SQL_INSERT_ANSWER = (
+    "INSERT INTO answers (user_id, topic, score, q_type, level_before, answered_at) VALUES (?, ?, ?, ?, ?, ?)"
+)
+SQL_ENROLL_REVIEW_CARD = (
+    "INSERT OR IGNORE INTO review_cards (user_id, deck, card_id, due, interval, ease, reps, lapses) "
+    "VALUES (?, ?, ?, ?, 0, ?, 0, 0)"
+)
+SQL_GET_REVIEW_CARD = (
+    "SELECT deck, card_id, due, interval, ease, reps, lapses, last_review FROM review_cards "
+    "WHERE user_id = ? AND deck = ? AND card_id = ?"
+)
+SQL_SAVE_REVIEW = (
+    "UPDATE review_cards SET due = ?, interval = ?, ease = ?, reps = ?, lapses = ?, last_review = ? "
+    "WHERE user_id = ? AND deck = ? AND card_id = ?"
+)
+SQL_UNENROLL_REVIEW_CARD = "DELETE FROM review_cards WHERE user_id = ? AND deck = ? AND card_id = ?"
+SQL_REVIEW_QUEUE = "SELECT due, deck, card_id FROM review_cards WHERE user_id = ?1 AND (?2 IS NULL OR deck = ?2)"
+SQL_DUE_REVIEW_CARDS = (
+    "SELECT deck, card_id, due, interval, ease, reps, lapses, last_review FROM review_cards "
+    "WHERE user_id = ?1 AND due <= ?2 AND (?3 IS NULL OR deck = ?3) ORDER BY due LIMIT ?4"
+)
+SQL_ANSWER_HISTORY = (
+    "SELECT user_id, topic, score, q_type, level_before FROM answers "
+    "WHERE (?1 IS NULL OR user_id IN (SELECT value FROM json_each(?1))) ORDER BY id"
+)
 
 
-def get_user(student_id: str) -> Dict[str, Any] | None:
-    init_db()
+def migrate_profiles_json(json_path: str):
+    """Import a legacy profiles JSON without overwriting existing rows."""
+    from studybar import migrations
     conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT data FROM users WHERE id = ?", (student_id,))
-    row = cur.fetchone()
-    conn.close()
+    with conn:
+        migrations.import_profiles_json(conn.cursor(), json_path)
+
+
+@metrics.db_op
+def get_user(student_id: str) -> Dict[str, Any] | None:
+    row = get_conn().execute(SQL_GET_USER, (student_id,)).fetchone()
     if not row:
         return None
     return json.loads(row["data"]) if isinstance(row["data"], str) else row["data"]
 
 
+@metrics.db_op
 def upsert_user(student_id: str, data: Dict[str, Any]):
-    init_db()
+    """
+    Write a whole profile in the legacy shape; proficiencies go to their own
+    table. As before, the profile is replaced: topics it doesn't list are deleted.
+    """
+    data = dict(data)
+    profs = data.pop("proficiencies", None) or {}
+    now = datetime.now().isoformat()
     conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(
-        "INSERT OR REPLACE INTO users (id, data) VALUES (?, ?)",
-        (student_id, json.dumps(data)),
-    )
-    conn.commit()
-    conn.close()
+    with conn:
+        conn.execute(SQL_UPSERT_USER, (student_id, json.dumps(data)))
+        conn.execute(SQL_DELETE_OTHER_PROFICIENCIES, (student_id, json.dumps(list(profs))))
+        conn.executemany(
+            SQL_UPSERT_PROFICIENCY,
+            [(student_id, topic, float(level), now) for topic, level in profs.items()],
+        )
+
+
+# ---------- proficiencies ----------
+@metrics.db_op
+def get_proficiencies(student_id: str) -> Dict[str, float]:
+    rows = get_conn().execute(SQL_GET_PROFICIENCIES, (student_id,)).fetchall()
+    return {r["topic"]: float(r["level"]) for r in rows}
+
+
+@metrics.db_op
+def set_proficiency(student_id: str, topic: str, level: float, updated_at: str | None = None):
+    """Single-row upsert of one topic's level (and the user's last_activity)."""
+    updated_at = updated_at or datetime.now().isoformat()
+    conn = get_conn()
+    with conn:
+        conn.execute(SQL_ENSURE_USER, (student_id,))
+        conn.execute(SQL_UPSERT_PROFICIENCY, (student_id, topic, float(level), updated_at))
+        conn.execute(SQL_TOUCH_USER, (updated_at, student_id))
+
 
+@metrics.db_op
+def get_proficiency_rows(student_id: str) -> Dict[str, Dict[str, Any]]:
+    """{topic: {level, version, updated_at}} for version-checked writers."""
+    rows = get_conn().execute(SQL_GET_PROFICIENCY_ROWS, (student_id,)).fetchall()
+    return {r["topic"]: {"level": float(r["level"]), "version": r["version"], "updated_at": r["updated_at"]} for r in rows}
 
+
+@metrics.db_op
+def flush_proficiencies(updates: List[Dict[str, Any]], touches: Dict[str, str]) -> List[Dict[str, Any]]:
+    """
+    Apply a batch of buffered writes in one transaction.
+
+    updates: [{student_id, topic, level, updated_at, version}] where version
+             is the row version the writer last saw (0 = row didn't exist)
+    touches: {student_id: last_activity}
+
+    Each update only applies if the row is still at the expected version,
+    otherwise another worker wrote in between: the newer updated_at wins.
+    Returns the rows as stored, with their new versions.
+    """
+    stored = []
+    conn = get_conn()
+    with conn:
+        for student_id, last_activity in touches.items():
+            conn.execute(SQL_ENSURE_USER, (student_id,))
+            conn.execute(SQL_TOUCH_USER, (last_activity, student_id))
+        for u in updates:
+            key = (u["student_id"], u["topic"])
+            if u["version"] == 0:
+                applied = conn.execute(SQL_INSERT_PROFICIENCY_V, key + (u["level"], u["updated_at"])).rowcount
+            else:
+                applied = conn.execute(
+                    SQL_UPDATE_PROFICIENCY_IF_VERSION, (u["level"], u["updated_at"]) + key + (u["version"],)
+                ).rowcount
+            row = conn.execute(SQL_GET_PROFICIENCY_ROW, key).fetchone()
+            if not applied and (row["updated_at"] or "") < (u["updated_at"] or ""):
+                # conflict, but ours is newer: overwrite on top of their version
+                conn.execute(
+                    SQL_UPDATE_PROFICIENCY_IF_VERSION, (u["level"], u["updated_at"]) + key + (row["version"],)
+                )
+                row = conn.execute(SQL_GET_PROFICIENCY_ROW, key).fetchone()
+            stored.append({
+                "student_id": key[0], "topic": key[1], "level": float(row["level"]),
+                "version": row["version"], "updated_at": row["updated_at"], "conflict": not applied,
+            })
+    return stored
+
+
+@metrics.db_op
+def set_proficiencies_many(levels: List[tuple], updated_at: str | None = None):
+    """Upsert many (student_id, topic, level) rows in one transaction (batch recalibration)."""
+    updated_at = updated_at or datetime.now().isoformat()
+    conn = get_conn()
+    with conn:
+        conn.executemany(SQL_ENSURE_USER, [(sid,) for sid in {row[0] for row in levels}])
+        conn.executemany(
+            SQL_UPSERT_PROFICIENCY,
+            [(sid, topic, float(level), updated_at) for sid, topic, level in levels],
+        )
+
+
+@metrics.db_op
+def students_below(topic: str, threshold: float) -> List[Dict[str, Any]]:
+    """Students whose level on a topic is below threshold, weakest first (index range scan)."""
+    rows = get_conn().execute(SQL_STUDENTS_BELOW, (topic, float(threshold))).fetchall()
+    return [{"student_id": r["user_id"], "level": float(r["level"])} for r in rows]
+
+
+@metrics.db_op
+def proficiency_histogram(topic: str, bins: int = 10, student_ids: List[str] | None = None) -> List[int]:
+    """Count of students per level bin [i/bins, (i+1)/bins) on a topic, optionally within a class."""
+    ids = json.dumps(list(student_ids)) if student_ids is not None else None
+    counts = [0] * bins
+    for r in get_conn().execute(SQL_PROFICIENCY_HISTOGRAM, (bins, topic, ids)).fetchall():
+        counts[max(0, r["bin"])] += r["n"]
+    return counts
+
+
+@metrics.db_op
+def weakest_topics(student_ids: List[str] | None = None, limit: int = 5) -> List[Dict[str, Any]]:
+    """Topics with the lowest mean level, across everyone or a class."""
+    ids = json.dumps(list(student_ids)) if student_ids is not None else None
+    rows = get_conn().execute(SQL_WEAKEST_TOPICS, (ids, limit)).fetchall()
+    return [
+        {"topic": r["topic"], "mean_level": r["mean_level"], "min_level": r["min_level"], "students": r["students"]}
+        for r in rows
+    ]
+
+
+@metrics.db_op
 def list_chapters() -> List[Dict[str, str]]:
-    # seed chapters from test_pdfs if empty
-    init_db()
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT key, title FROM chapters")
-    rows = cur.fetchall()
-    if not rows:
-        # try to seed from ../data/test_pdfs
-        seed_dir = os.path.join(BASE_DIR, "data", "test_pdfs")
-        if os.path.exists(seed_dir):
-            for fname in os.listdir(seed_dir):
-                key = os.path.splitext(fname)[0]
-                title = key.replace("_", " ").title()
-                cur.execute("INSERT OR IGNORE INTO chapters (key, title) VALUES (?, ?)", (key, title))
-        # default fallback
-        cur.execute("INSERT OR IGNORE INTO chapters (key, title) VALUES (?, ?)", ("atomic_structure", "Atomic Structure"))
-        cur.execute("INSERT OR IGNORE INTO chapters (key, title) VALUES (?, ?)", ("energetics", "Energetics"))
-        conn.commit()
-        cur.execute("SELECT key, title FROM chapters")
-        rows = cur.fetchall()
-
-    chapters = [{"key": r["key"], "title": r["title"]} for r in rows]
-    conn.close()
-    return chapters
+    # chapters are seeded once, by migration 3
+    rows = get_conn().execute(SQL_LIST_CHAPTERS).fetchall()
+    return [{"key": r["key"], "title": r["title"]} for r in rows]
 
 
+@metrics.db_op
 def get_progress_for_user(student_id: str) -> List[Dict[str, Any]]:
-    init_db()
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(
-        "SELECT c.key, c.title, IFNULL(p.progress, 0) as progress FROM chapters c LEFT JOIN progress p ON c.key = p.chapter_key AND p.user_id = ?",
-        (student_id,)
-    )
-    rows = cur.fetchall()
-    conn.close()
+    rows = get_conn().execute(SQL_PROGRESS_FOR_USER, (student_id,)).fetchall()
     return [{"key": r["key"], "title": r["title"], "progress": float(r["progress"])} for r in rows]
 
 
+@metrics.db_op
 def set_progress(student_id: str, chapter_key: str, progress: float):
-    init_db()
     conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("INSERT OR REPLACE INTO progress (user_id, chapter_key, progress) VALUES (?, ?, ?)", (student_id, chapter_key, float(progress)))
-    conn.commit()
-    conn.close()
+    with conn:
+        conn.execute(SQL_SET_PROGRESS, (student_id, chapter_key, float(progress)))
+
+
+@metrics.db_op
+def set_progress_many(student_id: str, updates: Dict[str, float]):
+    """Write all of a session's chapter progress updates in one transaction."""
+    conn = get_conn()
+    with conn:
+        conn.executemany(
+            SQL_SET_PROGRESS,
+            [(student_id, chapter_key, float(progress)) for chapter_key, progress in updates.items()],
+        )
+
+
+@metrics.db_op
+def get_progress_for_users(student_ids: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+    """Progress per chapter for many students in one query: {student_id: [{key, title, progress}]}."""
+    result = {sid: [] for sid in student_ids}
+    rows = get_conn().execute(SQL_PROGRESS_FOR_USERS, (json.dumps(list(student_ids)),)).fetchall()
+    for r in rows:
+        result[r["user_id"]].append({"key": r["key"], "title": r["title"], "progress": float(r["progress"])})
+    return result
+
+
+@metrics.db_op
+def get_seen_problem_ids(student_id: str, topic: str) -> set:
+    rows = get_conn().execute(SQL_SEEN_PROBLEMS, (student_id, topic)).fetchall()
+    return {r["problem_id"] for r in rows}
+
+
+@metrics.db_op
+def mark_problems_seen(student_id: str, topic: str, problem_ids: List[str]):
+    conn = get_conn()
+    with conn:
+        conn.executemany(SQL_MARK_SEEN, [(student_id, topic, pid) for pid in problem_ids])
+
+
+# ---------- answer history ----------
+@metrics.db_op
+def record_answer(student_id: str, topic: str, score: float, q_type: str, level_before: float,
+                  answered_at: str | None = None):
+    conn = get_conn()
+    with conn:
+        conn.execute(SQL_INSERT_ANSWER, (student_id, topic, float(score), q_type, float(level_before),
+                                         answered_at or datetime.now().isoformat()))
+
+
+@metrics.db_op
+def answer_history(student_ids: List[str] | None = None) -> List[tuple]:
+    """(student_id, topic, score, q_type, level_before) for every answer, oldest first."""
+    ids = json.dumps(list(student_ids)) if student_ids is not None else None
+    cur = get_conn().cursor()
+    cur.row_factory = None  # plain tuples: this can be millions of rows
+    return cur.execute(SQL_ANSWER_HISTORY, (ids,)).fetchall()
+
+
+# ---------- flashcard reviews ----------
+@metrics.db_op
+def enroll_review_cards(student_id: str, deck: str, cards: List[tuple], ease: float) -> int:
+    """Add (card_id, due) rows for a deck, leaving cards already enrolled alone. Returns rows added."""
+    conn = get_conn()
+    with conn:
+        before = conn.total_changes
+        conn.executemany(SQL_ENROLL_REVIEW_CARD, [(student_id, deck, cid, due, ease) for cid, due in cards])
+        return conn.total_changes - before
+
+
+@metrics.db_op
+def get_review_card(student_id: str, deck: str, card_id: str) -> Dict[str, Any] | None:
+    row = get_conn().execute(SQL_GET_REVIEW_CARD, (student_id, deck, card_id)).fetchone()
+    return dict(row) if row else None
+
+
+@metrics.db_op
+def save_review(student_id: str, deck: str, card_id: str, state: Dict[str, Any]):
+    conn = get_conn()
+    with conn:
+        conn.execute(SQL_SAVE_REVIEW, (
+            state["due"], state["interval"], state["ease"], state["reps"], state["lapses"], state["last_review"],
+            student_id, deck, card_id,
+        ))
+
+
+@metrics.db_op
+def unenroll_review_card(student_id: str, deck: str, card_id: str):
+    conn = get_conn()
+    with conn:
+        conn.execute(SQL_UNENROLL_REVIEW_CARD, (student_id, deck, card_id))
+
+
+@metrics.db_op
+def review_queue(student_id: str, deck: str | None = None) -> List[tuple]:
+    """(due, deck, card_id) for all of a student's cards, optionally in one deck."""
+    cur = get_conn().cursor()
+    cur.row_factory = None
+    return cur.execute(SQL_REVIEW_QUEUE, (student_id, deck)).fetchall()
+
+
+@metrics.db_op
+def due_review_cards(student_id: str, until: float, limit: int, deck: str | None = None) -> List[Dict[str, Any]]:
+    rows = get_conn().execute(SQL_DUE_REVIEW_CARDS, (student_id, until, deck, limit)).fetchall()
+    return [dict(r) for r in rows]
+
+
+# ---------- flashcard jobs ----------
+def _job_row(row) -> Dict[str, Any]:
+    job = dict(row)
+    job["result"] = json.loads(job["result"]) if job["result"] else []
+    return job
+
+
+@metrics.db_op
+def create_flashcard_job(job_id: str, pdf_hash: str, owner: int) -> tuple:
+    """
+    Return (job, created). An existing queued/running/done job for the same
+    pdf is returned instead of creating a second one.
+    """
+    conn = get_conn()
+    row = conn.execute(SQL_FIND_FLASHCARD_JOB, (pdf_hash,)).fetchone()
+    if row:
+        return _job_row(row), False
+    with conn:
+        # the partial unique index makes this a no-op if another worker just queued one
+        created = conn.execute(SQL_INSERT_FLASHCARD_JOB, (job_id, pdf_hash, owner)).rowcount == 1
+    row = conn.execute(SQL_FIND_FLASHCARD_JOB, (pdf_hash,)).fetchone()
+    return _job_row(row), created
+
+
+@metrics.db_op
+def get_flashcard_job(job_id: str) -> Dict[str, Any] | None:
+    row = get_conn().execute(SQL_GET_FLASHCARD_JOB, (job_id,)).fetchone()
+    return _job_row(row) if row else None
+
+
+@metrics.db_op
+def claim_flashcard_job(job_id: str, owner: int) -> bool:
+    """Mark a queued job running; False if someone else already took it."""
+    conn = get_conn()
+    with conn:
+        return conn.execute(SQL_CLAIM_FLASHCARD_JOB, (owner, job_id)).rowcount == 1
+
+
+@metrics.db_op
+def adopt_flashcard_job(job_id: str, previous_owner: int | None, owner: int) -> bool:
+    """Take over an unfinished job from a dead worker and re-queue it."""
+    conn = get_conn()
+    with conn:
+        return conn.execute(SQL_ADOPT_FLASHCARD_JOB, (owner, job_id, previous_owner)).rowcount == 1
+
+
+@metrics.db_op
+def set_flashcard_job_progress(job_id: str, done: int, total: int, result: List[Dict[str, Any]]):
+    conn = get_conn()
+    with conn:
+        conn.execute(SQL_FLASHCARD_JOB_PROGRESS, (done, total, json.dumps(result, separators=(",", ":")), job_id))
+
+
+@metrics.db_op
+def finish_flashcard_job(job_id: str, result: List[Dict[str, Any]] | None = None, error: str | None = None,
+                         partial: bool = False):
+    """Mark a job done, failed (error), or partial (result and error: some batches failed)."""
+    status = "partial" if partial else "failed" if error else "done"
+    payload = json.dumps(result, separators=(",", ":")) if result is not None else None
+    conn = get_conn()
+    with conn:
+        conn.execute(SQL_FINISH_FLASHCARD_JOB, (status, payload, error, job_id))
+
+
+@metrics.db_op
+def unfinished_flashcard_jobs() -> List[Dict[str, Any]]:
+    rows = get_conn().execute(SQL_UNFINISHED_FLASHCARD_JOBS).fetchall()
+    return [dict(r) for r in rows]
+
+
+@metrics.db_op
+def acquire_flight(key: str, owner: int, lease: float) -> bool:
+    """Become the leader for a request fingerprint; False if another worker holds it."""
+    now = time.time()
+    conn = get_conn()
+    with conn:
+        conn.execute(SQL_PRUNE_FLIGHTS, (now,))
+        return conn.execute(SQL_ACQUIRE_FLIGHT, (key, owner, now + lease)).rowcount == 1
+
+
+@metrics.db_op
+def get_flight(key: str) -> Dict[str, Any] | None:
+    row = get_conn().execute(SQL_GET_FLIGHT, (key,)).fetchone()
+    return dict(row) if row else None
+
+
+@metrics.db_op
+def take_over_flight(key: str, previous_owner: int, owner: int, lease: float) -> bool:
+    """Take a running flight from a dead (or lease-expired) leader."""
+    conn = get_conn()
+    with conn:
+        return conn.execute(SQL_TAKE_OVER_FLIGHT, (owner, time.time() + lease, key, previous_owner)).rowcount == 1
+
+
+@metrics.db_op
+def finish_flight(key: str, owner: int, result: bytes, ttl: float):
+    conn = get_conn()
+    with conn:
+        conn.execute(SQL_FINISH_FLIGHT, (result, time.time() + ttl, key, owner))
+
+
+@metrics.db_op
+def release_flight(key: str, owner: int):
+    """Drop a flight without a result (the leader failed); waiters run the call themselves."""
+    conn = get_conn()
+    with conn:
+        conn.execute(SQL_RELEASE_FLIGHT, (key, owner))
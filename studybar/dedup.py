@@ -0,0 +1,132 @@
+# near-duplicate chunk elimination (MinHash + LSH banding)
+#
+# Study PDFs repeat running headers, footers, boxed summaries and recap pages.
+# Each chunk is reduced to a MinHash signature over word shingles; signatures
+# are split into bands and hashed into buckets, so only chunks sharing a
+# bucket are compared. A document is deduped in roughly linear time, and the
+# surviving chunk records every page its duplicates appeared on.
+
+import re
+import zlib
+
+from studybar.tokens import count_tokens
+
+SHINGLE_WORDS = 3
+NUM_PERM = 64
+BANDS = 16              # 16 bands x 4 rows: pairs above ~0.6 jaccard almost always collide
+THRESHOLD = 0.8         # estimated jaccard at which two chunks count as duplicates
+
+
+def _permutations(num_perm, seed=1):
+    # fixed odd multipliers/offsets so signatures are stable across runs;
+    # h -> (a*h + b) mod 2^64, top 32 bits (multiply-shift hashing)
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, 1 << 63, size=num_perm, dtype=np.uint64) | np.uint64(1)
+    b = rng.integers(0, 1 << 63, size=num_perm, dtype=np.uint64)
+    return a[:, None], b[:, None]
+
+
+_PERMS = {}
+
+
+HEADER_WORDS = 6        # lines this short may be running headers/footers
+
+_PAGE_REF = re.compile(r"\b(page|p|slide)\.?\s*\d+(\s*(of|/)\s*\d+)?\b")
+_EDGE_NUMBER = re.compile(r"^\d+\b|\b\d+$")
+
+
+def _normalize(text):
+    # page numbers and counters vary between otherwise identical headers, but
+    # any other number is content ("carbon 12" vs "carbon 14"), so only page
+    # references and a number leading or ending a short line are blanked
+    lines = []
+    for line in _PAGE_REF.sub("page 0", text.lower()).splitlines():
+        line = line.strip()
+        if len(line.split()) <= HEADER_WORDS:
+            line = _EDGE_NUMBER.sub("0", line)
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def shingles(text, k=SHINGLE_WORDS):
+    words = re.findall(r"\w+", _normalize(text))
+    if len(words) <= k:
+        return {zlib.crc32(" ".join(words).encode("utf-8"))}
+    return {zlib.crc32(" ".join(words[i:i + k]).encode("utf-8")) for i in range(len(words) - k + 1)}
+
+
+def minhash(shingle_set, num_perm=NUM_PERM):
+    perms = _PERMS.get(num_perm)
+    if perms is None:
+        perms = _PERMS[num_perm] = _permutations(num_perm)
+    a, b = perms
+    import numpy as np
+    h = np.fromiter(shingle_set, dtype=np.uint64, count=len(shingle_set))
+    # uint64 arithmetic wraps, which is exactly the mod 2^64 we want
+    return ((a * h + b) >> np.uint64(32)).min(axis=1)
+
+
+def estimated_jaccard(sig_a, sig_b):
+    import numpy as np
+    return float(np.count_nonzero(sig_a == sig_b)) / len(sig_a)
+
+
+def dedupe_chunks(chunks, threshold=THRESHOLD, num_perm=NUM_PERM, bands=BANDS):
+    """
+    Drop near-duplicate chunks, keeping the first occurrence of each.
+
+    Kept chunks are copies with "pages" (every page the text appeared on) and
+    "duplicate_ids" added. Returns (kept_chunks, report) where report has
+    chunk and token counts before/after and tokens_saved.
+    """
+    rows = num_perm // bands
+    buckets = {}      # (band, band_hash) -> [index into kept]
+    kept, sigs = [], []
+    tokens_in = tokens_out = 0
+
+    for c in chunks:
+        tokens = count_tokens(c["text"])
+        tokens_in += tokens
+        sig = minhash(shingles(c["text"]), num_perm)
+        keys = [(band, sig[band * rows:(band + 1) * rows].tobytes()) for band in range(bands)]
+
+        match = None
+        seen = set()
+        for key in keys:
+            for idx in buckets.get(key, ()):
+                if idx in seen:
+                    continue
+                seen.add(idx)
+                if estimated_jaccard(sig, sigs[idx]) >= threshold:
+                    match = idx
+                    break
+            if match is not None:
+                break
+
+        if match is not None:
+            original = kept[match]
+            if c.get("page") is not None and c["page"] not in original["pages"]:
+                original["pages"].append(c["page"])
+            original["duplicate_ids"].append(c.get("id"))
+            continue
+
+        item = dict(c)
+        item["pages"] = [c["page"]] if c.get("page") is not None else []
+        item["duplicate_ids"] = []
+        for key in keys:
+            buckets.setdefault(key, []).append(len(kept))
+        kept.append(item)
+        sigs.append(sig)
+        tokens_out += tokens
+
+    for item in kept:
+        item["pages"].sort()
+    report = {
+        "chunks_in": len(chunks),
+        "chunks_out": len(kept),
+        "tokens_in": tokens_in,
+        "tokens_out": tokens_out,
+        "tokens_saved": tokens_in - tokens_out,
+    }
+    return kept, report
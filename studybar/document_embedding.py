@@ -1,32 +1,24 @@
 # document -> embeddings for llm retrieval
 
-import fitz
-from openai import OpenAI
-from dotenv import load_dotenv
-import numpy as np
+# fitz, numpy and cv2 are imported inside the functions that use them, so
+# importing this module (every router does, indirectly) stays cheap.
+
 import os, json
-import cv2
+from typing import TYPE_CHECKING
+from studybar.dedup import dedupe_chunks
+from studybar import llm, metrics, single_flight
 
-load_dotenv()
+if TYPE_CHECKING:
+    import numpy as np
 
-# Create the OpenAI client lazily to avoid import-time crashes when
-# the installed openai/httpx versions are incompatible or when no
-# API key is configured. Functions that need the client will call
-# get_openai_client() and raise a descriptive error if it's not
-# available.
-_client = None
 
+# Requests go through the gateway in studybar/llm.py. get_openai_client()
+# checks the shared client can be created (API key configured, compatible
+# openai/httpx versions), returning None instead of raising.
 def get_openai_client():
-    global _client
-    if _client is not None:
-        return _client
     try:
-        _client = OpenAI()
-        return _client
+        return llm.get_client()
     except Exception as e:
-        # don't crash at import time; return None and let callers
-        # handle the missing client when they attempt to use embeddings.
-        _client = None
         print(f"[document_embedding] OpenAI client not available: {e}")
         return None
 
@@ -37,6 +29,10 @@ DATA_PATH = "/workspaces/studybar/studybar/data/embeddings"
 def process_pdf(pdf_path):
     bucket_name = os.path.splitext(os.path.basename(pdf_path))[0].lower().replace(" ", "_")
     chunks = extract_text_chunks(pdf_path)
+    # repeated headers/recap boxes would be embedded (and retrieved) many times
+    chunks, report = dedupe_chunks(chunks)
+    print(f"[DEDUP] {bucket_name}: {report['chunks_in']} -> {report['chunks_out']} chunks, "
+          f"{report['tokens_saved']} tokens saved")
     chunks = embed_chunks(chunks)
     save_embeddings(chunks, bucket_name)
     return bucket_name
@@ -44,6 +40,7 @@ def process_pdf(pdf_path):
 
 # pdf -> text chunks
 def extract_text_chunks(pdf_path):
+    import fitz
     doc = fitz.open(pdf_path)
     chunks = []
     for page_index, page in enumerate(doc):
@@ -69,44 +66,55 @@ def extract_text_chunks(pdf_path):
 def embed_chunks(chunks, model="text-embedding-3-large", batch_size=256):
     """
     Add an 'embedding' vector to each chunk in-place.
-    Uses the OpenAI Embeddings API via client.embeddings.create.
+    Uses the OpenAI Embeddings API through the llm gateway. Identical
+    concurrent calls (the same pdf processed twice at once) share one set of
+    requests.
     """
-    client = get_openai_client()
-    if client is None:
+    if get_openai_client() is None:
         raise RuntimeError("OpenAI client not available. Install/configure OpenAI SDK to use embeddings.")
 
     texts = [c["text"] for c in chunks]
-    for i in range(0, len(texts), batch_size):
-        batch_texts = texts[i : i + batch_size]
-        resp = client.embeddings.create(model=model, input=batch_texts)
-        for j, item in enumerate(resp.data):
-            emb = item.embedding
-            chunks[i + j]["embedding"] = np.array(emb, dtype=np.float32)
+    embeddings = single_flight.run(
+        "embed_chunks", [model, texts], lambda: _embed_texts(texts, model, batch_size)
+    )
+    for c, emb in zip(chunks, embeddings):
+        c["embedding"] = emb
     return chunks
 
 
+def _embed_texts(texts, model, batch_size):
+    import numpy as np
+    embeddings = []
+    for i in range(0, len(texts), batch_size):
+        resp = llm.embed(texts[i : i + batch_size], model=model, site="embed_chunks")
+        embeddings.extend(np.array(item.embedding, dtype=np.float32) for item in resp.data)
+    return embeddings
+
+
 # === single text -> embedding ===
 def embed_text(text: str, model="text-embedding-3-large"):
     """
     Generate an embedding vector for a single text string.
     """
+    import numpy as np
     if not text or not text.strip():
         return np.zeros(1536, dtype=np.float32)  # default vector length
-    client = get_openai_client()
-    if client is None:
+    if get_openai_client() is None:
         raise RuntimeError("OpenAI client not available. Install/configure OpenAI SDK to use embeddings.")
-    resp = client.embeddings.create(model=model, input=[text])
+    resp = llm.embed([text], model=model, site="embed_text")
     return np.array(resp.data[0].embedding, dtype=np.float32)
 
 
 # === image -> embedding ===
-def embed_image(image: np.ndarray, model="clip-embedding-3-large"):
+def embed_image(image: "np.ndarray", model="clip-embedding-3-large"):
     """
     Generate an embedding for an image (e.g. diagrams, sketches).
     The model name assumes an OpenAI or CLIP-style vision encoder.
     """
     import base64
     from io import BytesIO
+    import cv2
+    import numpy as np
     from PIL import Image
 
     # Convert image array to PNG bytes
@@ -120,24 +128,25 @@ def embed_image(image: np.ndarray, model="clip-embedding-3-large"):
     b64_img = base64.b64encode(buf.getvalue()).decode("utf-8")
 
     # Call embeddings endpoint with image input
-    client = get_openai_client()
-    if client is None:
+    if get_openai_client() is None:
         raise RuntimeError("OpenAI client not available. Install/configure OpenAI SDK to use image embeddings.")
 
-    resp = client.embeddings.create(
-        model=model,
-        input=[
+    resp = llm.embed(
+        [
             {
                 "type": "image",
                 "image": {"b64_json": b64_img}
             }
-        ]
+        ],
+        model=model,
+        site="embed_image",
     )
     return np.array(resp.data[0].embedding, dtype=np.float32)
 
 
 # save embeddings into buckets
 def save_embeddings(chunks, bucket_name):
+    import numpy as np
     path = os.path.join(DATA_PATH, f"{bucket_name}.json")
 
     serializable_chunks = []
@@ -155,6 +164,7 @@ def save_embeddings(chunks, bucket_name):
 
 # helper cosine similarity function for retrieval
 def _cosine_sim(a, b):
+    import numpy as np
     # small numerical safety
     an = np.linalg.norm(a)
     bn = np.linalg.norm(b)
@@ -168,10 +178,12 @@ class BucketedIndex:
     def __init__(self, data_path=DATA_PATH):
         self.data_path = data_path
         self.buckets = {}  # {topic_name: [chunks]}
+        self._matrices = {}  # {topic_name: row-normalised embedding matrix}
         self._load_all()
 
     def _load_all(self):
         """Load all embedding JSON files into memory."""
+        import numpy as np
         if not os.path.exists(self.data_path):
             os.makedirs(self.data_path, exist_ok=True)
         for fname in os.listdir(self.data_path):
@@ -222,4 +234,35 @@ class BucketedIndex:
             # Normal single-topic behavior
             return main_chunks
 
+    def _matrix(self, topic):
+        if topic not in self._matrices:
+            import numpy as np
+            m = np.stack([c["embedding"] for c in self.buckets[topic]]).astype(np.float32)
+            norms = np.linalg.norm(m, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            self._matrices[topic] = m / norms
+        return self._matrices[topic]
+
+    @metrics.timed("retrieval.search")
+    def search(self, topic, query_embedding, k=5):
+        """
+        Top-k chunks of a topic by cosine similarity to the query embedding.
+        Deterministic, unlike get_contexts, so identical questions retrieve
+        identical chunks. Each returned chunk carries a 'score'.
+        """
+        if topic not in self.buckets:
+            raise ValueError(f"No embeddings found for topic '{topic}'")
+        if not self.buckets[topic]:
+            return []
+        import numpy as np
+        q = np.asarray(query_embedding, dtype=np.float32)
+        qn = np.linalg.norm(q)
+        if qn == 0:
+            return []
+        scores = self._matrix(topic) @ (q / qn)
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [dict(self.buckets[topic][i], score=float(scores[i])) for i in top]
+
 
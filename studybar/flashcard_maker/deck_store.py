@@ -0,0 +1,205 @@
+# flashcard decks on disk (compressed) with an in-memory hot tier
+#
+# Decks are written once per pdf as gzipped compact JSON (<hash>.json.gz),
+# usually a fraction of the old pretty-printed files. Reads go through a small
+# LRU holding the decoded deck, its serialized JSON and an etag, so a class
+# deck that everyone is opening is served from memory without touching disk.
+# Cold decks are evicted from disk, least recently used first, once the store
+# passes its size budget. Legacy <hash>.json files (some ship with the repo)
+# are still readable: the first load writes a compact copy, which is preferred
+# from then on, but the legacy file itself is never modified or deleted. Reviews look cards up by id, so a
+# hot entry also keeps a card_id -> card map, built on first use and replaced
+# together with the entry when the deck is rewritten.
+
+import gzip, hashlib, json, os, threading, time
+from collections import OrderedDict
+
+from studybar import metrics
+
+STORE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "pdfs")
+MAX_STORE_BYTES = 512 * 1024 ** 2
+HOT_DECKS = 64
+TOUCH_INTERVAL = 3600.0  # refresh the on-disk mtime of hot decks at most hourly
+STALE_PART_SECONDS = 3600  # temp files older than this were left by a crashed write
+
+
+def card_id(card):
+    """Stable id for a card: its normalised term (merge_definitions keeps one card per term)."""
+    term = " ".join(str(card.get("term") or "").lower().split())
+    return hashlib.sha1(term.encode("utf-8")).hexdigest()[:16]
+
+
+class DeckStore:
+    def __init__(self, store_dir=STORE_DIR, max_bytes=MAX_STORE_BYTES, hot_decks=HOT_DECKS):
+        self.store_dir = store_dir
+        self.max_bytes = max_bytes
+        self.hot_decks = hot_decks
+        self._hot = OrderedDict()   # pdf_hash -> {"deck", "body", "etag", "touched", "cards"}
+        self._lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0, "evicted": 0}
+
+    def _path(self, pdf_hash):
+        return os.path.join(self.store_dir, f"{pdf_hash}.json.gz")
+
+    def _legacy_path(self, pdf_hash):
+        return os.path.join(self.store_dir, f"{pdf_hash}.json")
+
+    @staticmethod
+    def _entry(deck, body):
+        return {
+            "deck": deck,
+            "body": body,
+            "etag": '"' + hashlib.sha1(body).hexdigest()[:20] + '"',
+            "touched": time.time(),
+            "cards": None,
+        }
+
+    def _remember(self, pdf_hash, entry):
+        with self._lock:
+            self._hot[pdf_hash] = entry
+            self._hot.move_to_end(pdf_hash)
+            while len(self._hot) > self.hot_decks:
+                self._hot.popitem(last=False)
+
+    def _load(self, pdf_hash):
+        """Return the entry for a deck, reading disk only on a memory miss."""
+        with self._lock:
+            entry = self._hot.get(pdf_hash)
+            if entry is not None:
+                self._hot.move_to_end(pdf_hash)
+                self.stats["memory_hits"] += 1
+        if entry is not None:
+            metrics.cache_event("flashcard_decks", "memory")
+            if time.time() - entry["touched"] > TOUCH_INTERVAL:
+                # keep hot decks at the young end of the disk LRU
+                entry["touched"] = time.time()
+                try:
+                    os.utime(self._path(pdf_hash))
+                except FileNotFoundError:
+                    pass
+            return entry
+
+        path = self._path(pdf_hash)
+        try:
+            with gzip.open(path, "rb") as f:
+                body = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            body = self._load_legacy(pdf_hash)
+            if body is None:
+                self.stats["misses"] += 1
+                metrics.cache_event("flashcard_decks", "miss")
+                return None
+        except (OSError, EOFError):
+            print(f"[WARN] Deck file corrupt for {pdf_hash}. Ignoring.")
+            self.stats["misses"] += 1
+            return None
+
+        try:
+            deck = json.loads(body)
+        except json.JSONDecodeError:
+            print(f"[WARN] Deck file corrupt for {pdf_hash}. Ignoring.")
+            self.stats["misses"] += 1
+            return None
+        self.stats["disk_hits"] += 1
+        metrics.cache_event("flashcard_decks", "disk")
+        entry = self._entry(deck, body)
+        self._remember(pdf_hash, entry)
+        return entry
+
+    def _load_legacy(self, pdf_hash):
+        legacy = self._legacy_path(pdf_hash)
+        if not os.path.exists(legacy):
+            return None
+        try:
+            with open(legacy, "r", encoding="utf-8") as f:
+                deck = json.load(f)
+        except json.JSONDecodeError:
+            return None
+        # the next read takes the compact path; the legacy file stays as it is
+        return self._write(pdf_hash, deck)
+
+    def _write(self, pdf_hash, deck):
+        os.makedirs(self.store_dir, exist_ok=True)
+        body = json.dumps(deck, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        path = self._path(pdf_hash)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+        with gzip.open(tmp, "wb", compresslevel=6) as f:
+            f.write(body)
+        os.replace(tmp, path)
+        return body
+
+    # ---------- public ----------
+    def get(self, pdf_hash):
+        """The deck (list of cards) for a pdf, or None."""
+        entry = self._load(pdf_hash)
+        return entry["deck"] if entry else None
+
+    def cards(self, pdf_hash):
+        """{card_id: card} for a pdf's deck, or None; built once per loaded deck."""
+        entry = self._load(pdf_hash)
+        if entry is None:
+            return None
+        if entry["cards"] is None:
+            # concurrent first calls may both build it; they build the same map
+            entry["cards"] = {card_id(c): c for c in entry["deck"]}
+        return entry["cards"]
+
+    def get_serialized(self, pdf_hash):
+        """(json_bytes, etag) for a pdf's deck, or (None, None); what the api serves."""
+        entry = self._load(pdf_hash)
+        if entry is None:
+            return None, None
+        return entry["body"], entry["etag"]
+
+    def put(self, pdf_hash, deck):
+        body = self._write(pdf_hash, deck)
+        self._remember(pdf_hash, self._entry(deck, body))
+        self.stats["writes"] += 1
+        self.prune()
+        return self._path(pdf_hash)
+
+    def prune(self):
+        """Delete least recently used compact decks (and stale temp files) beyond max_bytes; legacy files are kept."""
+        if not os.path.exists(self.store_dir):
+            return 0
+        entries = []
+        now = time.time()
+        removed = 0
+        for fname in os.listdir(self.store_dir):
+            is_part = fname.endswith(".part")
+            if not (is_part or fname.endswith(".json.gz")):
+                continue
+            path = os.path.join(self.store_dir, fname)
+            try:
+                st = os.stat(path)
+                if is_part:
+                    # a write in progress, or one whose process died before the rename
+                    if now - st.st_mtime > STALE_PART_SECONDS:
+                        os.remove(path)
+                        removed += 1
+                    continue
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                removed += 1
+            except FileNotFoundError:
+                pass
+        self.stats["evicted"] += removed
+        return removed
+
+    def hot_count(self):
+        with self._lock:
+            return len(self._hot)
+
+
+# one store per process
+DECK_STORE = DeckStore()
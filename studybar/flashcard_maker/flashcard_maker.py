@@ -1,38 +1,31 @@
 # pdf text chunks -> flashcards
-import sys
-import os
-
-# --- PATH MODIFICATION TO IMPORT FROM PARENT DIRECTORY ---
-# 1. Get the absolute path of the current file's directory (flashcard_maker/)
-current_dir = os.path.dirname(os.path.abspath(__file__))
-
-# 2. Get the parent directory (studybar/)
-parent_dir = os.path.dirname(current_dir)
-
-# 3. Add the parent directory to sys.path
-sys.path.append(parent_dir)
-
-from document_embedding import extract_text_chunks, get_openai_client
 
 import re, json, os, hashlib, time
-from dotenv import load_dotenv
-
-load_dotenv()
-
-# Use OpenAI client lazily via document_embedding.get_openai_client to avoid
-# creating the client at import time (which can crash if SDK versions mismatch).
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from studybar.document_embedding import extract_text_chunks, get_openai_client
+from studybar.tokens import count_tokens
+from studybar.dedup import dedupe_chunks
+from studybar.flashcard_maker.deck_store import DECK_STORE
+from studybar import llm, metrics, single_flight
 
 # ----------- Directory Setup -----------
 BASE_DIR = "/workspaces/studybar/studybar/flashcard_maker"
-CACHE_DIR = os.path.join(BASE_DIR, "cache", "pdfs")
-os.makedirs(CACHE_DIR, exist_ok=True)
+CHUNK_CACHE_DIR = os.path.join(BASE_DIR, "cache", "chunks")  # created on first write
+# whole-pdf decks live in deck_store.DECK_STORE (cache/pdfs)
+
+# ----------- LLM fan-out limits -----------
+BATCH_TOKEN_BUDGET = 1500   # candidate text per request
+LLM_MAX_CONCURRENCY = 4     # requests in flight per PDF
 
 
 # caching helpers
-def file_hash(pdf_path):
-    """Compute a stable hash based on PDF content."""
+def file_hash(pdf_path, chunk_size=1024 * 1024):
+    """Compute a stable hash based on PDF content (streamed, constant memory)."""
+    sha = hashlib.sha1()
     with open(pdf_path, "rb") as f:
-        return hashlib.sha1(f.read()).hexdigest()
+        for block in iter(lambda: f.read(chunk_size), b""):
+            sha.update(block)
+    return sha.hexdigest()
 
 
 def chunk_hash(text):
@@ -40,27 +33,40 @@ def chunk_hash(text):
     return hashlib.sha256(text.strip().encode("utf-8")).hexdigest()
 
 
-def load_cache(pdf_path):
-    """Load cached LLM results for a given PDF."""
-    h = file_hash(pdf_path)
-    cache_file = os.path.join(CACHE_DIR, f"{h}.json")
-    if os.path.exists(cache_file):
+def load_cache(pdf_path, pdf_hash=None):
+    """Load cached LLM results for a given PDF. Pass pdf_hash to skip re-hashing the file."""
+    h = pdf_hash or file_hash(pdf_path)
+    data = DECK_STORE.get(h)
+    if data is not None:
+        print(f"[CACHE] Loaded results for {h}")
+    return data
+
+
+def save_cache(pdf_path, data, pdf_hash=None):
+    """Save extracted definitions for this PDF. Pass pdf_hash to skip re-hashing the file."""
+    h = pdf_hash or file_hash(pdf_path)
+    cache_file = DECK_STORE.put(h, data)
+    print(f"[CACHE] Saved LLM output to {cache_file}")
+
+
+def load_chunk_cache(h):
+    """Definitions previously extracted from a chunk with this text hash (None if never seen)."""
+    cache_file = os.path.join(CHUNK_CACHE_DIR, f"{h}.json")
+    if not os.path.exists(cache_file):
+        return None
+    try:
         with open(cache_file, "r", encoding="utf-8") as f:
-            try:
-                print(f"[CACHE] Loaded results for {os.path.basename(pdf_path)}")
-                return json.load(f)
-            except json.JSONDecodeError:
-                print(f"[WARN] Cache file corrupt for {pdf_path}. Ignoring.")
-    return None
-
-
-def save_cache(pdf_path, data):
-    """Save extracted definitions for this PDF."""
-    h = file_hash(pdf_path)
-    cache_file = os.path.join(CACHE_DIR, f"{h}.json")
+            return json.load(f)
+    except json.JSONDecodeError:
+        return None
+
+
+def save_chunk_cache(h, definitions):
+    # store only term/definition; page and source_id depend on where the chunk appears
+    os.makedirs(CHUNK_CACHE_DIR, exist_ok=True)
+    cache_file = os.path.join(CHUNK_CACHE_DIR, f"{h}.json")
     with open(cache_file, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-    print(f"[CACHE] Saved LLM output to {cache_file}")
+        json.dump([{"term": d.get("term"), "definition": d.get("definition")} for d in definitions], f, ensure_ascii=False)
 
 
 def filter_definition_like(chunks):
@@ -71,13 +77,7 @@ def filter_definition_like(chunks):
 
 
 # ----------- LLM Filter + Cache Integration -----------
-def llm_filter(candidates, pdf_path):
-    """LLM filter for definitions with per-PDF caching."""
-    cached = load_cache(pdf_path)
-    if cached:
-        return cached
-
-    system_prompt = """
+SYSTEM_PROMPT = """
 You are a precise academic extractor.
 Given raw text chunks from a study PDF, extract only *definitions* of terms or concepts.
 Rules:
@@ -90,34 +90,152 @@ Rules:
 No text outside the JSON.
 """
 
+
+def batch_by_tokens(chunks, budget=BATCH_TOKEN_BUDGET):
+    """Group chunks into batches whose text fits the token budget (an oversized chunk goes alone)."""
+    batches, current, used = [], [], 0
+    for c in chunks:
+        cost = count_tokens(c["text"]) + 12  # + the "[id | page n]" header
+        if current and used + cost > budget:
+            batches.append(current)
+            current, used = [], 0
+        current.append(c)
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _extract_batch(batch):
     user_prompt = "\n\n".join(
         f"[{c['id']} | page {c['page']}]\n{c['text']}"
-        for c in candidates
+        for c in batch
     )
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": user_prompt}
+    ]
+    response = llm.chat(messages, model="gpt-4o-mini", site="flashcards")
+    raw_output = response.choices[0].message.content.strip()
+    match = re.search(r'(\[.*\])', raw_output, re.S)
+    return json.loads(match.group(1)) if match else []
+
+
+class IncompleteDeck(Exception):
+    """Some LLM batches failed; `definitions` holds what the rest extracted."""
+
+    def __init__(self, definitions, failed, batches):
+        super().__init__(f"{failed} of {batches} LLM batches failed; the deck is incomplete")
+        self.definitions = definitions
+
+
+def _term_key(term):
+    return " ".join(str(term or "").lower().split())
 
-    print(f"[LLM] Sending {len(candidates)} candidate chunks to GPT...")
-    client = get_openai_client()
-    if client is None:
-        raise RuntimeError("OpenAI client not available. Configure OpenAI SDK to enable LLM-powered flashcard extraction.")
-
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
-        ]
+
+def merge_definitions(definitions):
+    """Dedupe by normalised term, keeping the earliest page's definition."""
+    merged = {}
+    for d in sorted(definitions, key=lambda d: (d.get("page") or 0)):
+        key = _term_key(d.get("term"))
+        if key and key not in merged:
+            merged[key] = d
+    return list(merged.values())
+
+
+@metrics.timed("flashcards.llm_filter")
+def llm_filter(candidates, pdf_path, pdf_hash=None, max_workers=LLM_MAX_CONCURRENCY, on_progress=None):
+    """
+    LLM filter for definitions, cached per PDF and per chunk.
+    Only chunks whose text has never been seen go to the LLM, in token-budgeted
+    batches run concurrently; a revised PDF only pays for its changed chunks.
+    on_progress(definitions_so_far, chunks_done, chunks_total) is called as batches finish.
+    Raises IncompleteDeck, carrying the partial deck, if any batch failed.
+    """
+    # hash the file at most once for both the cache lookup and the save
+    pdf_hash = pdf_hash or file_hash(pdf_path)
+    cached = load_cache(pdf_path, pdf_hash=pdf_hash)
+    if cached:
+        return cached
+
+    # simultaneous uploads of the same pdf share one extraction (in any worker);
+    # only the caller that runs it gets on_progress calls
+    key = [pdf_hash, [(c["id"], c["page"], chunk_hash(c["text"])) for c in candidates]]
+    return single_flight.run(
+        "llm_filter", key, lambda: _extract_definitions(candidates, pdf_path, pdf_hash, max_workers, on_progress)
     )
 
-    raw_output = response.choices[0].message.content.strip()
-    match = re.search(r'(\[.*\])', raw_output, re.S)
-    data = json.loads(match.group(1)) if match else []
 
-    save_cache(pdf_path, data)
+def _extract_definitions(candidates, pdf_path, pdf_hash, max_workers, on_progress):
+    definitions = []
+    uncached = []
+    for c in candidates:
+        h = chunk_hash(c["text"])
+        hit = load_chunk_cache(h)
+        if hit is None:
+            uncached.append((h, c))
+        else:
+            definitions.extend(dict(d, page=c["page"], source_id=c["id"]) for d in hit)
+    print(f"[CACHE] {len(candidates) - len(uncached)}/{len(candidates)} candidate chunks cached")
+    metrics.cache_event("flashcard_chunks", "hit", len(candidates) - len(uncached))
+    metrics.cache_event("flashcard_chunks", "miss", len(uncached))
+    done = len(candidates) - len(uncached)
+    if on_progress:
+        on_progress(merge_definitions(definitions), done, len(candidates))
+
+    if uncached:
+        if get_openai_client() is None:
+            raise RuntimeError("OpenAI client not available. Configure OpenAI SDK to enable LLM-powered flashcard extraction.")
+
+        hashes = {c["id"]: h for h, c in uncached}
+        batches = batch_by_tokens([c for _, c in uncached])
+        print(f"[LLM] Sending {len(uncached)} chunks to GPT in {len(batches)} batches...")
+        failed = 0
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = {pool.submit(_extract_batch, batch): batch for batch in batches}
+            for future in as_completed(futures):
+                batch = futures[future]
+                try:
+                    found = future.result()
+                except Exception as e:
+                    # leave these chunks uncached so the next run retries them
+                    failed += 1
+                    print(f"[WARN] LLM batch of {len(batch)} chunks failed: {e}")
+                    done += len(batch)
+                    continue
+                by_chunk = {c["id"]: [] for c in batch}
+                unattributed = 0
+                for d in found:
+                    source = str(d.get("source_id") or "")
+                    if source in by_chunk:
+                        by_chunk[source].append(d)
+                    elif len(batch) == 1:
+                        by_chunk[batch[0]["id"]].append(d)
+                    else:
+                        unattributed += 1
+                if unattributed:
+                    # can't tell which chunk these came from, so an empty list
+                    # cached for any of them might be wrong: retry the batch next run
+                    print(f"[WARN] {unattributed} definitions had no known source_id; batch not cached")
+                else:
+                    for chunk_id, defs in by_chunk.items():
+                        save_chunk_cache(hashes[chunk_id], defs)
+                definitions.extend(found)
+                done += len(batch)
+                if on_progress:
+                    on_progress(merge_definitions(definitions), done, len(candidates))
+        if failed:
+            # don't pin an incomplete result to this PDF
+            raise IncompleteDeck(merge_definitions(definitions), failed, len(batches))
+
+    data = merge_definitions(definitions)
+    save_cache(pdf_path, data, pdf_hash=pdf_hash)
     return data
 
 
 # ----------- Flashcard Generation -----------
-def make_flashcards(chunks, pdf_path=None):
+@metrics.timed("flashcards.make_flashcards")
+def make_flashcards(chunks, pdf_path=None, pdf_hash=None, on_progress=None):
     # limit on length
     filtered_chunks = []
     for chunk in chunks:
@@ -125,9 +243,13 @@ def make_flashcards(chunks, pdf_path=None):
             filtered_chunks.append(chunk)
     print(f"[INFO] Extracted {len(filtered_chunks)} text chunks from PDF")
 
+    # headers, footers and recap pages would otherwise be sent to the LLM repeatedly
+    filtered_chunks, report = dedupe_chunks(filtered_chunks)
+    print(f"[DEDUP] {report['chunks_in']} -> {report['chunks_out']} chunks, {report['tokens_saved']} tokens saved")
+
     candidates = filter_definition_like(filtered_chunks)
     print(f"[INFO] {len(candidates)} candidate chunks likely contain definitions")
-    definitions = llm_filter(candidates, pdf_path)
+    definitions = llm_filter(candidates, pdf_path, pdf_hash=pdf_hash, on_progress=on_progress)
     print(f"[INFO] {len(definitions)} definitions extracted")
     print(json.dumps(definitions, indent=2, ensure_ascii=False))
     return definitions
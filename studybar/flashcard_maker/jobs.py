@@ -0,0 +1,135 @@
+# flashcard generation as background jobs
+#
+# POST /generate only stores the upload and queues a job; parsing and the LLM
+# calls run here on a small, bounded thread pool. Job state lives in sqlite
+# (flashcard_jobs, see migrations.py) so any worker can answer status polls,
+# uploads of the same pdf share one job, and jobs left unfinished by a worker
+# that died are picked up again by the next one to start. A job some of whose
+# LLM batches failed ends as "partial": its cards are shown, but the next
+# upload of the pdf starts a new job rather than reusing it.
+
+import os, threading, time, uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from studybar import db, metrics
+from studybar.flashcard_maker import pdf_store
+from studybar.flashcard_maker.flashcard_maker import IncompleteDeck, extract_text_chunks, make_flashcards
+
+# statuses a job never leaves; the api reports "finished" from this so clients
+# (ui/src/components/Chat/ChatWindow.tsx) don't keep their own list
+FINISHED_STATUSES = ("done", "partial", "failed")
+
+MAX_WORKERS = int(os.getenv("STUDYBAR_FLASHCARD_WORKERS", "2"))
+PROGRESS_INTERVAL = 1.0  # seconds between partial-result writes
+
+
+def _alive(pid):
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobQueue:
+    def __init__(self, max_workers=MAX_WORKERS):
+        self.max_workers = max_workers
+        self._executor = None
+        self._pid = None
+        self._active = set()
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        # created lazily, and per process (forked workers don't inherit threads)
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="flashcards")
+                self._pid = os.getpid()
+                self._active = set()
+            return self._executor
+
+    def _enqueue(self, job_id, pdf_hash):
+        pool = self._pool()
+        with self._lock:
+            if job_id in self._active:
+                return
+            self._active.add(job_id)
+        pool.submit(self._run, job_id, pdf_hash)
+
+    def submit(self, pdf_hash):
+        """Queue generation for a stored pdf. Returns the (possibly shared) job."""
+        job, created = db.create_flashcard_job(uuid.uuid4().hex, pdf_hash, os.getpid())
+        if created:
+            self._enqueue(job["id"], pdf_hash)
+        return job
+
+    def get(self, job_id):
+        return db.get_flashcard_job(job_id)
+
+    def resume(self):
+        """Re-queue jobs whose worker is gone (restart, crash). Returns how many were adopted."""
+        me = os.getpid()
+        adopted = 0
+        for job in db.unfinished_flashcard_jobs():
+            owner = job["owner"]
+            if owner != me and _alive(owner):
+                continue
+            if owner == me and job["id"] in self._active:
+                continue
+            # atomic: of several workers starting together only one adopts each job
+            if db.adopt_flashcard_job(job["id"], owner, me):
+                self._enqueue(job["id"], job["pdf_hash"])
+                adopted += 1
+        if adopted:
+            print(f"[JOBS] Resumed {adopted} flashcard jobs")
+        return adopted
+
+    def _run(self, job_id, pdf_hash):
+        try:
+            if not db.claim_flashcard_job(job_id, os.getpid()):
+                return
+            pdf_path = pdf_store.path_for(pdf_hash)
+            if not os.path.exists(pdf_path):
+                db.finish_flashcard_job(job_id, error="Uploaded PDF is no longer available; please upload it again.")
+                return
+
+            last_write = [0.0]
+
+            def on_progress(definitions, done, total):
+                # partial cards for pollers, rate-limited so big PDFs don't hammer the db
+                now = time.time()
+                if done < total and now - last_write[0] < PROGRESS_INTERVAL:
+                    return
+                last_write[0] = now
+                db.set_flashcard_job_progress(job_id, done, total, definitions)
+
+            with metrics.span("flashcards.extract_text_chunks"):
+                chunks = extract_text_chunks(pdf_path)
+            data = make_flashcards(chunks, pdf_path=pdf_path, pdf_hash=pdf_hash, on_progress=on_progress)
+            db.finish_flashcard_job(job_id, result=data)
+        except IncompleteDeck as e:
+            # served to this job's pollers, but never reused: the next upload retries
+            print(f"[WARN] Flashcard job {job_id} is partial: {e}")
+            db.finish_flashcard_job(job_id, result=e.definitions, error=str(e), partial=True)
+        except Exception as e:
+            print(f"[WARN] Flashcard job {job_id} failed: {e}")
+            db.finish_flashcard_job(job_id, error=str(e))
+        finally:
+            with self._lock:
+                self._active.discard(job_id)
+
+    def shutdown(self):
+        # unfinished jobs stay queued/running in the db and are resumed on restart
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+# one queue per process
+JOB_QUEUE = JobQueue()
+metrics.QUEUE_DEPTH.track(lambda: len(JOB_QUEUE._active), queue="flashcard_jobs")
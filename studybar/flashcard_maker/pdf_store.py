@@ -0,0 +1,97 @@
+# uploaded pdfs -> content-addressed files on disk
+#
+# Uploads are streamed to disk in fixed-size chunks while being hashed, so a
+# large textbook never sits in memory and is read exactly once. The file is
+# then stored under its sha1 (the same hash the flashcard cache is keyed by),
+# identical uploads share one copy, and the least recently used files are
+# pruned when the store grows past its size budget.
+
+import os, hashlib, tempfile, time
+
+STORE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "uploads")
+CHUNK_SIZE = 1024 * 1024
+MAX_STORE_BYTES = 2 * 1024 ** 3
+STALE_PART_SECONDS = 3600
+
+
+def path_for(pdf_hash, store_dir=STORE_DIR):
+    return os.path.join(store_dir, f"{pdf_hash}.pdf")
+
+
+async def store_upload(upload, store_dir=STORE_DIR, chunk_size=CHUNK_SIZE):
+    """
+    Stream a FastAPI UploadFile into the store.
+    Returns (pdf_hash, path); the hash is passed down so nothing re-reads the file.
+    """
+    # hashing and disk writes block, so they run off the event loop
+    from fastapi.concurrency import run_in_threadpool
+
+    try:
+        return await run_in_threadpool(store_file, upload.file, store_dir, chunk_size)
+    finally:
+        await upload.close()
+
+
+def store_file(src, store_dir=STORE_DIR, chunk_size=CHUNK_SIZE):
+    """Copy a binary file object into the store, hashing as it goes. Returns (pdf_hash, path)."""
+    os.makedirs(store_dir, exist_ok=True)
+    sha = hashlib.sha1()
+    # temp file in the store dir so the final rename is atomic
+    fd, tmp_path = tempfile.mkstemp(suffix=".part", dir=store_dir)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = src.read(chunk_size)
+                if not chunk:
+                    break
+                sha.update(chunk)
+                out.write(chunk)
+        pdf_hash = sha.hexdigest()
+        final_path = path_for(pdf_hash, store_dir)
+        if os.path.exists(final_path):
+            # already stored: drop the duplicate, mark the original as recently used
+            os.remove(tmp_path)
+            os.utime(final_path)
+        else:
+            os.replace(tmp_path, final_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    prune(store_dir)
+    return pdf_hash, final_path
+
+
+def prune(store_dir=STORE_DIR, max_bytes=MAX_STORE_BYTES):
+    """Delete least recently used pdfs (and stale partial uploads) beyond max_bytes."""
+    if not os.path.exists(store_dir):
+        return 0
+    entries = []
+    now = time.time()
+    removed = 0
+    for fname in os.listdir(store_dir):
+        path = os.path.join(store_dir, fname)
+        try:
+            st = os.stat(path)
+            if fname.endswith(".part"):
+                # an upload in progress, or one that died mid-stream
+                if now - st.st_mtime > STALE_PART_SECONDS:
+                    os.remove(path)
+                    removed += 1
+                continue
+        except FileNotFoundError:
+            continue
+        entries.append((st.st_mtime, st.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+            removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
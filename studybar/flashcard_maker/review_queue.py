@@ -0,0 +1,195 @@
+# spaced-repetition reviews: SM-2 scheduling over an indexed due queue
+#
+# Every (student, deck, card) a student has enrolled has a row in sqlite's
+# review_cards table with its SM-2 state and next due time (unix seconds),
+# indexed by (user_id, due) so a day's review batch is one range scan.
+# Students who are actively reviewing also get an in-memory min-heap of their
+# cards by due time: next_card() peeks the earliest live entry and
+# record_review() writes the new state and pushes one entry, both O(log n).
+# Superseded heap entries are skipped lazily and compacted away once they
+# outnumber live ones. Another worker may review the same student, so
+# next_card() checks the card's row (a primary-key lookup) before returning
+# it. It also skips cards whose deck no longer has them: a card dropped from a
+# regenerated deck is unenrolled, while those of a deck that is gone from the
+# store keep their rows in case the pdf is generated again. Heaps of idle
+# students are dropped least recently used first.
+
+import heapq, threading, time
+from collections import OrderedDict
+
+from studybar import db, metrics
+from studybar.flashcard_maker.deck_store import DECK_STORE, card_id
+
+DAY = 86400.0
+MAX_ACTIVE_QUEUES = 128     # (student, deck) heaps kept in memory
+START_EASE = 2.5
+MIN_EASE = 1.3
+PASS_GRADE = 3              # SM-2 grades are 0-5; below this the card is relearned
+
+
+def schedule(state, grade, now):
+    """SM-2: the card's next {due, interval (days), ease, reps, lapses, last_review} after a review."""
+    reps, interval, lapses = state["reps"], state["interval"], state["lapses"]
+    ease = max(MIN_EASE, state["ease"] + 0.1 - (5 - grade) * (0.08 + (5 - grade) * 0.02))
+    if grade < PASS_GRADE:
+        reps, interval = 0, 1.0
+        lapses += 1
+    else:
+        reps += 1
+        interval = 1.0 if reps == 1 else 6.0 if reps == 2 else round(interval * ease)
+    return {
+        "due": now + interval * DAY,
+        "interval": interval,
+        "ease": round(ease, 4),
+        "reps": reps,
+        "lapses": lapses,
+        "last_review": now,
+    }
+
+
+class _Queue:
+    """Min-heap of (due, deck, card_id) with lazy deletion; `due` holds each card's live entry."""
+    __slots__ = ("heap", "due", "lock", "loaded")
+
+    def __init__(self):
+        self.heap = []
+        self.due = {}
+        self.lock = threading.Lock()
+        self.loaded = False
+
+    def load(self, rows):
+        self.heap = [tuple(r) for r in rows]
+        heapq.heapify(self.heap)
+        self.due = {(deck, cid): due for due, deck, cid in self.heap}
+        self.loaded = True
+
+    def push(self, deck, cid, due):
+        self.due[(deck, cid)] = due
+        heapq.heappush(self.heap, (due, deck, cid))
+        if len(self.heap) > 2 * len(self.due) + 64:
+            self.heap = [(d, deck, c) for (deck, c), d in self.due.items()]
+            heapq.heapify(self.heap)
+
+    def drop(self, deck, cid):
+        self.due.pop((deck, cid), None)
+
+    def peek(self):
+        while self.heap:
+            due, deck, cid = self.heap[0]
+            if self.due.get((deck, cid)) == due:
+                return self.heap[0]
+            heapq.heappop(self.heap)
+        return None
+
+
+class ReviewQueue:
+    def __init__(self, max_active=MAX_ACTIVE_QUEUES):
+        self.max_active = max_active
+        self._queues = OrderedDict()   # (student_id, deck or None) -> _Queue
+        self._lock = threading.Lock()
+        self.stats = {"loads": 0, "hits": 0, "reviews": 0, "stale": 0, "orphaned": 0}
+
+    def _queue(self, student_id, deck):
+        key = (student_id, deck)
+        with self._lock:
+            q = self._queues.get(key)
+            if q is not None:
+                self._queues.move_to_end(key)
+                self.stats["hits"] += 1
+                metrics.cache_event("review_queues", "hit")
+                return q
+            q = self._queues[key] = _Queue()
+            while len(self._queues) > self.max_active:
+                self._queues.popitem(last=False)
+        metrics.cache_event("review_queues", "miss")
+        return q
+
+    def _loaded(self, student_id):
+        with self._lock:
+            return [q for (sid, _), q in self._queues.items() if sid == student_id]
+
+    # ---------- public ----------
+    def enroll(self, student_id, pdf_hash, cards, now=None):
+        """Start reviewing a deck: its cards not yet enrolled are due now, in deck order. Returns how many."""
+        now = time.time() if now is None else now
+        # a microsecond apart so new cards come up in the order they appear in the deck
+        added = db.enroll_review_cards(
+            student_id, pdf_hash, [(card_id(c), now + i * 1e-6) for i, c in enumerate(cards)], START_EASE
+        )
+        if added:
+            with self._lock:
+                for key in [k for k in self._queues if k[0] == student_id]:
+                    del self._queues[key]   # reloaded with the new cards on next use
+        return added
+
+    def next_card(self, student_id, deck=None, now=None):
+        """
+        The student's earliest-due card (its review_cards row, plus "is_due"),
+        optionally within one deck; None if nothing is enrolled.
+        """
+        now = time.time() if now is None else now
+        q = self._queue(student_id, deck)
+        with q.lock:
+            if not q.loaded:
+                q.load(db.review_queue(student_id, deck))
+                self.stats["loads"] += 1
+            while True:
+                top = q.peek()
+                if top is None:
+                    return None
+                due, card_deck, cid = top
+                row = db.get_review_card(student_id, card_deck, cid)
+                if row is None:
+                    q.drop(card_deck, cid)
+                elif row["due"] != due:
+                    # reviewed in another worker since we loaded
+                    self.stats["stale"] += 1
+                    q.push(card_deck, cid, row["due"])
+                else:
+                    cards = DECK_STORE.cards(card_deck)   # cached map: a dict lookup, not a deck scan
+                    if cards is not None and cid in cards:
+                        return dict(row, is_due=due <= now)
+                    # can't be shown, and would otherwise block every card behind it
+                    self.stats["orphaned"] += 1
+                    q.drop(card_deck, cid)
+                    if cards is not None:
+                        db.unenroll_review_card(student_id, card_deck, cid)
+
+    def record_review(self, student_id, pdf_hash, cid, grade, now=None):
+        """Apply an SM-2 grade (0-5) to a card; returns its new state, or None if not enrolled."""
+        now = time.time() if now is None else now
+        row = db.get_review_card(student_id, pdf_hash, cid)
+        if row is None:
+            return None
+        state = schedule(row, grade, now)
+        db.save_review(student_id, pdf_hash, cid, state)
+        self.stats["reviews"] += 1
+        for q in self._loaded(student_id):
+            with q.lock:
+                # a queue not loaded yet reads the saved row when it is
+                if q.loaded and (pdf_hash, cid) in q.due:
+                    q.push(pdf_hash, cid, state["due"])
+        return dict(state, deck=pdf_hash, card_id=cid)
+
+    def due_batch(self, student_id, until=None, limit=200, deck=None):
+        """Cards due by `until` (default: a day from now), earliest first, in one indexed query."""
+        until = time.time() + DAY if until is None else until
+        return db.due_review_cards(student_id, until, limit, deck)
+
+    def active_count(self):
+        with self._lock:
+            return len(self._queues)
+
+
+def with_cards(rows):
+    """Attach each review row's term/definition from its deck (rows whose card is gone are dropped)."""
+    out = []
+    for row in rows:
+        card = (DECK_STORE.cards(row["deck"]) or {}).get(row["card_id"])
+        if card is not None:
+            out.append(dict(row, term=card.get("term"), definition=card.get("definition"), page=card.get("page")))
+    return out
+
+
+# one queue per process
+REVIEW_QUEUE = ReviewQueue()
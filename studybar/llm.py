@@ -0,0 +1,336 @@
+# one gateway for every OpenAI request
+#
+# All modules call chat(), chat_stream() or embed() here instead of holding a
+# client. Requests share a single SDK client over a pooled keep-alive httpx
+# client, created on first use (importing the SDK costs a few hundred ms and
+# constructing it raises without OPENAI_API_KEY). Per model, requests are:
+#   - limited in concurrency (a semaphore) and rate (a token bucket; a 429
+#     pauses the bucket for every caller, honouring Retry-After, so one
+#     throttled request doesn't turn into a storm of them)
+#   - retried on 408/409/429/5xx and connection errors with exponential
+#     backoff and full jitter, drawing on a process-wide retry budget so
+#     retries can't multiply load during an outage
+#   - bounded by a per-call timeout
+#   - failed fast by a circuit breaker after repeated failures, raising
+#     LLMUnavailable until a probe request succeeds
+# Latency, tokens and errors are recorded per model and call site (metrics).
+
+import os, random, threading, time
+
+from studybar import metrics
+
+CHAT_MODEL = "gpt-4o-mini"
+EMBEDDING_MODEL = "text-embedding-3-large"
+
+POOL_CONNECTIONS = int(os.getenv("STUDYBAR_LLM_POOL", "64"))
+CONNECT_TIMEOUT = 5.0
+DEFAULT_TIMEOUT = float(os.getenv("STUDYBAR_LLM_TIMEOUT", "60"))
+
+# per-model limits; models not listed get DEFAULT_LIMITS
+MODEL_LIMITS = {
+    "gpt-4o-mini": {"concurrency": 32, "rpm": 5000},
+    "text-embedding-3-large": {"concurrency": 16, "rpm": 3000},
+}
+DEFAULT_LIMITS = {"concurrency": 8, "rpm": 500}
+
+MAX_ATTEMPTS = 4
+BACKOFF_BASE = 0.5          # seconds; attempt n sleeps uniform(0, min(cap, base * 2**n))
+BACKOFF_CAP = 8.0
+RETRY_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+RETRY_BUDGET_RATIO = 0.2    # each request earns this many retries...
+RETRY_BUDGET_MAX = 20.0     # ...up to this many banked
+
+BREAKER_FAILURES = 5        # consecutive retryable failures that open the breaker
+BREAKER_COOLDOWN = 30.0     # seconds open before a probe request is let through
+
+
+class LLMUnavailable(RuntimeError):
+    """The model's circuit breaker is open; the request was not sent."""
+
+
+# ---------- client ----------
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                import httpx
+                from dotenv import load_dotenv
+                from openai import DefaultHttpxClient, OpenAI
+                load_dotenv()
+                _client = OpenAI(
+                    max_retries=0,  # retries happen here, against the shared budget
+                    timeout=httpx.Timeout(DEFAULT_TIMEOUT, connect=CONNECT_TIMEOUT),
+                    http_client=DefaultHttpxClient(limits=httpx.Limits(
+                        max_connections=POOL_CONNECTIONS,
+                        max_keepalive_connections=POOL_CONNECTIONS,
+                        keepalive_expiry=60.0,
+                    )),
+                )
+    return _client
+
+
+def set_client(client):
+    """Swap the shared client (benchmarks install a fake); returns the previous one."""
+    global _client
+    with _client_lock:
+        previous, _client = _client, client
+    return previous
+
+
+def close():
+    """Close pooled connections (on worker shutdown)."""
+    client = set_client(None)
+    if client is not None and hasattr(client, "close"):
+        client.close()
+
+
+# ---------- limits ----------
+class _RateLimiter:
+    """Token bucket of requests per minute, with a shared pause after a 429."""
+
+    def __init__(self, rpm):
+        self.rate = rpm / 60.0
+        self.capacity = max(1.0, self.rate)  # allow a one-second burst
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                elif self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                else:
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+class _Breaker:
+    CLOSED, OPEN, HALF_OPEN = 0, 1, 2
+
+    def __init__(self, model):
+        self.model = model
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= BREAKER_COOLDOWN:
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return
+        raise LLMUnavailable(f"{self.model} is unavailable (circuit open after repeated failures)")
+
+    def success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= BREAKER_FAILURES:
+                if self.state != self.OPEN:
+                    print(f"[LLM] circuit open for {self.model} after {self._failures} failures")
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+
+class _RetryBudget:
+    def __init__(self):
+        self._tokens = RETRY_BUDGET_MAX
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(RETRY_BUDGET_MAX, self._tokens + RETRY_BUDGET_RATIO)
+
+    def withdraw(self):
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class _Model:
+    def __init__(self, name):
+        limits = MODEL_LIMITS.get(name, DEFAULT_LIMITS)
+        self.concurrency = limits["concurrency"]
+        self.slots = threading.BoundedSemaphore(self.concurrency)
+        self.limiter = _RateLimiter(limits["rpm"])
+        self.breaker = _Breaker(name)
+
+    def in_flight(self):
+        return self.concurrency - self.slots._value
+
+
+_models = {}
+_models_lock = threading.Lock()
+_budget = _RetryBudget()
+
+
+def _model(name):
+    with _models_lock:
+        m = _models.get(name)
+        if m is None:
+            m = _models[name] = _Model(name)
+            metrics.LLM_IN_FLIGHT.track(m.in_flight, model=name)
+            metrics.LLM_BREAKER_STATE.track(lambda: m.breaker.state, model=name)
+        return m
+
+
+def _status(error):
+    return getattr(error, "status_code", None)
+
+
+def _retryable(error):
+    status = _status(error)
+    if status is not None:
+        return status in RETRY_STATUSES
+    # openai.APIConnectionError / APITimeoutError carry no status
+    return isinstance(error, (TimeoutError, ConnectionError)) or any(
+        cls.__name__ == "APIConnectionError" for cls in type(error).__mro__
+    )
+
+
+def _retry_after(error):
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return min(BACKOFF_CAP * 4, float(headers.get("retry-after")))
+    except (TypeError, ValueError):
+        return None
+
+
+def _send(model, site, request, timeout, max_attempts=MAX_ATTEMPTS):
+    """
+    Run request(timeout) under the model's limits, retrying retryable errors.
+    Returns (result, model state) with a concurrency slot still held; the
+    caller releases it with _release().
+    """
+    m = _model(model)
+    timeout = timeout or DEFAULT_TIMEOUT
+    _budget.deposit()
+    attempt = 0
+    while True:
+        m.breaker.allow()
+        m.limiter.acquire()
+        m.slots.acquire()
+        started = time.perf_counter()
+        try:
+            return request(timeout), m, started
+        except Exception as e:
+            _release(m)
+            metrics.record_llm(site, model, started, error=True)
+            if not _retryable(e):
+                # the api answered (bad request, auth...): not an availability problem
+                m.breaker.success()
+                raise
+            m.breaker.failure()
+            attempt += 1
+            delay = _retry_after(e) if _status(e) == 429 else None
+            if delay is not None:
+                m.limiter.pause(delay)
+            if attempt >= max_attempts or not _budget.withdraw():
+                raise
+            if delay is None:
+                delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+            metrics.LLM_RETRIES.inc(model=model, site=site)
+            print(f"[LLM] {site}: {type(e).__name__} ({_status(e) or 'no status'}), "
+                  f"retry {attempt} in {delay:.2f}s")
+            time.sleep(delay)
+
+
+def _release(m):
+    m.slots.release()
+
+
+# ---------- public ----------
+def chat(messages, model=CHAT_MODEL, site="chat", timeout=None, max_attempts=MAX_ATTEMPTS, **kwargs):
+    """A chat completion (the SDK response object)."""
+    def request(t):
+        return get_client().chat.completions.create(model=model, messages=messages, timeout=t, **kwargs)
+
+    resp, m, started = _send(model, site, request, timeout, max_attempts)
+    _release(m)
+    m.breaker.success()
+    metrics.record_llm(site, model, started, messages=messages, response=resp)
+    return resp
+
+
+def chat_stream(messages, model=CHAT_MODEL, site="chat", timeout=None, **kwargs):
+    """
+    Yield the chunks of a streaming chat completion. Only opening the stream
+    is retried; once tokens have been yielded an error is raised to the caller.
+    `timeout` bounds each read, so a stalled stream fails instead of hanging.
+    """
+    def request(t):
+        return get_client().chat.completions.create(model=model, messages=messages, stream=True,
+                                                    timeout=t, **kwargs)
+
+    stream, m, started = _send(model, site, request, timeout)
+    first_token_at = None
+    parts = []
+    settled = False
+    try:
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                parts.append(chunk.choices[0].delta.content)
+            yield chunk
+    except Exception as e:
+        settled = True
+        metrics.record_llm(site, model, started, error=True)
+        if _retryable(e):
+            m.breaker.failure()
+        raise
+    else:
+        settled = True
+        m.breaker.success()
+        metrics.record_llm(site, model, started, messages=messages, reply="".join(parts),
+                           first_token_at=first_token_at)
+    finally:
+        if not settled:
+            # closed early (cancelled speculation, client gone): the stream
+            # opened fine, so a half-open probe still counts as a success
+            m.breaker.success()
+        _release(m)
+        if hasattr(stream, "close"):
+            stream.close()
+
+
+def embed(inputs, model=EMBEDDING_MODEL, site="embeddings", timeout=None):
+    """An embeddings response for a list of inputs (texts, or image parts)."""
+    def request(t):
+        return get_client().embeddings.create(model=model, input=inputs, timeout=t)
+
+    resp, m, started = _send(model, site, request, timeout)
+    _release(m)
+    m.breaker.success()
+    metrics.record_llm(site, model, started, response=resp)
+    return resp
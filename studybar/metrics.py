@@ -0,0 +1,354 @@
+# in-process metrics and tracing
+#
+# Counters, gauges and histograms live in memory and are rendered in the
+# Prometheus text format by GET /metrics. span() times a pipeline stage into
+# studybar_stage_seconds and, with STUDYBAR_METRICS_LOG=1, writes one JSON line
+# per finished span (trace id, parent span, duration, attributes) to stderr or
+# STUDYBAR_METRICS_LOG_PATH. record_llm() adds latency and token histograms per
+# model and call site.
+#
+# STUDYBAR_METRICS=0 turns everything off: span() returns a shared no-op and
+# the other helpers return after one flag check.
+
+import contextvars, functools, json, os, sys, threading, time, uuid
+from datetime import datetime
+
+ENABLED = os.getenv("STUDYBAR_METRICS", "1") != "0"
+LOG_SPANS = os.getenv("STUDYBAR_METRICS_LOG", "0") == "1"
+LOG_PATH = os.getenv("STUDYBAR_METRICS_LOG_PATH")
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+DB_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1.0)
+TOKEN_BUCKETS = (16, 64, 256, 512, 1024, 2048, 4096, 8192, 16384, 65536)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_str(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)] + list(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(labels.get(n, "") for n in self.labels)
+
+    def samples(self):
+        with self._lock:
+            return dict(self._values)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in sorted(self.samples().items()):
+            lines.append(f"{self.name}{_label_str(self.labels, key)} {value}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, n=1, **labels):
+        if not ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + n
+
+
+class Gauge(_Metric):
+    """Set directly, or track(fn, **labels) to read a value (e.g. a queue length) at scrape time."""
+    kind = "gauge"
+
+    def __init__(self, name, help, labels=()):
+        super().__init__(name, help, labels)
+        self._callbacks = {}
+
+    def set(self, value, **labels):
+        if not ENABLED:
+            return
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def track(self, fn, **labels):
+        with self._lock:
+            self._callbacks[self._key(labels)] = fn
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+            callbacks = dict(self._callbacks)
+        for key, fn in callbacks.items():
+            try:
+                values[key] = fn()
+            except Exception:
+                pass
+        return values
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=SECONDS_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        if not ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [0] * len(self.buckets) + [0, 0.0]  # buckets..., count, sum
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[i] += 1
+            entry[-2] += 1
+            entry[-1] += value
+
+    def samples(self):
+        with self._lock:
+            return {k: list(v) for k, v in self._values.items()}
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, entry in sorted(self.samples().items()):
+            for bound, n in zip(self.buckets, entry):
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{_label_str(self.labels, key, [le])} {n}")
+            inf = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_label_str(self.labels, key, [inf])} {entry[-2]}")
+            lines.append(f"{self.name}_count{_label_str(self.labels, key)} {entry[-2]}")
+            lines.append(f"{self.name}_sum{_label_str(self.labels, key)} {entry[-1]}")
+        return lines
+
+
+REGISTRY = {}
+_registry_lock = threading.Lock()
+
+
+def _register(cls, name, help, labels=(), **kwargs):
+    with _registry_lock:
+        if name not in REGISTRY:
+            REGISTRY[name] = cls(name, help, labels, **kwargs)
+        return REGISTRY[name]
+
+
+def counter(name, help, labels=()):
+    return _register(Counter, name, help, labels)
+
+
+def gauge(name, help, labels=()):
+    return _register(Gauge, name, help, labels)
+
+
+def histogram(name, help, labels=(), buckets=SECONDS_BUCKETS):
+    return _register(Histogram, name, help, labels, buckets=buckets)
+
+
+# ---------- the metrics the app records ----------
+STAGE_SECONDS = histogram("studybar_stage_seconds", "Time spent per pipeline stage.", ("stage",))
+STAGE_ERRORS = counter("studybar_stage_errors_total", "Pipeline stages that raised.", ("stage",))
+LLM_SECONDS = histogram("studybar_llm_request_seconds", "LLM/embedding request latency.", ("model", "site"))
+LLM_FIRST_TOKEN = histogram("studybar_llm_first_token_seconds", "Time to first streamed token.", ("model", "site"))
+LLM_TOKENS = histogram("studybar_llm_tokens", "Tokens per LLM request.", ("model", "site", "kind"), buckets=TOKEN_BUCKETS)
+LLM_ERRORS = counter("studybar_llm_errors_total", "Failed LLM/embedding requests.", ("model", "site"))
+LLM_RETRIES = counter("studybar_llm_retries_total", "LLM/embedding requests retried by the gateway.", ("model", "site"))
+LLM_IN_FLIGHT = gauge("studybar_llm_in_flight", "LLM/embedding requests holding a concurrency slot.", ("model",))
+LLM_BREAKER_STATE = gauge("studybar_llm_breaker_state", "Circuit breaker per model: 0 closed, 1 open, 2 half-open.", ("model",))
+SINGLE_FLIGHT = counter("studybar_single_flight_total", "Deduplicated calls by role (leader, waiter, remote_waiter).", ("name", "role"))
+CONTEXT_TOKENS = histogram("studybar_context_tokens", "Prompt context tokens before (in) and after (out) packing.", ("site", "kind"), buckets=TOKEN_BUCKETS)
+CONTEXT_TOKENS_SAVED = counter("studybar_context_tokens_saved_total", "Prompt tokens removed by context packing.", ("site",))
+CACHE_REQUESTS = counter("studybar_cache_requests_total", "Cache lookups by result.", ("cache", "result"))
+CACHE_HIT_RATIO = gauge("studybar_cache_hit_ratio", "Fraction of lookups not ending in a miss.", ("cache",))
+QUEUE_DEPTH = gauge("studybar_queue_depth", "Work waiting in background queues.", ("queue",))
+DB_SECONDS = histogram("studybar_db_seconds", "Time per db.py operation.", ("op",), buckets=DB_BUCKETS)
+HTTP_SECONDS = histogram("studybar_http_request_seconds", "HTTP request latency.", ("method", "route", "status"))
+
+
+def cache_event(cache, result, n=1):
+    """result is "hit"/"miss" (or a tier name such as "memory"/"disk" for multi-level caches)."""
+    if ENABLED and n:
+        CACHE_REQUESTS.inc(n, cache=cache, result=result)
+
+
+def _update_hit_ratios():
+    totals = {}
+    for (cache, result), n in CACHE_REQUESTS.samples().items():
+        t = totals.setdefault(cache, [0, 0])
+        t[0] += n if result != "miss" else 0
+        t[1] += n
+    for cache, (hits, total) in totals.items():
+        CACHE_HIT_RATIO.set(hits / total if total else 0.0, cache=cache)
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    if not ENABLED:
+        return "# metrics disabled (STUDYBAR_METRICS=0)\n"
+    _update_hit_ratios()
+    with _registry_lock:
+        metrics = list(REGISTRY.values())
+    lines = []
+    for m in metrics:
+        lines.extend(m.render())
+    return "\n".join(lines) + "\n"
+
+
+# ---------- structured logs ----------
+_log_lock = threading.Lock()
+
+
+def log_event(event, **fields):
+    """Write one JSON line (when STUDYBAR_METRICS_LOG=1)."""
+    if not (ENABLED and LOG_SPANS):
+        return
+    record = {"ts": datetime.now().isoformat(), "event": event}
+    record.update(fields)
+    line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+    with _log_lock:
+        if LOG_PATH:
+            with open(LOG_PATH, "a", encoding="utf-8") as f:
+                f.write(line)
+        else:
+            sys.stderr.write(line)
+
+
+# ---------- spans ----------
+_current = contextvars.ContextVar("studybar_span", default=None)
+
+
+class _Span:
+    __slots__ = ("name", "attrs", "trace_id", "span_id", "parent_id", "start", "_token")
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+        return self
+
+    def __enter__(self):
+        parent = _current.get()
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.span_id = uuid.uuid4().hex[:8]
+        self._token = _current.set(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self.start
+        try:
+            _current.reset(self._token)
+        except ValueError:
+            # a generator resumed on another thread (streaming responses)
+            pass
+        STAGE_SECONDS.observe(seconds, stage=self.name)
+        if exc_type is not None and exc_type is not GeneratorExit:
+            STAGE_ERRORS.inc(stage=self.name)
+        if LOG_SPANS:
+            log_event(
+                "span", name=self.name, trace=self.trace_id, span=self.span_id, parent=self.parent_id,
+                ms=round(seconds * 1000, 3), error=exc_type.__name__ if exc_type else None, **self.attrs,
+            )
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def set(self, **attrs):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+def span(name, **attrs):
+    """with span("tutor.retrieve", topic=t) as s: ...; s.set(k=v) adds attributes."""
+    if not ENABLED:
+        return _NOOP
+    return _Span(name, attrs)
+
+
+def timed(stage):
+    """Decorator: run the function inside span(stage)."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return fn(*args, **kwargs)
+            with _Span(stage, {}):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def db_op(fn):
+    """Decorator for db.py functions: latency per operation name."""
+    op = fn.__name__
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not ENABLED:
+            return fn(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            DB_SECONDS.observe(time.perf_counter() - start, op=op)
+    return wrapper
+
+
+# ---------- llm calls ----------
+def record_llm(site, model, started, messages=None, response=None, reply=None, error=False, first_token_at=None):
+    """
+    Record one LLM/embedding request that began at `started` (perf_counter).
+    Token counts come from response.usage when the API returned it, otherwise
+    they're estimated from messages/reply.
+    """
+    if not ENABLED:
+        return
+    seconds = time.perf_counter() - started
+    LLM_SECONDS.observe(seconds, model=model, site=site)
+    if first_token_at is not None:
+        LLM_FIRST_TOKEN.observe(first_token_at - started, model=model, site=site)
+    if error:
+        LLM_ERRORS.inc(model=model, site=site)
+        log_event("llm", site=site, model=model, ms=round(seconds * 1000, 3), error=True)
+        return
+
+    usage = getattr(response, "usage", None)
+    prompt_tokens = getattr(usage, "prompt_tokens", None)
+    completion_tokens = getattr(usage, "completion_tokens", None)
+    if prompt_tokens is None and messages is not None:
+        from studybar.tokens import count_message_tokens
+        prompt_tokens = count_message_tokens(messages, model)
+    if completion_tokens is None and reply is not None:
+        from studybar.tokens import count_tokens
+        completion_tokens = count_tokens(reply, model)
+    if prompt_tokens is not None:
+        LLM_TOKENS.observe(prompt_tokens, model=model, site=site, kind="prompt")
+    if completion_tokens is not None:
+        LLM_TOKENS.observe(completion_tokens, model=model, site=site, kind="completion")
+    log_event("llm", site=site, model=model, ms=round(seconds * 1000, 3),
+              prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
@@ -0,0 +1,292 @@
+# versioned, one-shot schema/data migrations for the users database
+#
+# Each migration runs exactly once per database, recorded in schema_version.
+# apply() is called when db.py opens its first connection in a process (and
+# at api startup); it takes the write lock first, so concurrent workers
+# starting together serialize and only one of them does the work.
+
+import os
+import json
+from datetime import datetime
+
+BASE_DIR = os.path.dirname(__file__)
+PROFILES_JSON = os.path.join(BASE_DIR, "data", "student_profiles.json")
+
+
+def _base_schema(cur):
+    # IF NOT EXISTS: databases created before versioning already have these
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id TEXT PRIMARY KEY,
+            data JSON
+        )
+        """
+    )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS chapters (
+            key TEXT PRIMARY KEY,
+            title TEXT
+        )
+        """
+    )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS progress (
+            user_id TEXT,
+            chapter_key TEXT,
+            progress REAL,
+            PRIMARY KEY (user_id, chapter_key),
+            FOREIGN KEY(chapter_key) REFERENCES chapters(key)
+        )
+        """
+    )
+
+
+def _seen_problems(cur):
+    # practice problems each student has already been served
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS seen_problems (
+            user_id TEXT,
+            topic TEXT,
+            problem_id TEXT,
+            seen_at TEXT,
+            PRIMARY KEY (user_id, topic, problem_id)
+        )
+        """
+    )
+
+
+def _seed_chapters(cur):
+    """Seed chapters from data/test_pdfs (plus defaults) if the table is empty."""
+    if cur.execute("SELECT 1 FROM chapters LIMIT 1").fetchone():
+        return
+    seed_dir = os.path.join(BASE_DIR, "data", "test_pdfs")
+    insert = "INSERT OR IGNORE INTO chapters (key, title) VALUES (?, ?)"
+    if os.path.exists(seed_dir):
+        for fname in os.listdir(seed_dir):
+            key = os.path.splitext(fname)[0]
+            title = key.replace("_", " ").title()
+            cur.execute(insert, (key, title))
+    # default fallback
+    cur.execute(insert, ("atomic_structure", "Atomic Structure"))
+    cur.execute(insert, ("energetics", "Energetics"))
+
+
+def import_profiles_json(cur, json_path=PROFILES_JSON):
+    """
+    Copy legacy student_profiles.json into users/progress. Rows that already
+    exist are left alone, so stale JSON never overwrites newer db data.
+    """
+    if not os.path.exists(json_path):
+        return
+    with open(json_path, "r", encoding="utf-8") as f:
+        profiles = json.load(f)
+    for student_id, pdata in profiles.items():
+        cur.execute("INSERT OR IGNORE INTO users (id, data) VALUES (?, ?)", (student_id, json.dumps(pdata)))
+        # treat topic as chapter_key, proficiency 0..1 as progress 0..100
+        for topic, level in pdata.get("proficiencies", {}).items():
+            cur.execute(
+                "INSERT OR IGNORE INTO progress (user_id, chapter_key, progress) VALUES (?, ?, ?)",
+                (student_id, topic, float(level) * 100.0),
+            )
+
+
+def _proficiency_table(cur):
+    """
+    Move per-topic proficiencies out of the users.data blob into their own
+    indexed table, and expose the old {"proficiencies": {...}, ...} shape
+    through the users_compat view.
+    """
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS proficiencies (
+            user_id TEXT NOT NULL,
+            topic TEXT NOT NULL,
+            level REAL NOT NULL,
+            updated_at TEXT,
+            PRIMARY KEY (user_id, topic)
+        )
+        """
+    )
+    # cohort queries filter/sort by topic then level ("who is below 0.4 on X")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_proficiencies_topic_level ON proficiencies (topic, level)")
+
+    # backfill; blobs may hold 0..1 or 0..100 values, store 0..1
+    cur.execute(
+        """
+        INSERT OR IGNORE INTO proficiencies (user_id, topic, level, updated_at)
+        SELECT u.id, p.key,
+               CASE WHEN CAST(p.value AS REAL) > 1 THEN CAST(p.value AS REAL) / 100.0 ELSE CAST(p.value AS REAL) END,
+               json_extract(u.data, '$.last_activity')
+        FROM users u, json_each(u.data, '$.proficiencies') p
+        WHERE json_valid(u.data)
+        """
+    )
+    cur.execute("UPDATE users SET data = json_remove(data, '$.proficiencies') WHERE json_valid(data)")
+
+    cur.execute("DROP VIEW IF EXISTS users_compat")
+    cur.execute(
+        """
+        CREATE VIEW users_compat AS
+        SELECT u.id AS id,
+               json_set(
+                   COALESCE(u.data, '{}'),
+                   '$.proficiencies',
+                   json(COALESCE(
+                       (SELECT json_group_object(p.topic, p.level) FROM proficiencies p WHERE p.user_id = u.id),
+                       '{}'
+                   ))
+               ) AS data
+        FROM users u
+        """
+    )
+
+
+def _proficiency_versions(cur):
+    # optimistic concurrency for write-behind flushes from several workers
+    cur.execute("ALTER TABLE proficiencies ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+
+
+def _flashcard_jobs(cur):
+    # background flashcard generation; result holds partial cards while running
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS flashcard_jobs (
+            id TEXT PRIMARY KEY,
+            pdf_hash TEXT NOT NULL,
+            status TEXT NOT NULL,
+            done INTEGER NOT NULL DEFAULT 0,
+            total INTEGER NOT NULL DEFAULT 0,
+            result JSON,
+            error TEXT,
+            owner INTEGER,
+            created_at TEXT,
+            updated_at TEXT
+        )
+        """
+    )
+    # at most one live job per pdf: concurrent uploads of the same file share it
+    cur.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_flashcard_jobs_active ON flashcard_jobs (pdf_hash) "
+        "WHERE status IN ('queued', 'running')"
+    )
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_flashcard_jobs_hash ON flashcard_jobs (pdf_hash, created_at)")
+
+
+def _flight_locks(cur):
+    # single-flight across workers (see single_flight.py): one row per request
+    # fingerprint while its leader runs, then briefly holding the pickled result
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS flight_locks (
+            key TEXT PRIMARY KEY,
+            owner INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            result BLOB,
+            expires_at REAL NOT NULL,
+            updated_at TEXT
+        )
+        """
+    )
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_flight_locks_expires ON flight_locks (expires_at)")
+
+
+def _answers(cur):
+    # every marked answer, in order, so levels can be replayed when the
+    # proficiency rule changes (see tutor_gpt/proficiency_replay.py)
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS answers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT NOT NULL,
+            topic TEXT NOT NULL,
+            score REAL NOT NULL,
+            q_type TEXT,
+            level_before REAL,
+            answered_at TEXT
+        )
+        """
+    )
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_answers_user_topic ON answers (user_id, topic, id)")
+
+
+def _review_cards(cur):
+    # spaced-repetition state per student and flashcard (see flashcard_maker/review_queue.py);
+    # due is unix seconds, interval is days
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS review_cards (
+            user_id TEXT NOT NULL,
+            deck TEXT NOT NULL,
+            card_id TEXT NOT NULL,
+            due REAL NOT NULL,
+            interval REAL NOT NULL DEFAULT 0,
+            ease REAL NOT NULL,
+            reps INTEGER NOT NULL DEFAULT 0,
+            lapses INTEGER NOT NULL DEFAULT 0,
+            last_review REAL,
+            PRIMARY KEY (user_id, deck, card_id)
+        )
+        """
+    )
+    # "what's due for this student" is a range scan in due order
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_review_cards_due ON review_cards (user_id, due)")
+
+
+# (version, name, fn(cursor)) -- append only, never renumber
+MIGRATIONS = [
+    (1, "base_schema", _base_schema),
+    (2, "seen_problems", _seen_problems),
+    (3, "seed_chapters", _seed_chapters),
+    (4, "import_student_profiles_json", import_profiles_json),
+    (5, "proficiency_table", _proficiency_table),
+    (6, "proficiency_versions", _proficiency_versions),
+    (7, "flashcard_jobs", _flashcard_jobs),
+    (8, "flight_locks", _flight_locks),
+    (9, "answers", _answers),
+    (10, "review_cards", _review_cards),
+]
+
+
+def current_version(conn):
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS schema_version (version INTEGER PRIMARY KEY, name TEXT, applied_at TEXT)"
+    )
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+
+def apply(conn):
+    """Run pending migrations in one transaction. Returns the versions applied."""
+    if conn.in_transaction:
+        conn.commit()
+    # fast path: no write lock needed when already up to date
+    if current_version(conn) >= MIGRATIONS[-1][0]:
+        conn.commit()
+        return []
+
+    applied = []
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # re-check under the lock: another worker may have just migrated
+        version = current_version(conn)
+        cur = conn.cursor()
+        for v, name, fn in MIGRATIONS:
+            if v <= version:
+                continue
+            fn(cur)
+            cur.execute(
+                "INSERT INTO schema_version (version, name, applied_at) VALUES (?, ?, ?)",
+                (v, name, datetime.now().isoformat()),
+            )
+            applied.append(v)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    if applied:
+        print(f"[DB] Applied migrations {applied}")
+    return applied
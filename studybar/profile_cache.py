@@ -0,0 +1,235 @@
+# in-process student profile cache with write-behind to sqlite
+#
+# Reads are served from memory. update_level only touches memory and marks
+# the (student, topic) dirty; a background thread flushes dirty rows in one
+# transaction every `max_unflushed_age` seconds, or sooner once `max_dirty`
+# rows are waiting, and once more at shutdown. Rows carry a version so two
+# workers buffering writes for the same student can't silently clobber each
+# other (see db.flush_proficiencies). Cached profiles are re-read after
+# `read_ttl` seconds to pick up other workers' writes; rows being flushed stay
+# marked in flight until their transaction commits, so a re-read that races a
+# flush can't put the old db value back. Database reads happen outside the
+# cache lock, and at most `max_profiles` profiles are kept, least
+# recently used first (profiles with unflushed writes are never dropped).
+
+import atexit, os, threading, time
+from collections import OrderedDict
+
+from studybar import db, metrics
+
+MAX_UNFLUSHED_AGE = float(os.getenv("STUDYBAR_PROFILE_FLUSH_SECONDS", "2.0"))
+MAX_DIRTY = 50
+READ_TTL = 30.0
+MAX_PROFILES = 5000
+
+
+class ProfileCache:
+    def __init__(self, max_unflushed_age=MAX_UNFLUSHED_AGE, max_dirty=MAX_DIRTY, read_ttl=READ_TTL,
+                 max_profiles=MAX_PROFILES):
+        self.max_unflushed_age = max_unflushed_age
+        self.max_dirty = max_dirty
+        self.read_ttl = read_ttl
+        self.max_profiles = max_profiles
+        # {student_id: {"data": dict, "versions": {topic: int}, "loaded_at": float}}, least recently used first
+        self._profiles = OrderedDict()
+        self._dirty = {}      # {(student_id, topic): updated_at}
+        self._touched = {}    # {student_id: last_activity}
+        self._inflight = set()            # (student_id, topic) being written by flush()
+        self._inflight_touched = {}       # {student_id: last_activity} being written by flush()
+        self._flush_gen = 0               # bumped when a flush commits
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self.stats = {"reads": 0, "loads": 0, "writes": 0, "flushes": 0, "rows_flushed": 0, "conflicts": 0,
+                      "evicted": 0}
+
+    # ---------- reads ----------
+    @staticmethod
+    def _fetch(student_id):
+        # db reads, done without holding the cache lock
+        data = db.get_user(student_id) or {"proficiencies": {}, "last_activity": None}
+        return data, db.get_proficiency_rows(student_id)
+
+    def _apply(self, student_id, fetched, entry=None):
+        """Install fetched rows as a new entry, or into `entry` in place. Caller holds the lock."""
+        data, rows = fetched
+        self.stats["loads"] += 1
+        if entry is None:
+            entry = {"data": data, "versions": {}}
+        else:
+            # reload in place so StudentProfile.data references stay valid,
+            # but keep this worker's unflushed values
+            pending = {t: entry["data"]["proficiencies"][t] for (s, t) in self._pending_rows() if s == student_id}
+            entry["data"].clear()
+            entry["data"].update(data)
+            entry["data"].setdefault("proficiencies", {}).update(pending)
+            touched = self._touched.get(student_id) or self._inflight_touched.get(student_id)
+            if touched is not None:
+                entry["data"]["last_activity"] = touched
+        entry["data"].setdefault("proficiencies", {})
+        # a buffered write must still be checked against the version it was
+        # based on, or it would overwrite whatever landed since
+        versions = entry["versions"]
+        entry["versions"] = {t: r["version"] for t, r in rows.items()}
+        for s, t in self._pending_rows():
+            if s == student_id:
+                if t in versions:
+                    entry["versions"][t] = versions[t]
+                else:
+                    entry["versions"].pop(t, None)
+        entry["loaded_at"] = time.time()
+        return entry
+
+    def _pending_rows(self):
+        """(student_id, topic) not yet committed: dirty or in flight. Caller holds the lock."""
+        return self._dirty.keys() | self._inflight
+
+    def get(self, student_id, refresh=False):
+        """The profile dict for a student (shared, updated in place)."""
+        with self._lock:
+            self.stats["reads"] += 1
+            entry = self._profiles.get(student_id)
+            if entry is not None:
+                self._profiles.move_to_end(student_id)
+                if not refresh and time.time() - entry["loaded_at"] <= self.read_ttl:
+                    metrics.cache_event("profiles", "hit")
+                    return entry["data"]
+            gen = self._flush_gen
+        metrics.cache_event("profiles", "stale" if entry is not None else "miss")
+        while True:
+            fetched = self._fetch(student_id)
+            with self._lock:
+                if self._flush_gen != gen:
+                    # a flush committed while we read: the rows may predate it
+                    gen = self._flush_gen
+                    continue
+                # another thread may have loaded (or we may have evicted) it meanwhile
+                entry = self._profiles.get(student_id)
+                if entry is None:
+                    entry = self._profiles[student_id] = self._apply(student_id, fetched)
+                    self._evict()
+                else:
+                    self._apply(student_id, fetched, entry)
+                return entry["data"]
+
+    def _evict(self):
+        """Drop least recently used clean profiles beyond max_profiles. Caller holds the lock."""
+        excess = len(self._profiles) - self.max_profiles
+        if excess <= 0:
+            return
+        pending = {s for s, _ in self._pending_rows()} | set(self._touched) | set(self._inflight_touched)
+        for student_id in list(self._profiles):
+            if excess <= 0:
+                break
+            if student_id not in pending:
+                del self._profiles[student_id]
+                self.stats["evicted"] += 1
+                excess -= 1
+
+    # ---------- writes ----------
+    def set_level(self, student_id, topic, level, updated_at):
+        while True:
+            data = self.get(student_id)
+            with self._lock:
+                entry = self._profiles.get(student_id)
+                if entry is not None and entry["data"] is data:
+                    break
+            # evicted between the read and the write; load it again
+        with self._lock:
+            data["proficiencies"][topic] = float(level)
+            data["last_activity"] = updated_at
+            self._dirty[(student_id, topic)] = updated_at
+            self._touched[student_id] = updated_at
+            self.stats["writes"] += 1
+            dirty = len(self._dirty)
+        self._ensure_flusher()
+        if dirty >= self.max_dirty:
+            self._wake.set()
+
+    def flush(self):
+        """Write all dirty rows in one transaction. Safe to call from any thread."""
+        with self._flush_lock:
+            with self._lock:
+                if not self._dirty and not self._touched:
+                    return 0
+                updates = []
+                for (student_id, topic), updated_at in self._dirty.items():
+                    entry = self._profiles[student_id]
+                    updates.append({
+                        "student_id": student_id,
+                        "topic": topic,
+                        "level": entry["data"]["proficiencies"][topic],
+                        "updated_at": updated_at,
+                        "version": entry["versions"].get(topic, 0),
+                    })
+                touches = dict(self._touched)
+                # in flight until committed: a concurrent refresh keeps these values
+                self._inflight = set(self._dirty)
+                self._inflight_touched = touches
+                self._dirty.clear()
+                self._touched.clear()
+
+            try:
+                stored = db.flush_proficiencies(updates, touches)
+            except Exception as e:
+                print(f"[WARN] Profile flush failed, will retry: {e}")
+                with self._lock:
+                    for u in updates:
+                        self._dirty.setdefault((u["student_id"], u["topic"]), u["updated_at"])
+                    for sid, ts in touches.items():
+                        self._touched.setdefault(sid, ts)
+                    self._inflight = set()
+                    self._inflight_touched = {}
+                return 0
+
+            with self._lock:
+                for row in stored:
+                    entry = self._profiles.get(row["student_id"])
+                    if entry is None:
+                        continue
+                    entry["versions"][row["topic"]] = row["version"]
+                    if row["conflict"]:
+                        self.stats["conflicts"] += 1
+                        # another worker's newer value won; adopt it unless we've written again since
+                        if (row["student_id"], row["topic"]) not in self._dirty:
+                            entry["data"]["proficiencies"][row["topic"]] = row["level"]
+                self._inflight = set()
+                self._inflight_touched = {}
+                self._flush_gen += 1
+                self.stats["flushes"] += 1
+                self.stats["rows_flushed"] += len(stored)
+            return len(stored)
+
+    # ---------- background flusher ----------
+    def _ensure_flusher(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="profile-flush", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.max_unflushed_age)
+            self._wake.clear()
+            self.flush()
+
+    def close(self):
+        """Stop the flusher and write anything still buffered."""
+        self._stop.set()
+        self._wake.set()
+        self.flush()
+
+    def dirty_count(self):
+        with self._lock:
+            return len(self._dirty)
+
+
+# one cache per process, flushed on interpreter exit
+PROFILE_CACHE = ProfileCache()
+atexit.register(PROFILE_CACHE.close)
+metrics.QUEUE_DEPTH.track(PROFILE_CACHE.dirty_count, queue="profile_flush")
@@ -0,0 +1,147 @@
+# single-flight: identical concurrent calls share one execution
+#
+# A class uploading the same worksheet, or many students opening the same
+# deck, starts the same llm_filter / embed_chunks / generate_problems calls
+# at the same moment, and the caches only help once the first one finishes.
+# run(name, key_parts, fn) fingerprints the request and lets only one caller
+# (the leader) execute fn; everyone else waits and gets the leader's result.
+#
+# Within a process waiters block on an Event. Across workers the leader holds
+# a row in sqlite's flight_locks table; other workers poll it and read the
+# pickled result the leader leaves there for RESULT_TTL seconds. If the leader
+# fails its row is dropped and a waiter runs the call itself; if its process
+# dies (or it overruns its lease) a waiter takes the row over. The table is an
+# optimisation only: when sqlite is unavailable calls just run.
+
+import copy, hashlib, json, os, pickle, sqlite3, threading, time
+
+from studybar import db, metrics
+
+LEASE = 600.0          # seconds a leader may hold a key before others take over
+RESULT_TTL = 5.0       # seconds a finished result stays readable for pollers (polls are <= 1s apart)
+POLL_MIN = 0.05
+POLL_MAX = 1.0
+
+
+def fingerprint(name, key_parts):
+    payload = json.dumps([name, key_parts], sort_keys=True, separators=(",", ":"), default=str)
+    return f"{name}:{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+
+
+def _alive(pid):
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class _Call:
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+_calls = {}
+_lock = threading.Lock()
+
+
+def run(name, key_parts, fn, lease=LEASE, across_workers=True):
+    """
+    fn() executed once for all concurrent callers with the same (name,
+    key_parts); each gets its result, or its exception within this process.
+    """
+    key = fingerprint(name, key_parts)
+    with _lock:
+        call = _calls.get(key)
+        leader = call is None
+        if leader:
+            call = _calls[key] = _Call()
+
+    if not leader:
+        metrics.SINGLE_FLIGHT.inc(name=name, role="waiter")
+        call.event.wait()
+        if call.error is not None:
+            raise call.error
+        # callers may mutate what they get back (problem dicts, chunks)
+        return copy.deepcopy(call.result)
+
+    try:
+        call.result = _run_across_workers(name, key, fn, lease) if across_workers else _lead_local(name, fn)
+        return call.result
+    except BaseException as e:
+        call.error = e
+        raise
+    finally:
+        with _lock:
+            _calls.pop(key, None)
+        call.event.set()
+
+
+def _lead_local(name, fn):
+    metrics.SINGLE_FLIGHT.inc(name=name, role="leader")
+    return fn()
+
+
+def _run_across_workers(name, key, fn, lease):
+    me = os.getpid()
+    delay = POLL_MIN
+    while True:
+        # only the lock table calls are guarded: an sqlite error raised by fn
+        # itself must propagate, not run fn a second time
+        try:
+            acquired = db.acquire_flight(key, me, lease)
+            row = None if acquired else db.get_flight(key)
+        except sqlite3.Error as e:
+            print(f"[SINGLE-FLIGHT] lock table unavailable ({e}); running {name} directly")
+            return _lead_local(name, fn)
+        if acquired:
+            return _lead(name, key, fn, me)
+
+        if row is None:
+            continue  # released between our insert and read; try to lead again
+        if row["status"] == "done":
+            metrics.SINGLE_FLIGHT.inc(name=name, role="remote_waiter")
+            return pickle.loads(row["result"])
+        # in-process callers are already deduped, so a row we own is left over from a failure
+        if row["owner"] == me or not _alive(row["owner"]) or row["expires_at"] < time.time():
+            try:
+                took_over = db.take_over_flight(key, row["owner"], me, lease)
+            except sqlite3.Error as e:
+                print(f"[SINGLE-FLIGHT] lock table unavailable ({e}); running {name} directly")
+                return _lead_local(name, fn)
+            if took_over:
+                return _lead(name, key, fn, me)
+            continue
+        time.sleep(delay)
+        delay = min(POLL_MAX, delay * 2)
+
+
+def _lead(name, key, fn, me):
+    metrics.SINGLE_FLIGHT.inc(name=name, role="leader")
+    try:
+        result = fn()
+    except BaseException:
+        _release(key, me)
+        raise
+    try:
+        db.finish_flight(key, me, pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL), RESULT_TTL)
+    except (pickle.PicklingError, TypeError, AttributeError, sqlite3.Error) as e:
+        # waiters in other workers will run the call themselves
+        print(f"[SINGLE-FLIGHT] could not share {name} result: {e}")
+        _release(key, me)
+    return result
+
+
+def _release(key, me):
+    try:
+        db.release_flight(key, me)
+    except sqlite3.Error as e:
+        print(f"[SINGLE-FLIGHT] could not release {key}: {e}")
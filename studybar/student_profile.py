@@ -1,23 +1,24 @@
 # student data handling
 
-import os
-import json
 from datetime import datetime
-from . import db
+from .profile_cache import PROFILE_CACHE
 
 
 class StudentProfile:
     def __init__(self, student_id, db_path=None):
         self.student_id = student_id
-        # migrate existing JSON if present
-        profiles_json = os.path.join(os.path.dirname(__file__), "data", "student_profiles.json")
-        if os.path.exists(profiles_json):
-            try:
-                db.migrate_profiles_json(profiles_json)
-            except Exception:
-                pass
+        # legacy student_profiles.json is imported once by the db migrations
+        PROFILE_CACHE.get(student_id)
 
-        self.data = db.get_user(student_id) or {"proficiencies": {}, "last_activity": None}
+    @property
+    def data(self):
+        # the process-wide cached dict, kept current by PROFILE_CACHE; looked up
+        # each time since the cache may have evicted and reloaded it
+        return PROFILE_CACHE.get(self.student_id)
+
+    def refresh(self):
+        """Re-read the profile from the db (another worker may have updated it)."""
+        return PROFILE_CACHE.get(self.student_id, refresh=True)
 
     def get_level(self, topic):
         # stored proficiency in data may be 0..1 or 0..100; normalize to 0..1
@@ -31,8 +32,5 @@ class StudentProfile:
             return 0.0
 
     def update_level(self, topic, new_level):
-        if "proficiencies" not in self.data:
-            self.data["proficiencies"] = {}
-        self.data["proficiencies"][topic] = float(new_level)
-        self.data["last_activity"] = datetime.now().isoformat()
-        db.upsert_user(self.student_id, self.data)
+        # applied in memory now, written to sqlite by the cache's next flush
+        PROFILE_CACHE.set_level(self.student_id, topic, new_level, datetime.now().isoformat())
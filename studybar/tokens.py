@@ -0,0 +1,49 @@
+# local token counting for prompt budgeting
+
+import re
+
+# tiktoken is optional; without it we fall back to a word/char heuristic that
+# tracks cl100k/o200k counts closely enough for budgeting
+_encoders = {}
+
+DEFAULT_MODEL = "gpt-4o-mini"
+# per-message overhead of the chat format (role markers, separators)
+MESSAGE_OVERHEAD = 4
+
+
+def _get_encoder(model):
+    if model in _encoders:
+        return _encoders[model]
+    try:
+        import tiktoken
+        try:
+            enc = tiktoken.encoding_for_model(model)
+        except KeyError:
+            enc = tiktoken.get_encoding("o200k_base")
+    except Exception:
+        enc = None
+    _encoders[model] = enc
+    return enc
+
+
+def count_tokens(text, model=DEFAULT_MODEL):
+    """Number of tokens in a string for the given model."""
+    if not text:
+        return 0
+    enc = _get_encoder(model)
+    if enc is not None:
+        return len(enc.encode(text))
+    # heuristic: ~4 chars per token, but never fewer than the word count
+    words = len(re.findall(r"\S+", text))
+    return max(words, (len(text) + 3) // 4)
+
+
+def count_message_tokens(messages, model=DEFAULT_MODEL):
+    """Tokens for a list of chat messages, including format overhead."""
+    total = 3  # every reply is primed with <|start|>assistant<|message|>
+    for m in messages:
+        content = m.get("content", "")
+        if not isinstance(content, str):
+            content = str(content)
+        total += MESSAGE_OVERHEAD + count_tokens(content, model)
+    return total
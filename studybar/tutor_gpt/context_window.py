@@ -0,0 +1,136 @@
+# conversation history -> token-budgeted prompt window with a rolling summary
+#
+# The full history stays on disk untouched. What we send to the model is:
+#   system prompt + rolling summary of older turns + the most recent turns
+# and the summary is extended incrementally with only the turns that just
+# fell out of the window, never regenerated from the whole conversation.
+
+import os, json
+
+from studybar.tokens import count_message_tokens, count_tokens, DEFAULT_MODEL
+
+DEFAULT_MAX_TOKENS = 6000
+DEFAULT_KEEP_TURNS = 10
+DEFAULT_SUMMARY_TOKENS = 400
+# fold evicted messages into the summary in batches, so we don't pay a
+# summarization call on every single turn
+DEFAULT_FOLD_BATCH = 4
+
+SUMMARY_PROMPT = """
+You maintain a running summary of a tutoring conversation.
+Update the existing summary with the new messages below. Keep facts the tutor
+will need later: topics covered, the student's misconceptions, questions asked
+and how the student did. At most {max_tokens} tokens. Return only the summary.
+
+Existing summary:
+{summary}
+
+New messages:
+{messages}
+"""
+
+
+def format_summary_request(summary, messages, max_tokens=DEFAULT_SUMMARY_TOKENS):
+    lines = "\n".join(f"{m.get('role')}: {m.get('content')}" for m in messages)
+    return SUMMARY_PROMPT.format(max_tokens=max_tokens, summary=summary or "(none)", messages=lines)
+
+
+class ConversationWindow:
+    def __init__(self, summary_path, summarize_fn,
+                 max_tokens=DEFAULT_MAX_TOKENS,
+                 keep_turns=DEFAULT_KEEP_TURNS,
+                 fold_batch=DEFAULT_FOLD_BATCH,
+                 model=DEFAULT_MODEL):
+        """
+        Args:
+            summary_path: where the rolling summary is cached (json)
+            summarize_fn: (previous_summary, new_messages) -> updated summary
+            max_tokens: prompt budget for system + summary + recent turns
+            keep_turns: max user/assistant turns kept verbatim
+        """
+        self.summary_path = summary_path
+        self.summarize_fn = summarize_fn
+        self.max_tokens = max_tokens
+        self.keep_messages = keep_turns * 2
+        self.fold_batch = fold_batch
+        self.model = model
+        # covered = absolute index (excluding the system prompt) of the first
+        # message not yet folded into the summary
+        self.state = {"summary": "", "covered": 0}
+        self._load()
+
+    # ---------- summary persistence ----------
+    def _load(self):
+        if os.path.exists(self.summary_path):
+            try:
+                with open(self.summary_path, "r", encoding="utf-8") as f:
+                    self.state.update(json.load(f))
+            except Exception as e:
+                print(f"[WARN] Summary cache unreadable, starting fresh: {e}")
+
+    def _save(self):
+        with open(self.summary_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, ensure_ascii=False)
+
+    # ---------- window construction ----------
+    def _summary_message(self):
+        if not self.state["summary"]:
+            return []
+        return [{"role": "system", "content": f"Summary of the earlier conversation:\n{self.state['summary']}"}]
+
+    def _tokens(self, messages):
+        return count_message_tokens(messages, self.model)
+
+    def build(self, history, offset=0):
+        """
+        Return the messages to send for this turn.
+
+        Args:
+            history: loaded conversation, history[0] is the system prompt
+            offset: absolute index of history[1] in the full on-disk history
+                    (non-zero when only the tail of the file was loaded)
+        """
+        system = history[:1] if history and history[0].get("role") == "system" else []
+        turns = history[len(system):]
+        end = offset + len(turns)
+
+        def tail_from(abs_idx):
+            return turns[max(0, abs_idx - offset):]
+
+        # newest-first, take turns while they fit the budget and the turn cap
+        fixed = self._tokens(system + self._summary_message())
+        start = end
+        used = fixed
+        for m in reversed(turns):
+            cost = self._tokens([m]) - 3
+            if end - start >= self.keep_messages or (used + cost > self.max_tokens and start < end):
+                break
+            used += cost
+            start -= 1
+
+        covered = max(self.state["covered"], offset)
+        if start <= covered:
+            # nothing new has fallen out of the window
+            return system + self._summary_message() + tail_from(covered)
+
+        pending = turns[covered - offset:start - offset]
+        with_pending = system + self._summary_message() + pending + tail_from(start)
+        if len(pending) < self.fold_batch and self._tokens(with_pending) <= self.max_tokens:
+            return with_pending
+
+        self._fold(pending, start)
+        return system + self._summary_message() + tail_from(start)
+
+    def _fold(self, messages, new_covered):
+        try:
+            summary = self.summarize_fn(self.state["summary"], messages)
+            if summary:
+                self.state["summary"] = summary.strip()
+        except Exception as e:
+            # keep the old summary; the evicted turns are still on disk
+            print(f"[WARN] Summary update failed, dropping {len(messages)} messages from context: {e}")
+        self.state["covered"] = new_covered
+        self._save()
+
+    def summary_tokens(self):
+        return count_tokens(self.state["summary"], self.model)
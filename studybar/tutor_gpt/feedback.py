@@ -4,20 +4,26 @@ import os
 from studybar.tutor_gpt.ocr_utils import OCRExtractor
 from studybar.tutor_gpt.marker import AnswerMarker
 from studybar.document_embedding import embed_text, embed_image  # optional
+from studybar import metrics
 
 
-def get_feedback(answer_file_path, question, context, topic=None, student_id=None):
+@metrics.timed("feedback.get_feedback")
+def get_feedback(answer_file_path, question, context, topic=None, student_id=None, progress=None):
     """
     Evaluate a student's answer (pdf/image/text) and return feedback.
     Uses absolute imports to avoid path issues.
+    progress: optional callable receiving short status messages.
     """
     # ensure absolute path for input file
     answer_file_path = os.path.abspath(answer_file_path)
 
     # initialize OCR and marking modules
     ocr = OCRExtractor()
-    data = ocr.extract(answer_file_path)
+    on_page = (lambda page, total: progress(f"Reading your answer (page {page}/{total})...")) if progress else None
+    data = ocr.extract(answer_file_path, on_page=on_page)
 
+    if progress:
+        progress("Marking your answer...")
     marker = AnswerMarker()
     result = marker.mark(
         student_answer=data[0]["text"],
@@ -0,0 +1,94 @@
+# conversation jsonl -> pages of messages, read backwards from the end
+#
+# Conversation files are append-only (one json message per line), so the
+# newest messages are at the end. Pages are addressed by byte offsets: a
+# cursor is the offset where the oldest returned line starts, and the next
+# page is everything before it. A cursor that isn't at a line start (made up
+# by a client) is moved back to the start of its line. Nothing before the
+# requested page is parsed.
+
+import os, json, hashlib
+
+BLOCK_SIZE = 64 * 1024
+
+
+def _lines_before(f, end, limit):
+    """Return up to `limit` (offset, raw_line) pairs ending before byte `end`, oldest first."""
+    lines = []
+    buf = b""
+    pos = end
+    while pos > 0 and len(lines) < limit:
+        step = min(BLOCK_SIZE, pos)
+        pos -= step
+        f.seek(pos)
+        buf = f.read(step) + buf
+        # every complete line after the first newline in buf is safe to take
+        parts = buf.split(b"\n")
+        buf = parts[0]
+        offset = pos + len(parts[0]) + 1
+        complete = []
+        for part in parts[1:]:
+            complete.append((offset, part))
+            offset += len(part) + 1
+        lines = [(o, l) for o, l in complete if l.strip()] + lines
+    if pos == 0 and buf.strip() and len(lines) < limit:
+        lines.insert(0, (0, buf))
+    return lines[-limit:]
+
+
+def _line_start(f, pos):
+    """Offset of the start of the line containing byte `pos`."""
+    while pos > 0:
+        step = min(BLOCK_SIZE, pos)
+        f.seek(pos - step)
+        nl = f.read(step).rfind(b"\n")
+        if nl != -1:
+            return pos - step + nl + 1
+        pos -= step
+    return 0
+
+
+def read_page(path, before=None, limit=50):
+    """
+    Newest `limit` messages that start before byte offset `before`
+    (end of file when None). Returns (messages, next_cursor), where
+    next_cursor is None once the start of the file has been reached.
+    """
+    with open(path, "rb") as f:
+        size = f.seek(0, os.SEEK_END)
+        end = size if before is None else _line_start(f, max(0, min(int(before), size)))
+        lines = _lines_before(f, end, limit)
+    messages = [json.loads(line) for _, line in lines]
+    next_cursor = lines[0][0] if lines and lines[0][0] > 0 else None
+    return messages, next_cursor
+
+
+def read_head_and_tail(path, limit):
+    """
+    First line (the system prompt) plus the last `limit` messages after it,
+    and the absolute index of the first tail message among the non-system
+    messages. Used to load a conversation without parsing all of it.
+    """
+    with open(path, "rb") as f:
+        first = f.readline()
+        head_end = f.tell()
+        size = f.seek(0, os.SEEK_END)
+        tail = [(o, l) for o, l in _lines_before(f, size, limit) if o >= head_end]
+        # counting newlines is far cheaper than parsing the lines themselves
+        f.seek(head_end)
+        start = tail[0][0] if tail else size
+        skipped = 0
+        remaining = start - head_end
+        while remaining > 0:
+            block = f.read(min(BLOCK_SIZE, remaining))
+            skipped += block.count(b"\n")
+            remaining -= len(block)
+    head = [json.loads(first)] if first.strip() else []
+    return head, [json.loads(line) for _, line in tail], skipped
+
+
+def etag(path, *params):
+    """Weak etag from file size/mtime (the file only ever grows) and the page params."""
+    st = os.stat(path)
+    key = f"{st.st_size}-{st.st_mtime_ns}-" + "-".join(map(str, params))
+    return 'W/"' + hashlib.sha1(key.encode("utf-8")).hexdigest()[:20] + '"'
@@ -0,0 +1,239 @@
+# student message -> intent label, without an llm round trip when possible
+#
+# tier 1: keyword/regex rules for the obvious phrasings
+# tier 2: logistic regression on hashed word/char n-grams, trained on the
+#         (message, intent) pairs logged every time the llm tier is used
+# tier 3: the caller falls back to the llm when confidence < threshold
+
+import os, json, math, re, time, random, threading, zlib
+from datetime import datetime
+
+INTENTS = ["generate_questions", "get_feedback", "rag_query", "general_chat"]
+
+BASE_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
+LOG_PATH = os.path.join(BASE_DATA_DIR, "intent_log.jsonl")
+MODEL_PATH = os.path.join(BASE_DATA_DIR, "intent_model.json")
+
+N_FEATURES = 2 ** 18
+DEFAULT_THRESHOLD = 0.8
+MIN_TRAINING_EXAMPLES = 50
+
+
+# ---------- tier 1: rules ----------
+RULES = [
+    ("generate_questions", re.compile(
+        r"\b(quiz me|test me|practi[cs]e (questions?|problems?)|give me (some |a few |more )?(questions?|problems?)"
+        r"|generate (some )?(questions?|problems?)|more questions?|another question)\b", re.I)),
+    ("get_feedback", re.compile(
+        r"\b(mark|grade|check|assess|review) (my|this) (answer|work|working|response|solution)\b"
+        r"|\bhow did i do\b|\bis my answer (right|correct)\b|\bfeedback on\b", re.I)),
+    ("rag_query", re.compile(
+        r"\b(according to|based on|from|in) (my|the) (notes|textbook|chapter|pdf|slides|material)\b"
+        r"|\bwhat does the (chapter|textbook|text|pdf) say\b", re.I)),
+]
+RULE_CONFIDENCE = 0.95
+
+
+def rule_intent(message):
+    for intent, pattern in RULES:
+        if pattern.search(message):
+            return intent
+    return None
+
+
+# ---------- tier 2: hashed n-gram logistic regression ----------
+def _tokens(message):
+    return re.findall(r"[a-z0-9']+", message.lower())
+
+
+def featurize(message):
+    """Hashed word uni/bigrams and char trigrams -> {index: count}."""
+    words = _tokens(message)
+    grams = [f"w:{w}" for w in words]
+    grams += [f"b:{a}_{b}" for a, b in zip(words, words[1:])]
+    text = f" {' '.join(words)} "
+    grams += [f"c:{text[i:i + 3]}" for i in range(len(text) - 2)]
+    feats = {}
+    for g in grams:
+        idx = zlib.crc32(g.encode("utf-8")) % N_FEATURES
+        feats[idx] = feats.get(idx, 0.0) + 1.0
+    # l2 normalise so long messages don't dominate
+    norm = math.sqrt(sum(v * v for v in feats.values())) or 1.0
+    return {k: v / norm for k, v in feats.items()}
+
+
+def _softmax(scores):
+    m = max(scores)
+    exps = [math.exp(s - m) for s in scores]
+    total = sum(exps)
+    return [e / total for e in exps]
+
+
+class HashedLogReg:
+    """Multinomial logistic regression over sparse hashed features."""
+
+    def __init__(self, labels=INTENTS):
+        self.labels = list(labels)
+        self.weights = [dict() for _ in self.labels]
+        self.bias = [0.0] * len(self.labels)
+
+    def predict_proba(self, feats):
+        scores = [
+            self.bias[k] + sum(w.get(i, 0.0) * v for i, v in feats.items())
+            for k, w in enumerate(self.weights)
+        ]
+        return _softmax(scores)
+
+    def fit(self, examples, epochs=10, lr=0.5, l2=1e-4, seed=0):
+        """examples: list of (message, intent). Plain SGD, fine for a few thousand rows."""
+        data = [(featurize(m), self.labels.index(y)) for m, y in examples if y in self.labels]
+        rng = random.Random(seed)
+        for _ in range(epochs):
+            rng.shuffle(data)
+            for feats, y in data:
+                probs = self.predict_proba(feats)
+                for k, w in enumerate(self.weights):
+                    grad = probs[k] - (1.0 if k == y else 0.0)
+                    self.bias[k] -= lr * grad
+                    for i, v in feats.items():
+                        w[i] = w.get(i, 0.0) * (1 - lr * l2) - lr * grad * v
+        return self
+
+    def to_dict(self):
+        return {
+            "labels": self.labels,
+            "bias": self.bias,
+            "weights": [{str(i): round(v, 6) for i, v in w.items() if abs(v) > 1e-6} for w in self.weights],
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        model = cls(d["labels"])
+        model.bias = list(d["bias"])
+        model.weights = [{int(i): v for i, v in w.items()} for w in d["weights"]]
+        return model
+
+
+# ---------- training data log ----------
+def log_example(message, intent, latency_ms=None, source="llm", log_path=LOG_PATH):
+    """Append one labelled example; llm-labelled rows become training data."""
+    os.makedirs(os.path.dirname(log_path), exist_ok=True)
+    entry = {
+        "timestamp": datetime.now().isoformat(),
+        "message": message,
+        "intent": intent,
+        "source": source,
+        "latency_ms": latency_ms,
+    }
+    with open(log_path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+def load_examples(log_path=LOG_PATH):
+    if not os.path.exists(log_path):
+        return []
+    rows = []
+    with open(log_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                rows.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return [r for r in rows if r.get("source") == "llm" and r.get("intent") in INTENTS]
+
+
+# ---------- combined local classifier ----------
+class LocalIntentClassifier:
+    def __init__(self, model_path=MODEL_PATH, threshold=DEFAULT_THRESHOLD):
+        self.model_path = model_path
+        self.threshold = threshold
+        self.model = None
+        self.stats = {"rule": 0, "model": 0, "llm": 0, "shadow_checks": 0, "shadow_agree": 0}
+        self._stats_lock = threading.Lock()   # shadow checks record from a background thread
+        self._load_model()
+
+    def _load_model(self):
+        if os.path.exists(self.model_path):
+            try:
+                with open(self.model_path, "r", encoding="utf-8") as f:
+                    self.model = HashedLogReg.from_dict(json.load(f))
+            except Exception as e:
+                print(f"[WARN] Intent model unreadable, ignoring: {e}")
+                self.model = None
+
+    def predict(self, message):
+        """Return (intent, confidence, source); intent is None when the llm should decide."""
+        intent = rule_intent(message)
+        if intent:
+            return intent, RULE_CONFIDENCE, "rule"
+        if self.model is not None:
+            probs = self.model.predict_proba(featurize(message))
+            k = max(range(len(probs)), key=probs.__getitem__)
+            if probs[k] >= self.threshold:
+                return self.model.labels[k], probs[k], "model"
+            return None, probs[k], "model"
+        return None, 0.0, "none"
+
+    def record(self, source, local_intent=None, llm_intent=None):
+        with self._stats_lock:
+            self.stats[source] = self.stats.get(source, 0) + 1
+            if local_intent and llm_intent:
+                self.stats["shadow_checks"] += 1
+                self.stats["shadow_agree"] += int(local_intent == llm_intent)
+
+
+def train(log_path=LOG_PATH, model_path=MODEL_PATH, **fit_kwargs):
+    examples = [(r["message"], r["intent"]) for r in load_examples(log_path)]
+    if len(examples) < MIN_TRAINING_EXAMPLES:
+        print(f"[INFO] Only {len(examples)} labelled examples, need {MIN_TRAINING_EXAMPLES} to train")
+        return None
+    model = HashedLogReg().fit(examples, **fit_kwargs)
+    os.makedirs(os.path.dirname(model_path), exist_ok=True)
+    with open(model_path, "w", encoding="utf-8") as f:
+        json.dump(model.to_dict(), f)
+    print(f"[✓] Trained intent model on {len(examples)} examples -> {model_path}")
+    return model
+
+
+def evaluate(log_path=LOG_PATH, threshold=DEFAULT_THRESHOLD, holdout=0.2, seed=0):
+    """
+    Hold out a slice of llm-labelled messages, train on the rest, and report
+    how often the local tiers agree with the llm label plus the latency the
+    local tiers would have saved (mean logged llm latency per handled message).
+    """
+    rows = load_examples(log_path)
+    rng = random.Random(seed)
+    rng.shuffle(rows)
+    n_test = max(1, int(len(rows) * holdout)) if rows else 0
+    test, train_rows = rows[:n_test], rows[n_test:]
+    model = HashedLogReg().fit([(r["message"], r["intent"]) for r in train_rows]) if train_rows else None
+
+    clf = LocalIntentClassifier(model_path="", threshold=threshold)
+    clf.model = model
+    handled = correct = 0
+    for r in test:
+        intent, _, _ = clf.predict(r["message"])
+        if intent is not None:
+            handled += 1
+            correct += int(intent == r["intent"])
+
+    latencies = [r["latency_ms"] for r in rows if r.get("latency_ms")]
+    mean_llm_ms = sum(latencies) / len(latencies) if latencies else 0.0
+    report = {
+        "examples": len(rows),
+        "test_examples": len(test),
+        "coverage": handled / len(test) if test else 0.0,
+        "accuracy_on_handled": correct / handled if handled else 0.0,
+        "mean_llm_latency_ms": mean_llm_ms,
+        "latency_saved_ms_per_message": mean_llm_ms * (handled / len(test)) if test else 0.0,
+    }
+    return report
+
+
+if __name__ == "__main__":
+    import sys
+    if "--train" in sys.argv:
+        train()
+    start = time.time()
+    print(json.dumps(evaluate(), indent=2))
+    print(f"Evaluated in {time.time() - start:.2f}s")
@@ -5,11 +5,7 @@ import re
 import sqlite3
 import os
 from datetime import datetime
-from openai import OpenAI
-from dotenv import load_dotenv
-
-load_dotenv()
-client = OpenAI()
+from studybar import llm, metrics
 
 class AnswerMarker:
     def __init__(self, log_dir="data/error_logs", db_path="data/error_logs.db"):
@@ -46,6 +42,7 @@ class AnswerMarker:
         conn.commit()
         conn.close()
 
+    @metrics.timed("marker.mark")
     def mark(self, student_answer, question_text, reference_context, topic=None):
         """
         Assess correctness and provide feedback.
@@ -69,10 +66,7 @@ class AnswerMarker:
         }}
         """
 
-        resp = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": prompt}]
-        )
+        resp = llm.chat([{"role": "user", "content": prompt}], model="gpt-4o-mini", site="marker")
         raw = resp.choices[0].message.content.strip()
 
         try:
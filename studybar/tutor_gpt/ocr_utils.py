@@ -2,11 +2,16 @@
 
 import io
 import os
-import fitz  # PyMuPDF for PDF page images
-import cv2
-import pytesseract
-import numpy as np
-from PIL import Image
+from typing import TYPE_CHECKING
+from studybar import metrics
+
+if TYPE_CHECKING:
+    import numpy as np
+    from PIL import Image
+
+# fitz (PyMuPDF), cv2, pytesseract, numpy and PIL are imported where they're
+# used: they cost more to import than the rest of the api put together, and
+# only the feedback path needs them.
 
 
 class OCRExtractor:
@@ -21,14 +26,19 @@ class OCRExtractor:
         self.embed_image = embed_fn_image
 
     # overall extract function
-    def extract(self, file_path: str):
+    @metrics.timed("ocr.extract")
+    def extract(self, file_path: str, on_page=None):
+        """
+        on_page: optional callable(page_number, total_pages) called as each
+        page finishes, for progress reporting on long PDFs.
+        """
 
         # ensure absolute path
         file_path = os.path.abspath(file_path)
 
         # case 1: file is a pdf
         if file_path.lower().endswith(".pdf"):
-            return self._extract_from_pdf(file_path)
+            return self._extract_from_pdf(file_path, on_page)
         
         # case 2: file is an image
         elif file_path.lower().endswith((".png", ".jpg", ".jpeg", ".bmp", ".tiff", ".gif")):
@@ -39,33 +49,42 @@ class OCRExtractor:
             return None
 
 
-    def _extract_from_pdf(self, pdf_path: str):
+    def _extract_from_pdf(self, pdf_path: str, on_page=None):
+        import fitz  # PyMuPDF for PDF page images
+        from PIL import Image
         doc = fitz.open(pdf_path)
         all_pages = []
         for i, page in enumerate(doc):
-            pix = page.get_pixmap(dpi=200)
-            img = Image.open(io.BytesIO(pix.tobytes("png")))
-            result = self._extract_from_pil(img)
+            with metrics.span("ocr.page", page=i + 1):
+                pix = page.get_pixmap(dpi=200)
+                img = Image.open(io.BytesIO(pix.tobytes("png")))
+                result = self._extract_from_pil(img)
             result["page"] = i + 1
             all_pages.append(result)
+            if on_page:
+                on_page(i + 1, len(doc))
         return all_pages
 
 
     def _extract_from_image(self, img_path: str):
+        import cv2
         img_path = os.path.abspath(img_path)
         img = cv2.imread(img_path)
         return self._extract_from_cv(img)
 
 
-    def _extract_from_pil(self, pil_img: Image.Image):
+    def _extract_from_pil(self, pil_img: "Image.Image"):
+        import cv2
+        import numpy as np
         cv_img = cv2.cvtColor(np.array(pil_img), cv2.COLOR_RGB2BGR)
         return self._extract_from_cv(cv_img)
 
 
-    def _extract_from_cv(self, cv_img: np.ndarray):
+    def _extract_from_cv(self, cv_img: "np.ndarray"):
         """
         Core OCR + analysis logic.
         """
+        import pytesseract
         # Step 1: OCR for text (supports handwritten via Tesseract or TrOCR if extended)
         text = pytesseract.image_to_string(cv_img, config="--psm 6").strip()
 
@@ -86,11 +105,13 @@ class OCRExtractor:
         }
 
 
-    def _detect_diagram(self, cv_img: np.ndarray) -> bool:
+    def _detect_diagram(self, cv_img: "np.ndarray") -> bool:
         """
         Simple heuristic: diagrams tend to have sparse text and more lines.
         (Later can use CNN or CLIP vision classifier)
         """
+        import cv2
+        import numpy as np
         gray = cv2.cvtColor(cv_img, cv2.COLOR_BGR2GRAY)
         edges = cv2.Canny(gray, 80, 150)
         line_count = np.sum(edges > 0)
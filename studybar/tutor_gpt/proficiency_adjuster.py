@@ -3,13 +3,25 @@
 import math
 import os
 
-def adjust_proficiency(current_level: float, score: float, q_type: str) -> float:
+# tuning constants; proficiency_replay.replay() takes the same keys to
+# recompute everyone's levels under new values
+PARAMS = {
+    "base_lr": 0.05,            # learning rate at level 0, shrinking to 0 at level 1
+    "structured_weight": 1.0,
+    "other_weight": 0.6,
+    "penalty_above": 0.6,       # wrong answers above this level...
+    "penalty": 1.5,             # ...cost this much more
+}
+
+
+def adjust_proficiency(current_level: float, score: float, q_type: str, params=None) -> float:
+    p = PARAMS if params is None else {**PARAMS, **params}
 
     # ---- Base learning rate (higher for lower levels) ----
-    base_lr = 0.05 * (1 - current_level)  # diminishing gains as proficiency rises
+    base_lr = p["base_lr"] * (1 - current_level)  # diminishing gains as proficiency rises
 
     # ---- Type weighting ----
-    type_weight = 1.0 if q_type == "structured" else 0.6
+    type_weight = p["structured_weight"] if q_type == "structured" else p["other_weight"]
 
     # ---- Correctness influence ----
     delta = (score - 0.5) * 2  # range -1 → +1
@@ -21,8 +33,8 @@ def adjust_proficiency(current_level: float, score: float, q_type: str) -> float
     change = base_lr * type_weight * delta
 
     # ---- Penalty scaling: harsher for higher levels when wrong ----
-    if delta < 0 and current_level > 0.6:
-        change *= 1.5
+    if delta < 0 and current_level > p["penalty_above"]:
+        change *= p["penalty"]
 
     # ---- Update and clamp ----
     new_level = current_level + change
@@ -0,0 +1,294 @@
+# batch replay of the answer history, and a knowledge-tracing fitter
+#
+# adjust_proficiency() moves one level by one answer. replay() runs the same
+# rule over every (student, topic) answer sequence at once: answers are sorted
+# into one segment per sequence, and step k updates the k-th answer of every
+# segment in a single numpy operation, so the Python loop runs over the
+# longest sequence (a few hundred answers in a term), never over students.
+# Pass other constants (keys of proficiency_adjuster.PARAMS) to see what
+# retuning the rule would have done to everyone's level.
+#
+# fit_bkt() fits Bayesian Knowledge Tracing per topic (p_init, p_learn,
+# p_guess, p_slip) by EM on the same segments: forward-backward steps through
+# them the same way and the expected counts are summed per topic with
+# bincount. An answer counts as correct when score >= CORRECT_AT.
+#
+#   python -m studybar.tutor_gpt.proficiency_replay [--base-lr 0.04 ...] [--bkt] [--write]
+
+import argparse, time
+
+from studybar import db, metrics
+from studybar.tutor_gpt.proficiency_adjuster import PARAMS
+
+CORRECT_AT = 0.5            # same split as adjust_proficiency's delta sign
+BKT_ITERATIONS = 50
+BKT_TOLERANCE = 1e-4        # stop when the log-likelihood gains less than this per answer
+BKT_START = {"p_init": 0.2, "p_learn": 0.1, "p_guess": 0.2, "p_slip": 0.1}
+BKT_MAX_GUESS = 0.3         # higher guess/slip fits "knowing" that predicts nothing
+BKT_MAX_SLIP = 0.3
+_EPS = 1e-6
+
+
+class _Segments:
+    """
+    Answers grouped by (student, topic), keeping their order within each
+    group. Arrays are in grouped order; `order` maps back to the input rows.
+    """
+
+    def __init__(self, rows):
+        import numpy as np
+        self.n = len(rows)
+        self.rows = rows
+        self.users, u = _codes([r[0] for r in rows])
+        self.topics, t = _codes([r[1] for r in rows])
+
+        # stable: answer order survives within a segment
+        self.order = np.argsort(u * max(1, len(self.topics)) + t, kind="stable")
+        u, t = u[self.order], t[self.order]
+        self.start = np.ones(self.n, dtype=bool)
+        self.start[1:] = (u[1:] != u[:-1]) | (t[1:] != t[:-1])
+        self.first = np.flatnonzero(self.start)
+        self.seg = np.cumsum(self.start) - 1
+        self.last = np.r_[self.first[1:], self.n] - 1
+        self.user, self.topic = u[self.first], t[self.first]  # per segment
+        self.answer_topic = t
+
+        step = np.arange(self.n) - self.first[self.seg]
+        self.by_step = np.argsort(step, kind="stable")
+        self.bounds = np.searchsorted(step[self.by_step], np.arange(step.max() + 2 if self.n else 1))
+
+    @property
+    def steps(self):
+        return len(self.bounds) - 1
+
+    def at(self, k):
+        """Grouped positions of every segment's k-th answer (ascending; at(0) is first)."""
+        return self.by_step[self.bounds[k]:self.bounds[k + 1]]
+
+    def column(self, i, dtype=float):
+        import numpy as np
+        return np.array([r[i] for r in self.rows], dtype=dtype)[self.order]
+
+    def keyed(self, values):
+        """{(student_id, topic): value} from a per-segment array."""
+        return {
+            (self.users[u], self.topics[t]): float(v)
+            for u, t, v in zip(self.user.tolist(), self.topic.tolist(), values.tolist())
+        }
+
+    def ungrouped(self, values):
+        import numpy as np
+        out = np.empty_like(values)
+        out[self.order] = values
+        return out
+
+
+def _codes(values):
+    """(distinct values in first-seen order, int code per value)."""
+    import numpy as np
+    index = {v: i for i, v in enumerate(dict.fromkeys(values))}
+    return list(index), np.fromiter(map(index.__getitem__, values), dtype=np.int64, count=len(values))
+
+
+def _round4(values):
+    """round(v, 4) elementwise. np.round scales by 1e4 first, which can tip near-ties the other way."""
+    import numpy as np
+    out = np.round(values, 4)
+    scaled = values * 1e4
+    near_tie = np.flatnonzero(np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6)
+    out[near_tie] = [round(v, 4) for v in values[near_tie].tolist()]
+    return out
+
+
+def load_history(student_ids=None):
+    """(student_id, topic, score, q_type, level_before) rows from the answers table, oldest first."""
+    return db.answer_history(student_ids)
+
+
+@metrics.timed("proficiency.replay")
+def replay(rows, params=None, from_zero=False):
+    """
+    Levels after re-running adjust_proficiency over each (student, topic)
+    sequence in `rows` (answer order, as load_history returns them).
+    Each sequence starts from the level recorded before its first answer,
+    or 0.0 with from_zero. Returns {"levels": {(student_id, topic): level},
+    "after": level after each row, "answers", "sequences", "steps"}.
+    """
+    import numpy as np
+    p = PARAMS if params is None else {**PARAMS, **params}
+    s = _Segments(rows)
+    if not s.n:
+        return {"levels": {}, "after": np.zeros(0), "answers": 0, "sequences": 0, "steps": 0}
+
+    score = s.column(2)
+    weight = np.where(s.column(3, object) == "structured", p["structured_weight"], p["other_weight"])
+    delta = (score - 0.5) * 2
+    if from_zero:
+        start_level = np.zeros(len(s.first))
+    else:
+        start_level = np.nan_to_num(s.column(4)[s.first], nan=0.0)
+
+    # same operations, in the same order, as adjust_proficiency, so levels match it exactly
+    after = np.empty(s.n)
+    for k in range(s.steps):
+        idx = s.at(k)
+        level = start_level if k == 0 else after[idx - 1]
+        change = p["base_lr"] * (1 - level) * weight[idx] * delta[idx]
+        penalised = (delta[idx] < 0) & (level > p["penalty_above"])
+        change[penalised] *= p["penalty"]
+        after[idx] = _round4(np.clip(level + change, 0.0, 1.0))
+
+    return {
+        "levels": s.keyed(after[s.last]),
+        "after": s.ungrouped(after),
+        "answers": s.n,
+        "sequences": len(s.first),
+        "steps": s.steps,
+    }
+
+
+# ---------- bayesian knowledge tracing ----------
+def _bkt_forward(s, correct, params):
+    """Per answer: P(known) given answers up to it, and P(answer | earlier answers)."""
+    import numpy as np
+    p_init, p_learn, p_guess, p_slip = (params[k][s.answer_topic] for k in ("p_init", "p_learn", "p_guess", "p_slip"))
+    p_if_known = np.where(correct, 1 - p_slip, p_slip)
+    p_if_unknown = np.where(correct, p_guess, 1 - p_guess)
+
+    prior = np.empty(s.n)
+    known = np.empty(s.n)   # P(known | answers up to and including this one)
+    scale = np.empty(s.n)
+    for k in range(s.steps):
+        idx = s.at(k)
+        if k == 0:
+            prior[idx] = p_init[idx]
+        else:
+            prev = idx - 1
+            prior[idx] = known[prev] + (1 - known[prev]) * p_learn[prev]
+        a = prior[idx] * p_if_known[idx]
+        scale[idx] = a + (1 - prior[idx]) * p_if_unknown[idx]
+        known[idx] = a / scale[idx]
+    return known, scale, p_learn, p_if_known, p_if_unknown
+
+
+def _bkt_em_step(s, correct, params):
+    import numpy as np
+    known, scale, p_learn, p_if_known, p_if_unknown = _bkt_forward(s, correct, params)
+
+    # scaled backward pass; the next answer in a segment is the next position
+    has_next = np.ones(s.n, dtype=bool)
+    has_next[s.last] = False
+    beta_known = np.ones(s.n)
+    beta_unknown = np.ones(s.n)
+    learned = np.zeros(s.n)         # expected unknown -> known transitions after each answer
+    for k in range(s.steps - 2, -1, -1):
+        idx = s.at(k)
+        idx = idx[has_next[idx]]
+        nxt = idx + 1
+        to_known = p_if_known[nxt] * beta_known[nxt] / scale[nxt]
+        to_unknown = p_if_unknown[nxt] * beta_unknown[nxt] / scale[nxt]
+        beta_known[idx] = to_known
+        beta_unknown[idx] = (1 - p_learn[idx]) * to_unknown + p_learn[idx] * to_known
+        learned[idx] = (1 - known[idx]) * p_learn[idx] * to_known
+
+    gamma_known = known * beta_known
+    gamma_unknown = (1 - known) * beta_unknown
+
+    n_topics = len(s.topics)
+    t = s.answer_topic
+
+    def per_topic(weights, at=None):
+        if at is None:
+            return np.bincount(t, weights=weights, minlength=n_topics)
+        return np.bincount(t[at], weights=weights[at], minlength=n_topics)
+
+    def ratio(num, den, fallback):
+        return np.where(den > 0, num / np.maximum(den, _EPS), fallback)
+
+    updated = {
+        "p_init": ratio(per_topic(gamma_known, s.first), np.bincount(s.topic, minlength=n_topics), params["p_init"]),
+        "p_learn": ratio(per_topic(learned), per_topic(gamma_unknown, has_next), params["p_learn"]),
+        "p_guess": ratio(per_topic(gamma_unknown * correct), per_topic(gamma_unknown), params["p_guess"]),
+        "p_slip": ratio(per_topic(gamma_known * ~correct), per_topic(gamma_known), params["p_slip"]),
+    }
+    updated["p_init"] = np.clip(updated["p_init"], _EPS, 1 - _EPS)
+    updated["p_learn"] = np.clip(updated["p_learn"], _EPS, 1 - _EPS)
+    updated["p_guess"] = np.clip(updated["p_guess"], _EPS, BKT_MAX_GUESS)
+    updated["p_slip"] = np.clip(updated["p_slip"], _EPS, BKT_MAX_SLIP)
+    return updated, float(np.log(scale).sum())
+
+
+@metrics.timed("proficiency.fit_bkt")
+def fit_bkt(rows, iterations=BKT_ITERATIONS, tolerance=BKT_TOLERANCE):
+    """
+    Fit per-topic BKT parameters to the answer rows by EM. Returns
+    {"params": {topic: {p_init, p_learn, p_guess, p_slip}},
+     "mastery": {(student_id, topic): P(known) after their last answer},
+     "log_likelihood", "iterations"}.
+    """
+    import numpy as np
+    s = _Segments(rows)
+    if not s.n:
+        return {"params": {}, "mastery": {}, "log_likelihood": 0.0, "iterations": 0}
+    correct = s.column(2) >= CORRECT_AT
+    params = {k: np.full(len(s.topics), v) for k, v in BKT_START.items()}
+
+    log_likelihood, done = -np.inf, 0
+    for done in range(1, iterations + 1):
+        updated, ll = _bkt_em_step(s, correct, params)
+        # ll is for the params going in; stop once they barely improve on the last
+        if ll - log_likelihood < tolerance * s.n:
+            log_likelihood = max(ll, log_likelihood)
+            break
+        params, log_likelihood = updated, ll
+
+    known, _, p_learn, _, _ = _bkt_forward(s, correct, params)
+    mastery = known[s.last] + (1 - known[s.last]) * p_learn[s.last]
+    return {
+        "params": {
+            topic: {k: float(v[i]) for k, v in params.items()} for i, topic in enumerate(s.topics)
+        },
+        "mastery": s.keyed(mastery),
+        "log_likelihood": log_likelihood,
+        "iterations": done,
+    }
+
+
+def write_levels(levels):
+    """Store replayed levels as the current proficiencies."""
+    db.set_proficiencies_many([(sid, topic, level) for (sid, topic), level in levels.items()])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    for key, value in PARAMS.items():
+        parser.add_argument("--" + key.replace("_", "-"), type=float, default=value)
+    parser.add_argument("--from-zero", action="store_true", help="start every sequence at 0.0")
+    parser.add_argument("--bkt", action="store_true", help="also fit knowledge tracing per topic")
+    parser.add_argument("--write", action="store_true", help="store the replayed levels")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    rows = load_history()
+    print(f"[REPLAY] loaded {len(rows)} answers in {time.perf_counter() - start:.2f}s")
+    params = {key: getattr(args, key) for key in PARAMS}
+    start = time.perf_counter()
+    result = replay(rows, params, from_zero=args.from_zero)
+    print(f"[REPLAY] {result['sequences']} sequences, longest {result['steps']}, "
+          f"in {time.perf_counter() - start:.2f}s")
+    if params != PARAMS:
+        current = replay(rows, from_zero=args.from_zero)["levels"]
+        moved = [abs(level - current[key]) for key, level in result["levels"].items()]
+        if moved:
+            print(f"[REPLAY] vs current constants: mean |change| {sum(moved) / len(moved):.4f}, "
+                  f"max {max(moved):.4f}")
+    if args.bkt:
+        start = time.perf_counter()
+        fit = fit_bkt(rows)
+        print(f"[BKT] {fit['iterations']} iterations, log-likelihood {fit['log_likelihood']:.1f}, "
+              f"in {time.perf_counter() - start:.2f}s")
+        for topic, p in fit["params"].items():
+            print(f"  {topic}: " + ", ".join(f"{k}={v:.3f}" for k, v in p.items()))
+    if args.write:
+        write_levels(result["levels"])
+        print(f"[REPLAY] wrote {len(result['levels'])} levels")
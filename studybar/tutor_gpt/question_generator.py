@@ -10,17 +10,14 @@ sys.path.append(STUDYBAR_ROOT)
 
 #-------------------------------------------#
 from studybar.document_embedding import process_pdf, BucketedIndex
+from studybar import llm, metrics, single_flight
+from studybar.context_packing import pack
 
-from openai import OpenAI
-from dotenv import load_dotenv
 import json
 import uuid
 import re
 
-
-load_dotenv()
-client = OpenAI()
-
+CONTEXT_TOKEN_BUDGET = 1600   # about what 8 contexts cut at 800 characters used to cost
 
 QUESTION_GEN_PROMPT = """
 You are a skilled teacher. Using the following context snippets, create {n} problems on the topic "{topic}" targeted at a student with mastery level {difficulty}
@@ -42,22 +39,31 @@ class ProblemGenerator:
     def __init__(self, bucketed_index: BucketedIndex):
         self.index = bucketed_index
 
+    @metrics.timed("question_generator.generate_problems")
     def generate_problems(self, topic: str, n: int = 5, difficulty: int = 2, user_prompt: str = ""):
+        # identical concurrent requests (a class asking for the same practice set,
+        # pool refills racing across workers) share one generation
+        return single_flight.run(
+            "generate_problems",
+            [self.index.data_path, topic, n, difficulty, user_prompt],
+            lambda: self._generate_problems(topic, n, difficulty, user_prompt),
+        )
+
+    def _generate_problems(self, topic, n, difficulty, user_prompt):
         contexts = self.index.get_contexts(topic, student_level=difficulty, k=8)
 
-        # build a compact contexts string (trim long contexts)
-        ctext = "\n\n".join([f"--- {c['id']} (p{c['page']}):\n{c['text'][:800].strip()}" for c in contexts])
+        # build a compact contexts string: overlapping sentences dropped, cut at sentence ends
+        ctext, _ = pack(contexts, CONTEXT_TOKEN_BUDGET, header=lambda c: f"--- {c['id']} (p{c['page']}):\n",
+                        site="question_generator")
 
         # sub in variables for the propmpt
         system_prompt = QUESTION_GEN_PROMPT.format(n=n, topic=topic, difficulty=difficulty, contexts=ctext)
 
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ]
-        )
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+        response = llm.chat(messages, model="gpt-4o-mini", site="question_generator")
 
         raw = response.choices[0].message.content.strip()
 
@@ -0,0 +1,169 @@
+# pre-generated practice problems per (topic, proficiency band)
+#
+# generate_problems is a multi-second llm call, so we keep a stock of
+# validated problems per band and refill it in the background whenever a
+# student's unseen stock drops below the low-water mark. Requests are only
+# ever served from memory: a short or cold (topic, band) serves what it has
+# (possibly nothing) and the refill fills it for the next request.
+
+import os, json, hashlib, threading
+from concurrent.futures import ThreadPoolExecutor
+
+from studybar import db, metrics
+
+N_BANDS = 5
+LOW_WATER = 6          # refill when a student has fewer unseen problems than this
+REFILL_BATCH = 5       # problems per generate_problems call
+MAX_STOCK = 200        # per (topic, band); oldest problems are dropped first
+
+BASE_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
+POOL_PATH = os.path.join(BASE_DATA_DIR, "question_pool.json")
+
+
+def band_for(level):
+    """Proficiency 0..1 -> band index 0..N_BANDS-1."""
+    return max(0, min(N_BANDS - 1, int(float(level) * N_BANDS)))
+
+
+def band_difficulty(band):
+    """Difficulty used when generating for a band (its midpoint)."""
+    return round((band + 0.5) / N_BANDS, 2)
+
+
+def problem_id(problem):
+    """Stable id from the question text, so regenerated duplicates collapse."""
+    text = " ".join(str(problem.get("question", "")).lower().split())
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+def validate(problem):
+    """A usable problem has a non-trivial question and an answer to mark against."""
+    if not isinstance(problem, dict):
+        return False
+    question = str(problem.get("question", "")).strip()
+    answer = str(problem.get("answer", "")).strip()
+    return len(question) >= 10 and bool(answer)
+
+
+class QuestionPool:
+    def __init__(self, generator, pool_path=POOL_PATH,
+                 low_water=LOW_WATER, refill_batch=REFILL_BATCH, max_stock=MAX_STOCK):
+        self.generator = generator
+        self.pool_path = pool_path
+        self.low_water = low_water
+        self.refill_batch = refill_batch
+        self.max_stock = max_stock
+        self._stock = {}        # {(topic, band): [problem, ...]} oldest first
+        self._refilling = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="question-pool")
+        self._load()
+
+    # ---------- persistence (so restarts don't start cold) ----------
+    def _load(self):
+        if not os.path.exists(self.pool_path):
+            return
+        try:
+            with open(self.pool_path, "r", encoding="utf-8") as f:
+                raw = json.load(f)
+            for key, problems in raw.items():
+                topic, band = key.rsplit("|", 1)
+                self._stock[(topic, int(band))] = problems
+        except Exception as e:
+            print(f"[WARN] Question pool snapshot unreadable, starting empty: {e}")
+
+    def _save(self):
+        with self._lock:
+            raw = {f"{topic}|{band}": list(problems) for (topic, band), problems in self._stock.items()}
+        tmp = self.pool_path + ".tmp"
+        os.makedirs(os.path.dirname(self.pool_path), exist_ok=True)
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(raw, f, ensure_ascii=False)
+        os.replace(tmp, self.pool_path)
+
+    # ---------- stock management ----------
+    def _add(self, key, problems):
+        """Validate, dedupe and append; returns the problems actually added."""
+        added = []
+        with self._lock:
+            stock = self._stock.setdefault(key, [])
+            known = {p["id"] for p in stock}
+            for p in problems:
+                if not validate(p):
+                    continue
+                p = dict(p, id=problem_id(p))
+                if p["id"] in known:
+                    continue
+                known.add(p["id"])
+                stock.append(p)
+                added.append(p)
+            del stock[:-self.max_stock]
+        return added
+
+    def _generate(self, topic, band):
+        result = self.generator.generate_problems(topic, n=self.refill_batch, difficulty=band_difficulty(band))
+        return self._add((topic, band), result["problems"])
+
+    def _refill(self, topic, band):
+        try:
+            added = self._generate(topic, band)
+            print(f"[POOL] Refilled {topic} band {band} with {len(added)} problems")
+            self._save()
+        except Exception as e:
+            print(f"[WARN] Question pool refill failed for {topic} band {band}: {e}")
+        finally:
+            with self._lock:
+                self._refilling.discard((topic, band))
+
+    def schedule_refill(self, topic, band):
+        with self._lock:
+            if (topic, band) in self._refilling:
+                return
+            self._refilling.add((topic, band))
+        self._executor.submit(self._refill, topic, band)
+
+    def warm(self, topics, bands=range(N_BANDS)):
+        """Queue background generation for topics that have no stock yet."""
+        for topic in topics:
+            for band in bands:
+                if not self._stock.get((topic, band)):
+                    self.schedule_refill(topic, band)
+
+    # ---------- serving ----------
+    def take(self, student_id, topic, level, n=3):
+        """
+        Return up to n problems this student hasn't seen, from the band
+        matching their level, and mark them seen. Never blocks on the llm:
+        fewer (or none) are returned when the stock is short, and it is
+        refilled in the background when the student's unseen stock runs low.
+        """
+        band = band_for(level)
+        seen = db.get_seen_problem_ids(student_id, topic)
+        with self._lock:
+            unseen = [p for p in self._stock.get((topic, band), []) if p["id"] not in seen]
+
+        metrics.cache_event("question_pool", "hit" if len(unseen) >= n else "miss")
+        served = unseen[:n]
+        if len(unseen) - len(served) < self.low_water:
+            self.schedule_refill(topic, band)
+
+        if served:
+            db.mark_problems_seen(student_id, topic, [p["id"] for p in served])
+        return served
+
+    def stock_levels(self):
+        with self._lock:
+            return {f"{topic}|{band}": len(problems) for (topic, band), problems in self._stock.items()}
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_question_pool(generator, pool_path=POOL_PATH):
+    """One pool per data file, shared by every tutor in the process."""
+    with _pools_lock:
+        if pool_path not in _pools:
+            pool = _pools[pool_path] = QuestionPool(generator, pool_path=pool_path)
+            metrics.QUEUE_DEPTH.track(lambda: len(pool._refilling), queue="question_pool_refill")
+        return _pools[pool_path]
@@ -0,0 +1,114 @@
+# rag query -> previously generated answer, when a near-identical question
+# was already answered from the same retrieved chunks
+#
+# Entries are scoped by (topic, fingerprint of the retrieved chunk ids), so a
+# cached answer is only reused when it was grounded in the same material.
+# Within a scope we match on cosine similarity of the query embeddings.
+
+import hashlib, random, threading, time
+from collections import OrderedDict
+
+DEFAULT_THRESHOLD = 0.93     # min cosine similarity between query embeddings
+DEFAULT_TTL = 24 * 3600      # seconds
+DEFAULT_MAX_ENTRIES = 5000
+DEFAULT_SAMPLE_RATE = 0.05   # fraction of hits re-answered fresh to measure drift
+
+
+def context_fingerprint(topic, contexts):
+    ids = sorted(str(c.get("id")) for c in contexts)
+    return hashlib.sha1(f"{topic}|{','.join(ids)}".encode("utf-8")).hexdigest()
+
+
+def _unit(v):
+    import numpy as np
+    v = np.asarray(v, dtype=np.float32)
+    n = np.linalg.norm(v)
+    return v / n if n else v
+
+
+class SemanticAnswerCache:
+    def __init__(self, threshold=DEFAULT_THRESHOLD, ttl=DEFAULT_TTL,
+                 max_entries=DEFAULT_MAX_ENTRIES, sample_rate=DEFAULT_SAMPLE_RATE):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.sample_rate = sample_rate
+        self._entries = OrderedDict()   # {entry_id: entry}, least recently used first
+        self._scopes = {}               # {scope: set(entry_id)}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "expired": 0, "evicted": 0,
+                       "drift_checks": 0, "drift_total": 0.0, "drift_max": 0.0}
+
+    def _remove(self, entry_id):
+        entry = self._entries.pop(entry_id)
+        ids = self._scopes.get(entry["scope"])
+        if ids is not None:
+            ids.discard(entry_id)
+            if not ids:
+                del self._scopes[entry["scope"]]
+
+    def lookup(self, scope, query_embedding):
+        """Return the cached entry (dict with 'answer') or None."""
+        q = _unit(query_embedding)
+        now = time.time()
+        with self._lock:
+            best_id, best_sim = None, self.threshold
+            for entry_id in list(self._scopes.get(scope, ())):
+                entry = self._entries[entry_id]
+                if now - entry["created_at"] > self.ttl:
+                    self._remove(entry_id)
+                    self._stats["expired"] += 1
+                    continue
+                sim = float(entry["query_embedding"] @ q)
+                if sim >= best_sim:
+                    best_id, best_sim = entry_id, sim
+            if best_id is None:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(best_id)
+            entry = self._entries[best_id]
+            entry["hits"] += 1
+            self._stats["hits"] += 1
+            return dict(entry, similarity=best_sim)
+
+    def store(self, scope, query_embedding, answer):
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = {
+                "id": entry_id,
+                "scope": scope,
+                "query_embedding": _unit(query_embedding),
+                "answer": answer,
+                "created_at": time.time(),
+                "hits": 0,
+            }
+            self._scopes.setdefault(scope, set()).add(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self._stats["evicted"] += 1
+
+    def should_sample(self):
+        return random.random() < self.sample_rate
+
+    def record_drift(self, cached_answer_embedding, fresh_answer_embedding):
+        """Cosine distance between a cached answer and a freshly generated one."""
+        drift = 1.0 - float(_unit(cached_answer_embedding) @ _unit(fresh_answer_embedding))
+        with self._lock:
+            self._stats["drift_checks"] += 1
+            self._stats["drift_total"] += drift
+            self._stats["drift_max"] = max(self._stats["drift_max"], drift)
+        return drift
+
+    def stats(self):
+        with self._lock:
+            s = dict(self._stats, entries=len(self._entries))
+        lookups = s["hits"] + s["misses"]
+        s["hit_rate"] = s["hits"] / lookups if lookups else 0.0
+        s["drift_mean"] = s["drift_total"] / s["drift_checks"] if s["drift_checks"] else 0.0
+        return s
+
+
+# shared across tutors so one student's answer can serve the whole cohort
+ANSWER_CACHE = SemanticAnswerCache()
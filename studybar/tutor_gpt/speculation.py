@@ -0,0 +1,106 @@
+# speculative execution helpers for the tutor pipeline
+#
+# While intent classification is in flight we already start the work most
+# messages need (retrieval, profile reload, optionally the general-chat
+# completion itself). Results that turn out to be unneeded are discarded and
+# counted as wasted, so we can see what speculation costs us.
+
+import queue, threading
+from concurrent.futures import ThreadPoolExecutor
+
+from studybar import metrics
+
+# shared by all tutors, one pool per kind of work so that long tasks never
+# queue ahead of what a request is waiting on:
+#   EXECUTOR         short critical-path tasks (retrieval, profile reload)
+#   STREAM_EXECUTOR  speculative chat completions, each holding a worker for
+#                    its whole stream; when every slot is busy the completion
+#                    isn't speculated at all rather than queued
+#   BACKGROUND       fire-and-forget checks nobody waits on (intent shadow
+#                    labels, semantic cache drift)
+MAX_SPECULATIVE_STREAMS = 4
+EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="speculate")
+STREAM_EXECUTOR = ThreadPoolExecutor(max_workers=MAX_SPECULATIVE_STREAMS, thread_name_prefix="speculate-stream")
+BACKGROUND = ThreadPoolExecutor(max_workers=2, thread_name_prefix="speculate-bg")
+_stream_slots = threading.BoundedSemaphore(MAX_SPECULATIVE_STREAMS)
+metrics.QUEUE_DEPTH.track(lambda: EXECUTOR._work_queue.qsize(), queue="speculation")
+metrics.QUEUE_DEPTH.track(lambda: BACKGROUND._work_queue.qsize(), queue="speculation_background")
+
+_stats_lock = threading.Lock()
+_stats = {
+    "requests": 0,           # handle_prompt calls in speculative mode
+    "retrieval_started": 0,
+    "retrieval_used": 0,
+    "chat_started": 0,
+    "chat_used": 0,
+    "chat_skipped": 0,       # no free stream slot
+}
+
+_DONE = object()
+
+
+def record(key, n=1):
+    with _stats_lock:
+        _stats[key] = _stats.get(key, 0) + n
+
+
+def speculation_stats():
+    """Counters plus how often speculative work was thrown away."""
+    with _stats_lock:
+        s = dict(_stats)
+    for kind in ("retrieval", "chat"):
+        started, used = s[f"{kind}_started"], s[f"{kind}_used"]
+        s[f"{kind}_wasted"] = started - used
+        s[f"{kind}_wasted_rate"] = (started - used) / started if started else 0.0
+    return s
+
+
+def start_stream(make_stream):
+    """A SpeculativeStream for make_stream(), or None if every stream slot is busy."""
+    if not _stream_slots.acquire(blocking=False):
+        record("chat_skipped")
+        return None
+    try:
+        return SpeculativeStream(make_stream, slot=_stream_slots)
+    except BaseException:
+        _stream_slots.release()
+        raise
+
+
+class SpeculativeStream:
+    """
+    Consume a token generator in the background, buffering deltas until the
+    caller decides whether it wants them. cancel() stops reading and closes
+    the underlying generator, which drops the http stream.
+    """
+
+    def __init__(self, make_stream, slot=None):
+        self._queue = queue.Queue()
+        self._slot = slot   # released when the stream ends (see start_stream)
+        self._cancelled = threading.Event()
+        self._future = STREAM_EXECUTOR.submit(self._run, make_stream)
+
+    def _run(self, make_stream):
+        stream = None
+        try:
+            stream = make_stream()
+            for delta in stream:
+                if self._cancelled.is_set():
+                    break
+                self._queue.put(delta)
+        finally:
+            if stream is not None:
+                stream.close()
+            self._queue.put(_DONE)
+            if self._slot is not None:
+                self._slot.release()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def __iter__(self):
+        while True:
+            delta = self._queue.get()
+            if delta is _DONE:
+                return
+            yield delta
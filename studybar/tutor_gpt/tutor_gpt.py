@@ -1,34 +1,63 @@
 # tutor gpt orchestrator
 # supports multimodal messages, persistent chat history
 
-import os, json
+import os, json, time, random, queue, threading, contextvars
 from datetime import datetime
-from openai import OpenAI
 from dotenv import load_dotenv
 
 from studybar.tutor_gpt.question_generator import ProblemGenerator
-from studybar.document_embedding import BucketedIndex
+from studybar.document_embedding import BucketedIndex, embed_text
 from studybar.tutor_gpt.feedback import get_feedback
 from studybar.tutor_gpt.proficiency_adjuster import adjust_proficiency
+from studybar.tutor_gpt.intent_classifier import LocalIntentClassifier, log_example, INTENTS
+from studybar.tutor_gpt.context_window import ConversationWindow, format_summary_request, DEFAULT_MAX_TOKENS
+from studybar.tutor_gpt.question_pool import get_question_pool
+from studybar.tutor_gpt.history import read_head_and_tail
+from studybar.tutor_gpt.semantic_cache import ANSWER_CACHE, context_fingerprint
+from studybar.tutor_gpt.speculation import BACKGROUND, EXECUTOR, record as record_speculation, start_stream
 from studybar.student_profile import StudentProfile
+from studybar.context_packing import pack
+from studybar import db, llm, metrics
 
 load_dotenv()
-client = OpenAI()
 
 
 # ---------- absolute base data path ----------
 BASE_DATA_DIR = "/workspaces/studybar/studybar/data"
 
+# fraction of locally classified messages also sent to the llm, to keep
+# measuring agreement between the local tiers and the llm labels
+INTENT_SHADOW_RATE = float(os.getenv("STUDYBAR_INTENT_SHADOW_RATE", "0.05"))
+
+# speculative mode: run retrieval/profile reload (and optionally the chat
+# completion) concurrently with intent classification
+SPECULATIVE = os.getenv("STUDYBAR_SPECULATIVE", "0") == "1"
+SPECULATE_CHAT = os.getenv("STUDYBAR_SPECULATE_CHAT", "0") == "1"
+
+INTENT_TIMEOUT = 10.0  # seconds; classification falls back to general_chat
+
+BUSY_REPLY = "[Error] The tutor is busy right now. Please try again in a minute."
+
+RAG_CONTEXT_TOKENS = 1200  # retrieved context per rag prompt
+
+# messages kept in memory; older ones live only on disk (and in the summary)
+HISTORY_TAIL = 200
+
 
 class TutorGPT:
     def __init__(self, student_id, conversation_id,
                  data_dir=BASE_DATA_DIR,
-                 embeddings_dir=os.path.join(BASE_DATA_DIR, "embeddings")):
+                 embeddings_dir=os.path.join(BASE_DATA_DIR, "embeddings"),
+                 context_budget=DEFAULT_MAX_TOKENS,
+                 speculative=SPECULATIVE,
+                 speculate_chat=SPECULATE_CHAT):
         self.student_id = student_id
         self.conversation_id = conversation_id
         # Extract subject from conversation_id (format: "subject_topic")
         self.subject = conversation_id.split("_")[0]
         self.data_dir = data_dir
+        self.speculative = speculative
+        self.speculate_chat = speculative and speculate_chat
 
         # profile handling
         profile_path = os.path.join(BASE_DATA_DIR, "student_profiles.json")
@@ -37,6 +66,7 @@ class TutorGPT:
         # topic embeddings and generator
         self.index = BucketedIndex(embeddings_dir)
         self.generator = ProblemGenerator(self.index)
+        self.question_pool = get_question_pool(self.generator, os.path.join(data_dir, "question_pool.json"))
 
         # set up per-student conversation memory with conversation_id
         student_dir = os.path.join(data_dir, "students", student_id)
@@ -45,21 +75,65 @@ class TutorGPT:
 
         self.conversation_history = self._load_conversation()
         self.last_response_id = None
+        self.intent_classifier = LocalIntentClassifier()
+
+        # only a token-budgeted window of the history is sent to the model
+        self.window = ConversationWindow(
+            os.path.join(student_dir, f"{conversation_id}_summary.json"),
+            summarize_fn=self._summarize_turns,
+            max_tokens=context_budget,
+        )
 
     # ---------- conversation persistence ----------
     def _load_conversation(self):
+        """System prompt + the last HISTORY_TAIL messages; the rest stays on disk."""
         if os.path.exists(self.convo_path):
-            with open(self.convo_path, "r", encoding="utf-8") as f:
-                return [json.loads(line) for line in f]
+            head, tail, skipped = read_head_and_tail(self.convo_path, HISTORY_TAIL)
+            # absolute index of the first loaded message, for the context window
+            self.history_offset = skipped
+            self._persisted = len(head) + len(tail)
+            return head + tail
+        self.history_offset = 0
+        self._persisted = 0
         return [{"role": "system", "content": f"You are a {self.subject} tutor helping a student learn interactively."}]
 
     def _save_conversation(self):
-        with open(self.convo_path, "w", encoding="utf-8") as f:
-            for m in self.conversation_history:
+        # the file is append-only: write just the messages added since the last save
+        with open(self.convo_path, "a", encoding="utf-8") as f:
+            for m in self.conversation_history[self._persisted:]:
                 f.write(json.dumps(m, ensure_ascii=False) + "\n")
+        self._persisted = len(self.conversation_history)
+
+        # keep memory bounded on very long conversations
+        if len(self.conversation_history) - 1 > 2 * HISTORY_TAIL:
+            drop = len(self.conversation_history) - 1 - HISTORY_TAIL
+            self.conversation_history = self.conversation_history[:1] + self.conversation_history[1 + drop:]
+            self.history_offset += drop
+            self._persisted -= drop
 
     # ---------- cheap intent classifier ----------
+    @metrics.timed("tutor.classify_intent")
     def classify_intent(self, user_prompt):
+        """Local rules/model first; only ask the llm when they're not confident."""
+        local_intent, confidence, source = self.intent_classifier.predict(user_prompt)
+        if local_intent is not None:
+            print(f"[DEBUG intent local ({source}, {confidence:.2f})]: {local_intent}")
+            self.intent_classifier.record(source)
+            metrics.cache_event("intent_local", "hit")
+            if random.random() < INTENT_SHADOW_RATE:
+                # off the critical path: the reply never waits for the shadow label
+                BACKGROUND.submit(self._shadow_check, user_prompt, local_intent)
+            return local_intent
+
+        self.intent_classifier.record("llm")
+        metrics.cache_event("intent_local", "miss")
+        return self._classify_intent_llm(user_prompt)
+
+    def _shadow_check(self, user_prompt, local_intent):
+        llm_intent = self._classify_intent_llm(user_prompt)
+        self.intent_classifier.record("llm", local_intent, llm_intent)
+
+    def _classify_intent_llm(self, user_prompt):
         prompt = f"""
         Classify this student message into one of the intents:
         ["generate_questions", "get_feedback", "rag_query", "general_chat"].
@@ -67,66 +141,194 @@ class TutorGPT:
         Respond with just the label.
         """
         try:
-            resp = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[{"role": "user", "content": prompt}]
-            )
+            start = time.time()
+            # on every message's critical path, so a short timeout and no long retries
+            resp = llm.chat([{"role": "user", "content": prompt}], model="gpt-4o-mini", site="intent",
+                            timeout=INTENT_TIMEOUT, max_attempts=2)
             intent = resp.choices[0].message.content.strip().lower().split()[0]
             print(f"[DEBUG intent response]: {intent}")
+            if intent in INTENTS:
+                # logged llm labels are the training data for the local model
+                log_example(user_prompt, intent, latency_ms=(time.time() - start) * 1000)
             return intent
         except Exception as e:
             print("[Error in classify_intent]", e)
             return "general_chat"
 
     # ---------- LLM helper ----------
-    def call_llm(self, messages):
+    def call_llm(self, messages, site="chat"):
         try:
-            resp = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=messages
-            )
+            resp = llm.chat(messages, model="gpt-4o-mini", site=site)
             self.last_response_id = resp.id
             return resp.choices[0].message.content.strip()
+        except llm.LLMUnavailable as e:
+            print(f"[LLM Unavailable] {e}")
+            return BUSY_REPLY
         except Exception as e:
             import traceback; traceback.print_exc()
             print(f"[LLM Error] {e}")
             return "[Error] Something went wrong calling the tutor model."
 
+    def call_llm_stream(self, messages, site="chat"):
+        """Yield content deltas as they arrive from a streaming completion."""
+        try:
+            for chunk in llm.chat_stream(messages, model="gpt-4o-mini", site=site):
+                self.last_response_id = chunk.id
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        except llm.LLMUnavailable as e:
+            print(f"[LLM Unavailable] {e}")
+            yield BUSY_REPLY
+        except Exception as e:
+            import traceback; traceback.print_exc()
+            print(f"[LLM Error] {e}")
+            yield "[Error] Something went wrong calling the tutor model."
+
+    def _summarize_turns(self, summary, messages):
+        request = [{"role": "user", "content": format_summary_request(summary, messages)}]
+        resp = llm.chat(request, model="gpt-4o-mini", site="summary")
+        return resp.choices[0].message.content.strip()
+
     # ---------- main handler ----------
     def handle_prompt(self, user_prompt):
-        self.conversation_history.append({"role": "user", "content": user_prompt})
-        intent = self.classify_intent(user_prompt)
-        print(f"[Intent: {intent}]")
-
-        if intent == "generate_questions":
-            reply = self._handle_question_generation()
-        elif intent == "get_feedback":
-            reply = self._handle_feedback()
-        elif intent == "rag_query":
-            reply = self._handle_rag_query(user_prompt)
+        reply = ""
+        for event in self.handle_prompt_stream(user_prompt):
+            if event["type"] == "done":
+                reply = event["reply"]
+        return reply
+
+    def handle_prompt_stream(self, user_prompt):
+        """
+        Same pipeline as handle_prompt, as a generator of events:
+          {"type": "status", "message": str}  progress on slow paths (OCR, question generation)
+          {"type": "token", "content": str}   reply text as it is generated
+          {"type": "done", "reply": str}      full reply, after it has been persisted
+        """
+        with metrics.span("tutor.handle_prompt", student=self.student_id) as sp:
+            self.conversation_history.append({"role": "user", "content": user_prompt})
+            speculation = self._start_speculation(user_prompt) if self.speculative else None
+            intent = self.classify_intent(user_prompt)
+            print(f"[Intent: {intent}]")
+            sp.set(intent=intent)
+            if speculation:
+                self._settle_speculation(speculation, intent)
+
+            if intent == "generate_questions":
+                reply = yield from self._with_progress(self._handle_question_generation)
+                yield {"type": "token", "content": reply}
+            elif intent == "get_feedback":
+                reply = yield from self._with_progress(self._handle_feedback)
+                yield {"type": "token", "content": reply}
+            else:
+                if intent == "rag_query":
+                    yield {"type": "status", "message": "Searching your notes..."}
+                    retrieval = speculation["retrieval"].result() if speculation else self._retrieve(user_prompt)
+                    stream = self._rag_reply_stream(retrieval)
+                elif speculation and "chat" in speculation:
+                    stream = speculation["chat"]
+                else:
+                    stream = self.call_llm_stream(self.window.build(self.conversation_history, self.history_offset))
+                parts = []
+                for delta in stream:
+                    parts.append(delta)
+                    yield {"type": "token", "content": delta}
+                reply = "".join(parts).strip()
+
+            self.conversation_history.append({"role": "assistant", "content": reply})
+            self._save_conversation()
+            yield {"type": "done", "reply": reply}
+
+    # ---------- speculative execution ----------
+    def _start_speculation(self, user_prompt):
+        """Kick off work most intents need while classify_intent is still running."""
+        record_speculation("requests")
+        # read from the profile here, before the refresh below starts replacing it
+        topic = self.profile.data["last_activity"] or "atomic_structure"
+        level = self.profile.get_level(topic)
+        speculation = {
+            "profile": EXECUTOR.submit(self.profile.refresh),
+            "retrieval": EXECUTOR.submit(self._retrieve, user_prompt, topic, level),
+        }
+        record_speculation("retrieval_started")
+        if self.speculate_chat:
+            # window.build may fold old turns (an llm call, a _summary.json write
+            # and changes to the window), so it runs here; only the completion
+            # is speculative
+            messages = self.window.build(self.conversation_history, self.history_offset)
+            chat = start_stream(lambda: self.call_llm_stream(messages))
+            if chat is not None:
+                speculation["chat"] = chat
+                record_speculation("chat_started")
+        return speculation
+
+    def _settle_speculation(self, speculation, intent):
+        """Wait for the profile reload; keep what this intent needs and cancel the rest."""
+        try:
+            speculation["profile"].result()
+        except Exception as e:
+            print(f"[WARN] Profile refresh failed, using cached profile: {e}")
+
+        if intent == "rag_query":
+            record_speculation("retrieval_used")
         else:
-            reply = self.call_llm(self.conversation_history)
+            speculation["retrieval"].cancel()
 
-        self.conversation_history.append({"role": "assistant", "content": reply})
-        self._save_conversation()
-        return reply
+        chat = speculation.get("chat")
+        if chat is None:
+            return
+        if intent in ("generate_questions", "get_feedback", "rag_query"):
+            chat.cancel()
+            del speculation["chat"]
+        else:
+            record_speculation("chat_used")
+
+    def _with_progress(self, handler, *args):
+        """Run handler(progress=...) in a thread, yielding its progress messages as status events."""
+        events = queue.Queue()
+        result = {}
+
+        def run():
+            try:
+                result["value"] = handler(*args, progress=events.put)
+            except Exception as e:
+                result["error"] = e
+            finally:
+                events.put(None)
+
+        # copy the context so spans in the handler nest under this request's trace
+        threading.Thread(target=contextvars.copy_context().run, args=(run,), daemon=True).start()
+        while True:
+            message = events.get()
+            if message is None:
+                break
+            yield {"type": "status", "message": message}
+        if "error" in result:
+            raise result["error"]
+        return result["value"]
 
     # ---------- specific handlers ----------
-    def _handle_question_generation(self):
+    @metrics.timed("tutor.question_generation")
+    def _handle_question_generation(self, progress=None):
         topic = self.profile.data["last_activity"] or "atomic_structure"
         prof = self.profile.get_level(topic)
-        result = self.generator.generate_problems(topic, n=3, difficulty=prof)
-        problems = result["problems"]
+        if progress:
+            progress("Picking practice questions...")
+        problems = self.question_pool.take(self.student_id, topic, prof, n=3)
+        if not problems:
+            # the pool is being refilled in the background
+            return (f"I don't have any new practice questions on {topic.replace('_', ' ')} ready yet. "
+                    "I'm preparing some now, so ask again in a minute.")
         reply = "\n\n".join([f"Q{i+1}: {p['question']}" for i, p in enumerate(problems)])
         return reply
 
-    def _handle_feedback(self):
+    @metrics.timed("tutor.feedback")
+    def _handle_feedback(self, progress=None):
         topic = self.profile.data["last_activity"] or "atomic_structure"
         context = "Relevant notes or retrieved context"  # to be replaced with RAG context
         answer_path = "/path/to/student/answer.pdf"
 
         try:
-            result = get_feedback(answer_path, "previous question", context, topic)
+            result = get_feedback(answer_path, "previous question", context, topic, progress=progress)
         except Exception as e:
             import traceback; traceback.print_exc()
             return f"[Error] Feedback failed: {e}"
@@ -136,9 +338,71 @@ class TutorGPT:
         old_level = self.profile.get_level(topic)
         new_level = adjust_proficiency(old_level, score, q_type)
         self.profile.update_level(topic, new_level)
+        # kept so levels can be replayed when adjust_proficiency is retuned
+        db.record_answer(self.student_id, topic, score, q_type, old_level)
 
         return f"Score: {score:.2f}\nFeedback: {result.get('feedback')}\nNew proficiency: {new_level:.2f}"
 
+    @metrics.timed("tutor.retrieve")
+    def _retrieve(self, query, topic=None, level=None):
+        """Embed the query and pull the most similar chunks (random sample if embeddings are unavailable)."""
+        if topic is None:
+            topic = self.profile.data["last_activity"] or "atomic_structure"
+        try:
+            query_embedding = embed_text(query)
+        except Exception as e:
+            print(f"[WARN] Query embedding failed, falling back to sampled contexts: {e}")
+            query_embedding = None
+
+        if query_embedding is not None:
+            contexts = self.index.search(topic, query_embedding, k=5)
+        else:
+            if level is None:
+                level = self.profile.get_level(topic)
+            contexts = self.index.get_contexts(topic, student_level=level, k=6)[:5]
+        return {"topic": topic, "query": query, "contexts": contexts, "query_embedding": query_embedding}
+
+    def _rag_messages(self, retrieval):
+        # most similar chunks first, overlapping sentences dropped, within the token budget
+        ctext, _ = pack(retrieval["contexts"], RAG_CONTEXT_TOKENS, site="rag")
+        prompt = f"Answer this based only on the following:\n\n{ctext}\n\nQuestion: {retrieval['query']}"
+        return [{"role": "user", "content": prompt}]
+
+    def _rag_reply_stream(self, retrieval):
+        """Yield the answer to a rag query, from the shared semantic cache when possible."""
+        messages = self._rag_messages(retrieval)
+        query_embedding = retrieval["query_embedding"]
+        scope = context_fingerprint(retrieval["topic"], retrieval["contexts"])
+        if query_embedding is not None:
+            hit = ANSWER_CACHE.lookup(scope, query_embedding)
+            metrics.cache_event("semantic_answer", "hit" if hit else "miss")
+            if hit:
+                print(f"[CACHE] Semantic hit (similarity {hit['similarity']:.3f})")
+                if ANSWER_CACHE.should_sample():
+                    BACKGROUND.submit(self._check_cached_answer, hit["answer"], messages)
+                yield hit["answer"]
+                return
+
+        parts = []
+        for delta in self.call_llm_stream(messages, site="rag"):
+            parts.append(delta)
+            yield delta
+        answer = "".join(parts).strip()
+        if query_embedding is not None and not answer.startswith("[Error]"):
+            ANSWER_CACHE.store(scope, query_embedding, answer)
+
+    def _check_cached_answer(self, cached_answer, messages):
+        """Sampled check: how far is the cached answer from a fresh one?"""
+        try:
+            fresh = self.call_llm(messages, site="rag_drift_check")
+            drift = ANSWER_CACHE.record_drift(embed_text(cached_answer), embed_text(fresh))
+            print(f"[CACHE] Sampled drift check: {drift:.3f}")
+        except Exception as e:
+            print(f"[WARN] Drift check failed: {e}")
+
+    def _handle_rag_query(self, query):
+        return "".join(self._rag_reply_stream(self._retrieve(query))).strip()
+
 
 # ---------- absolute log path ----------
 LOG_FILE = os.path.join(BASE_DATA_DIR, "tutor_debug.log")
@@ -146,13 +410,7 @@ LOG_FILE = os.path.join(BASE_DATA_DIR, "tutor_debug.log")
 def debug_log(*args):
     with open(LOG_FILE, "a", encoding="utf-8") as f:
         f.write(f"[{datetime.now().isoformat()}] " + " ".join(map(str, args)) + "\n")
-
-    def _handle_rag_query(self, query):
-        topic = self.profile.data["last_activity"] or "atomic_structure"
-        contexts = self.index.get_contexts(topic, student_level=self.profile.get_level(topic), k=6)
-        ctext = "\n\n".join([c["text"] for c in contexts[:5]])
-        prompt = f"Answer this based only on the following:\n\n{ctext}\n\nQuestion: {query}"
-        return self.call_llm([{"role": "user", "content": prompt}])
+    metrics.log_event("debug", message=" ".join(map(str, args)))
 
 
 if __name__ == "__main__":
@@ -1,4 +1,4 @@
-import React from "react";
+import React, { useLayoutEffect, useRef } from "react";
 import { ChatMessage } from "./ChatWindow";
 import { ChatBubble } from "./ChatBubble";
 
@@ -6,14 +6,39 @@ import { ChatBubble } from "./ChatBubble";
 interface ChatMessagesProps {
   messages: ChatMessage[];
   loading?: boolean; // ✅ add this line
+  onReachTop?: () => void; // load older messages when scrolled to the top
 }
 
 export const ChatMessages: React.FC<ChatMessagesProps> = ({
   messages,
   loading = false,
+  onReachTop,
 }) => {
+  const containerRef = useRef<HTMLDivElement>(null);
+  const firstIdRef = useRef<string | undefined>(undefined);
+  const heightRef = useRef(0);
+
+  // keep the view still when older messages are prepended above it
+  useLayoutEffect(() => {
+    const el = containerRef.current;
+    if (!el) return;
+    const firstId = messages[0]?.id;
+    if (!firstIdRef.current && firstId) {
+      // first page of a conversation: start at the newest message
+      el.scrollTop = el.scrollHeight;
+    } else if (firstIdRef.current && firstId !== firstIdRef.current && el.scrollTop < 40) {
+      el.scrollTop += el.scrollHeight - heightRef.current;
+    }
+    firstIdRef.current = firstId;
+    heightRef.current = el.scrollHeight;
+  }, [messages]);
+
+  const handleScroll = (e: React.UIEvent<HTMLDivElement>) => {
+    if (onReachTop && e.currentTarget.scrollTop < 40) onReachTop();
+  };
+
   return (
-    <div className="chatmessages">
+    <div className="chatmessages" ref={containerRef} onScroll={handleScroll}>
       {messages.map((msg) => (
         <ChatBubble key={msg.id} message={msg} />
       ))}
@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from "react";
+import React, { useState, useEffect, useRef } from "react";
 import { ChatInput } from "./ChatInput";
 import { ChatMessages } from "./ChatMessages";
 import { API_BASE_URL } from "/workspaces/studybar/ui/config.ts";
@@ -14,6 +14,42 @@ export interface ChatMessage {
   type: "user" | "bot";
 }
 
+/** Parse a text/event-stream body, calling onEvent for each complete event */
+async function readServerSentEvents(
+  body: ReadableStream<Uint8Array>,
+  onEvent: (event: string, data: any) => void
+) {
+  const reader = body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    let sep;
+    while ((sep = buffer.indexOf("\n\n")) !== -1) {
+      const raw = buffer.slice(0, sep);
+      buffer = buffer.slice(sep + 2);
+      let event = "message";
+      let data = "";
+      for (const line of raw.split("\n")) {
+        if (line.startsWith("event:")) event = line.slice(6).trim();
+        else if (line.startsWith("data:")) data += line.slice(5).trim();
+      }
+      if (data) onEvent(event, JSON.parse(data));
+    }
+  }
+}
+
+const HISTORY_PAGE = 50;
+
+/** Stored conversation messages (the system prompt excluded) as chat bubbles */
+function toChatMessages(stored: { role: string; content: string }[]): ChatMessage[] {
+  return stored
+    .filter((m) => m.role === "user" || m.role === "assistant")
+    .map((m): ChatMessage => ({ id: crypto.randomUUID(), text: m.content, type: m.role === "user" ? "user" : "bot" }));
+}
+
 export function ChatWindow () {
   const [messages, setMessages] = useState<ChatMessage[]>([]);
   const [isLoading, setIsLoading] = useState(false);
@@ -28,9 +64,48 @@ export function ChatWindow () {
   const topic = selectedData?.topic.name;
   const conversationId = selectedData?.topic.conversationId;
 
-  // Clear messages when topic changes
+  // history pages: cursor of the next older page (null once the start is reached)
+  const historyCursor = useRef<number | null>(null);
+  const loadingHistory = useRef(false);
+  const conversationIdRef = useRef(conversationId);
+
+  /** Fetch one page of stored messages and prepend it */
+  const loadHistory = async (before?: number) => {
+    if (!conversationId || loadingHistory.current) return;
+    loadingHistory.current = true;
+    const requestedFor = conversationId;
+    try {
+      const params = new URLSearchParams({ limit: String(HISTORY_PAGE) });
+      if (before !== undefined) params.set("before", String(before));
+      const res = await fetch(
+        `${API_BASE_URL}/api/tutor/${studentId}/${conversationId}/history?${params}`
+      );
+      const data = await res.json();
+      if (requestedFor !== conversationIdRef.current) return; // topic changed meanwhile
+      if (data.status !== "ok") {
+        historyCursor.current = null;
+        return;
+      }
+      historyCursor.current = data.next_cursor;
+      setMessages((prev) => [...toChatMessages(data.messages), ...prev]);
+    } catch (err) {
+      console.error("Error loading history:", err);
+    } finally {
+      if (requestedFor === conversationIdRef.current) loadingHistory.current = false;
+    }
+  };
+
+  const loadOlder = () => {
+    if (historyCursor.current !== null) loadHistory(historyCursor.current);
+  };
+
+  // Show the latest page of the conversation when the topic changes
   useEffect(() => {
+    conversationIdRef.current = conversationId;
     setMessages([]);
+    historyCursor.current = null;
+    loadingHistory.current = false;
+    loadHistory();
   }, [conversationId]);
 
   /** Send text and files to the API */
@@ -92,14 +167,46 @@ export function ChatWindow () {
         });
 
         const data = await res.json();
-        const botReply = data.status === "ok"
-          ? `📘 Flashcards generated (${data.flashcards.length} items)!`
-          : "Could not generate flashcards.";
-
+        const botId = crypto.randomUUID();
+        const setBotText = (text: string) =>
+          setMessages((prev) => prev.map((m) => (m.id === botId ? { ...m, text } : m)));
         setMessages((prev) => [
           ...prev,
-          { id: crypto.randomUUID(), text: botReply, type: "bot" },
+          { id: botId, text: "📘 Generating flashcards...", type: "bot" },
         ]);
+
+        if (data.status === "cached") {
+          setBotText(`📘 Flashcards generated (${data.data.length} items)!`);
+        } else if (data.job_id) {
+          // generation runs in the background; poll the job, showing partial results
+          while (true) {
+            const jobRes = await fetch(`${API_BASE_URL}/api/flashcards/jobs/${data.job_id}`);
+            const job = await jobRes.json();
+            // the api says when a job is finished (done, partial or failed)
+            if (job.finished) {
+              if (job.status === "done") {
+                setBotText(`📘 Flashcards generated (${job.flashcards.length} items)!`);
+              } else if (job.status === "partial") {
+                setBotText(
+                  `📘 Flashcards partly generated (${job.flashcards.length} items): ${job.error}. ` +
+                    "Upload the file again to retry the rest."
+                );
+              } else {
+                setBotText("Could not generate flashcards.");
+              }
+              break;
+            }
+            const { done, total } = job.progress;
+            setBotText(
+              total
+                ? `📘 Generating flashcards... ${done}/${total} sections read, ${job.flashcards.length} found so far`
+                : "📘 Generating flashcards..."
+            );
+            await new Promise((resolve) => setTimeout(resolve, 1500));
+          }
+        } else {
+          setBotText("Could not generate flashcards.");
+        }
       } else if (text.trim()) {
         // Send chat message to /chat with conversation_id
         const formData = new FormData();
@@ -107,21 +214,32 @@ export function ChatWindow () {
         formData.append("conversation_id", conversationId);
         formData.append("message", text);
 
-        const res = await fetch(`${API_BASE_URL}/api/tutor/chat`, {
+        const res = await fetch(`${API_BASE_URL}/api/tutor/chat/stream`, {
           method: "POST",
           body: formData,
         });
+        if (!res.ok || !res.body) throw new Error(`Chat request failed (${res.status})`);
 
-        const data = await res.json();
+        // Stream the reply into a single bot message as events arrive
+        const botId = crypto.randomUUID();
+        setMessages((prev) => [...prev, { id: botId, text: "", type: "bot" }]);
+        const updateBot = (text: string) =>
+          setMessages((prev) => prev.map((m) => (m.id === botId ? { ...m, text } : m)));
 
-        setMessages((prev) => [
-          ...prev,
-          {
-            id: crypto.randomUUID(),
-            text: data.reply ?? "No response received.",
-            type: "bot",
-          },
-        ]);
+        let received = "";
+        await readServerSentEvents(res.body, (event, data) => {
+          if (event === "status" && !received) {
+            updateBot(`⏳ ${data.message}`);
+          } else if (event === "token") {
+            received += data.content;
+            updateBot(received);
+          } else if (event === "done") {
+            updateBot(data.reply || received || "No response received.");
+          } else if (event === "error") {
+            updateBot("⚠️ Error communicating with the tutor.");
+          }
+          setIsLoading(false);
+        });
       }
     } catch (err) {
       console.error("Error:", err);
@@ -146,7 +264,7 @@ export function ChatWindow () {
           <span className="topic-badge">{topic}</span>
         </div>
       )}
-      <ChatMessages messages={messages} loading={isLoading} />
+      <ChatMessages messages={messages} loading={isLoading} onReachTop={loadOlder} />
       <ChatInput onSend={handleSend} disabled={!conversationId} />
     </div>
   );